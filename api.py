@@ -1,21 +1,140 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+import time
+
+# Measure cold-start time from the first import of the app module
+IMPORT_START = time.perf_counter()
+
+import asyncio
+import json
+import zipfile
+from contextlib import asynccontextmanager
+from functools import partial
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
-import numpy as np
-import io
-from ocr_reader import extract_card_info, process_image_ocr
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile as StarletteUploadFile
+import config
+import metrics
+from batching import get_batcher, start_batcher
+from cache import ImageStore, content_hash, create_result_cache
+from engine_pool import get_engine_pool, init_engine_pool
+from executor import QueueFullError, create_executor
+from insurers import get_insurer_registry
+from jobs import card_error, create_job_queue
+from ocr_reader import IMAGE_EXTENSIONS, recognize_with_pool
+from pipeline import IMAGE_OPTIONS, CardProcessingError, process_card_bytes, rebuild_card_images
+from stream import CardFusion, FrameSelector, score_frame
 from utils import (
-    encode_image_to_base64,
-    create_annotated_image,
     SUPPORTED_LANGUAGES,
+    image_media_type,
     logger
 )
 
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+def load_models(app):
+    """
+    Load and warm up the OCR engines from the bundled models.
+    Runs in a background thread so liveness probes are answered while models load.
+    In process mode every executor process loads its own engine instead.
+    """
+    start = time.perf_counter()
+    try:
+        if config.OCR_EXECUTOR == "thread":
+            init_engine_pool()
+            if config.OCR_BATCHING:
+                start_batcher(recognize_with_pool)
+        else:
+            app.state.executor.warmup()
+    except Exception as e:
+        logger.error(f"Loading OCR models failed: {str(e)}")
+        app.state.startup["error"] = str(e)
+        return
+    app.state.startup["models_seconds"] = round(time.perf_counter() - start, 3)
+    app.state.startup["total_seconds"] = round(time.perf_counter() - IMPORT_START, 3)
+    app.state.ready = True
+    logger.info(f"Ready in {app.state.startup['total_seconds']:.2f}s since import "
+                f"(imports {IMPORT_SECONDS:.2f}s, models {app.state.startup['models_seconds']:.2f}s)")
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.ready = False
+    app.state.startup = {"import_seconds": round(IMPORT_SECONDS, 3)}
+    app.state.executor = create_executor()
+    app.state.result_cache = create_result_cache()
+    app.state.image_store = ImageStore(config.IMAGE_STORE_SIZE, config.IMAGE_STORE_TTL)
+    app.state.job_queue = create_job_queue()
+    warmup = asyncio.get_running_loop().run_in_executor(None, load_models, app)
+    job_workers = [asyncio.create_task(run_embedded_worker(app)) for _ in range(config.JOB_EMBEDDED_WORKERS)]
+    try:
+        yield
+    finally:
+        for task in job_workers:
+            task.cancel()
+        await asyncio.gather(*job_workers, return_exceptions=True)
+        await warmup
+        app.state.executor.shutdown()
+
+class UploadTooLarge(Exception):
+    """Raised from the request body stream once it exceeds the upload limit."""
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies larger than a per-path limit with 413 while they stream in,
+    so an oversized upload is never buffered or spooled in full.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        too_large = JSONResponse(status_code=413, content={"error": f"Upload exceeds the limit of {limit} bytes"})
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await too_large(scope, receive, send)
+            return
+
+        state = {"received": 0, "exceeded": False, "responded": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > limit:
+                    state["exceeded"] = True
+                    raise UploadTooLarge()
+            return message
+
+        async def checked_send(message):
+            # Body parsing errors may be turned into a 400 by the framework; answer 413 instead
+            if state["exceeded"]:
+                if not state["responded"]:
+                    state["responded"] = True
+                    await too_large(scope, receive, send)
+                return
+            state["responded"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, checked_send)
+        except UploadTooLarge:
+            if not state["responded"]:
+                state["responded"] = True
+                await too_large(scope, receive, send)
+
 app = FastAPI(
     title="Health Insurance Card OCR API",
     description="API for extracting information from German, French, and Italian health insurance cards",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -27,6 +146,12 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={"/process-card/": config.MAX_UPLOAD_BYTES, "/process-cards/": config.BATCH_MAX_UPLOAD_BYTES,
+            "/jobs": config.MAX_UPLOAD_BYTES}
+)
+
 @app.get("/")
 async def root():
     return {
@@ -34,10 +159,133 @@ async def root():
         "supported_languages": SUPPORTED_LANGUAGES
     }
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the server is up and answering requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the OCR models are loaded and warmed up."""
+    if app.state.ready:
+        return {"status": "ready", "startup": app.state.startup}
+    status = "failed" if "error" in app.state.startup else "loading"
+    return JSONResponse(status_code=503, content={"status": status, "startup": app.state.startup})
+
+@app.get("/stats")
+async def stats():
+    executor = app.state.executor
+    return {
+        "startup": app.state.startup,
+        "engine_pool": get_engine_pool().stats() if executor.kind == "thread" and app.state.ready else None,
+        "executor": executor.stats(),
+        "batcher": get_batcher().stats() if get_batcher() else None,
+        "result_cache": app.state.result_cache.stats() if app.state.result_cache else None,
+        "jobs": await run_in_threadpool(app.state.job_queue.stats),
+        "insurers": get_insurer_registry().stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    executor = app.state.executor
+    executor_stats = executor.stats()
+    gauges = {
+        "ocr_executor_in_flight": ("Cards admitted to the executor.", executor_stats["in_flight"]),
+        "ocr_executor_queue_depth": ("Cards waiting for an executor worker.", executor_stats["queue_depth"]),
+        "ocr_ready": ("Whether the OCR models are loaded and warmed up.", int(app.state.ready)),
+        "ocr_startup_import_seconds": ("Time to import the app module.", app.state.startup["import_seconds"]),
+    }
+    counters = {
+        "ocr_executor_rejected_total": ("Cards rejected because the queue was full.", executor_stats["rejected"]),
+    }
+    gauges["ocr_jobs_queued"] = ("Jobs waiting for a worker.", await run_in_threadpool(app.state.job_queue.pending))
+    resident, peak_resident = metrics.process_memory()
+    gauges["process_resident_memory_bytes"] = ("Resident memory of the API process.", resident)
+    gauges["process_peak_resident_memory_bytes"] = ("Peak resident memory of the API process.", peak_resident)
+    if "models_seconds" in app.state.startup:
+        gauges["ocr_startup_models_seconds"] = ("Time to load and warm up the OCR models.", app.state.startup["models_seconds"])
+    if executor.kind == "thread" and app.state.ready:
+        pool_stats = get_engine_pool().stats()
+        gauges["ocr_engine_pool_in_use"] = ("OCR engines checked out.", pool_stats["in_use"])
+    if app.state.result_cache is not None:
+        cache_stats = app.state.result_cache.stats()
+        counters["ocr_result_cache_hits_total"] = ("Result cache hits, including disk hits.",
+                                                   cache_stats["hits"] + cache_stats["disk_hits"])
+        counters["ocr_result_cache_misses_total"] = ("Result cache misses.", cache_stats["misses"])
+    return PlainTextResponse(metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
+
+@app.get("/images/{image_id}/{kind}")
+async def get_image(image_id: str, kind: str):
+    image = app.state.image_store.get(image_id, kind)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found or expired")
+    return Response(content=image, media_type=image_media_type(image))
+
+async def process_contents(contents, filename, images="all", inline=True, timings=None):
+    """
+    Process one uploaded card: answer from the result cache if possible,
+    otherwise run the pipeline in the executor.
+    Stage timings are added to the timings dict, if given, and recorded in the metrics.
+    """
+    executor = app.state.executor
+    timings = {} if timings is None else timings
+
+    # Resubmitted cards are answered from the cache without running OCR
+    cache = app.state.result_cache
+    response_data = None
+    if cache is not None:
+        lookup_start = time.perf_counter()
+        key = content_hash(contents)
+        cached = cache.get(key)
+        timings["cache_lookup"] = time.perf_counter() - lookup_start
+        if cached is not None and (images == "none" or "lines" in cached):
+            logger.debug(f"Result cache hit for {filename}")
+            response_images = None
+            if images != "none":
+                # The images are drawn again from the upload and the cached OCR lines
+                response_images, card_metrics = await executor.submit(
+                    rebuild_card_images, contents, cached["lines"], images, inline, timings=timings
+                )
+                timings.update(card_metrics["timings"])
+            metrics.record(timings)
+            response_data = {"status": "success", "card_info": cached["card_info"],
+                             "field_confidence": cached["field_confidence"],
+                             "confidence_scores": cached["confidence_scores"],
+                             "images": response_images, "cached": True}
+
+    if response_data is None:
+        # Decode, OCR and annotate in the executor so the event loop stays responsive
+        response_data, card_metrics = await executor.submit(
+            process_card_bytes, contents, images, inline, cache is not None, timings=timings
+        )
+        timings.update(card_metrics["timings"])
+        metrics.record(timings, card_metrics["counts"], card_metrics["peak_bytes"])
+        logger.debug(f"Peak image memory for {filename}: {card_metrics['peak_bytes'] / 1e6:.1f} MB")
+
+        if cache is not None:
+            cache.put(key, {
+                "card_info": response_data["card_info"],
+                "field_confidence": response_data["field_confidence"],
+                "confidence_scores": response_data["confidence_scores"],
+                "lines": response_data.pop("lines")
+            })
+
+    if not inline and response_data["images"]:
+        image_id = app.state.image_store.put(response_data["images"])
+        response_data["images"] = {
+            kind: f"/images/{image_id}/{kind}" for kind in response_data["images"]
+        }
+    return response_data
+
 @app.post("/process-card/")
 async def process_card(
-    file: UploadFile = File(description="Health insurance card image file")
+    response: Response,
+    file: UploadFile = File(description="Health insurance card image file"),
+    images: str = Query("all", description="Images to return: all, annotated or none"),
+    inline: bool = Query(True, description="Return images inline as base64, or as URLs to fetch them from")
 ):
+    request_start = time.perf_counter()
+    timings = {}
     try:
         logger.debug(f"Received request for file processing")
         if not file:
@@ -48,73 +296,41 @@ async def process_card(
         # Validate file type
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
+
+        if images not in IMAGE_OPTIONS:
+            raise HTTPException(status_code=400, detail=f"images must be one of: {', '.join(IMAGE_OPTIONS)}")
         
         # Read the image file
+        read_start = time.perf_counter()
         contents = await file.read()
+        timings["upload_read"] = time.perf_counter() - read_start
         if not contents:
             raise HTTPException(status_code=400, detail="Empty file received")
-            
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Store original image as base64
-        original_image_base64 = encode_image_to_base64(image)
-        
-        # Process image with OCR
-        results = process_image_ocr(image)
-        
-        if not results:
-            return JSONResponse(
-                status_code=422,
-                content={"error": "No text detected in the image"}
-            )
-        
-        # Extract card information
-        card_info = extract_card_info(results)
-        
-        # Create annotated image
-        annotated = create_annotated_image(image, results)
-        annotated_image_base64 = encode_image_to_base64(annotated)
-
-        # Save images to disk
-        # try:
-        #     save_dir = 'detected_images'
-        #     if not os.path.exists(save_dir):
-        #         os.makedirs(save_dir)
-
-        #     # Save original image
-        #     original_path = os.path.join(save_dir, 'original_image.jpg')
-        #     success = cv2.imwrite(original_path, image)
-        #     logger.debug(f"Saving original image: {'Success' if success else 'Failed'} - Path: {original_path}")
-
-        #     # Save annotated image
-        #     annotated_path = os.path.join(save_dir, 'annotated_image.jpg')
-        #     success = cv2.imwrite(annotated_path, annotated)
-        #     logger.debug(f"Saving annotated image: {'Success' if success else 'Failed'} - Path: {annotated_path}")
-            
-        #     logger.info(f"Images saved to {save_dir}/ directory")
-            
-        # except Exception as save_error:
-        #     logger.error(f"Error saving images: {str(save_error)}", exc_info=True)
-            
-        # Return the extracted information with images
-        response_data = {
-            "status": "success",
-            "card_info": card_info.to_dict(),
-            "confidence_scores": {
-                result[1][0]: f"{result[1][1]:.2%}" for result in results if result[1][1] > 0.5
-            },
-            "images": {
-                "original": original_image_base64,
-                "annotated": annotated_image_base64
-            },
-        }
         
+        response_data = await process_contents(contents, file.filename, images, inline, timings)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - request_start)
+        response.headers["Server-Timing"] = metrics.server_timing(timings)
         return response_data
         
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        logger.warning("Rejecting request, OCR queue is full")
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Server is busy, please retry later"},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except CardProcessingError as e:
+        content = {"error": e.message}
+        if e.reason:
+            # Photo rejected by the quality check, the reason tells the client what to fix
+            metrics.QUALITY_REJECTIONS.inc()
+            content["reason"] = e.reason
+        return JSONResponse(
+            status_code=e.status_code,
+            content=content
+        )
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return JSONResponse(
@@ -122,6 +338,288 @@ async def process_card(
             content={"error": f"An error occurred while processing the image: {str(e)}"}
         )
 
+def iter_batch_items(files):
+    """
+    Yield (name, load, size) for every card in a batch upload, where load() returns the image bytes.
+    Zip archives are expanded; their members are only read when their turn comes.
+    """
+    for file in files:
+        if file.filename.lower().endswith('.zip') or file.content_type in ZIP_CONTENT_TYPES:
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                yield file.filename, None, 0
+                continue
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield f"{file.filename}/{member.filename}", partial(archive.read, member), member.file_size
+        else:
+            yield file.filename, file.file.read, file.size or 0
+
+async def process_batch_item(name, load, size, images):
+    """Process one card of a batch and return its NDJSON record. Errors are reported in the record."""
+    if load is None:
+        return {"file": name, "status": "error", "error": "Invalid zip archive"}
+    # Checked before reading, so an oversized zip member is never inflated into memory
+    if size > config.MAX_UPLOAD_BYTES:
+        return {"file": name, "status": "error", "error": f"File exceeds the limit of {config.MAX_UPLOAD_BYTES} bytes"}
+    try:
+        timings = {}
+        read_start = time.perf_counter()
+        contents = await run_in_threadpool(load)
+        timings["upload_read"] = time.perf_counter() - read_start
+        if not contents:
+            return {"file": name, "status": "error", "error": "Empty file received"}
+        for attempt in range(config.BATCH_MAX_RETRIES + 1):
+            try:
+                return {"file": name, **await process_contents(contents, name, images, timings=timings)}
+            except QueueFullError as e:
+                # Other traffic filled the queue; wait instead of failing the card
+                if attempt == config.BATCH_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(e.retry_after)
+    except QueueFullError:
+        return {"file": name, "status": "error", "error": "Server is busy, please retry later"}
+    except CardProcessingError as e:
+        if e.reason:
+            metrics.QUALITY_REJECTIONS.inc()
+            return {"file": name, "status": "rejected", "reason": e.reason, "error": e.message}
+        return {"file": name, "status": "error", "error": e.message}
+    except Exception as e:
+        logger.error(f"Error processing {name}: {str(e)}")
+        return {"file": name, "status": "error", "error": f"An error occurred while processing the image: {str(e)}"}
+
+async def stream_batch_results(form, files, images):
+    """
+    Run the cards of a batch through the executor and yield one NDJSON line per card as it finishes.
+    At most OCR_WORKERS cards of a batch are read and in flight at once, so memory stays flat.
+    """
+    items = iter_batch_items(files)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < app.state.executor.max_workers:
+                item = next(items, None)
+                if item is None:
+                    break
+                pending.add(asyncio.ensure_future(process_batch_item(*item, images)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result(), ensure_ascii=False) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+        await form.close()
+
+@app.post(
+    "/process-cards/",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "files": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"},
+                                "description": "Card image files, or zip archives of card images"
+                            }
+                        },
+                        "required": ["files"]
+                    }
+                }
+            }
+        }
+    }
+)
+async def process_cards(
+    request: Request,
+    images: str = Query("none", description="Images to return per card: all, annotated or none")
+):
+    if images not in IMAGE_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"images must be one of: {', '.join(IMAGE_OPTIONS)}")
+
+    # The form is parsed here rather than as a File parameter so the uploads stay open
+    # while the response streams. Starlette spools large uploads to temporary files.
+    form = await request.form(max_files=config.BATCH_MAX_FILES)
+    files = [value for value in form.getlist("files") if isinstance(value, StarletteUploadFile)]
+    if not files:
+        await form.close()
+        raise HTTPException(status_code=400, detail="No files provided")
+
+    logger.debug(f"Received batch of {len(files)} file(s)")
+    return StreamingResponse(stream_batch_results(form, files, images), media_type="application/x-ndjson")
+
+async def run_embedded_job(queue, job):
+    """Run one reserved job through the executor and store the outcome."""
+    try:
+        result = await process_contents(job.payload, f"job {job.id}", job.options.get("images", "none"))
+    except QueueFullError as e:
+        # Direct requests filled the executor; hand the job back without using up an attempt
+        await run_in_threadpool(queue.release, job, e.retry_after)
+    except CardProcessingError as e:
+        await run_in_threadpool(queue.fail, job, card_error(e), False)
+    except asyncio.CancelledError:
+        # Hand the job back off the event loop; shielded, so the release finishes even if shutdown cancels again
+        try:
+            await asyncio.shield(run_in_threadpool(queue.release, job))
+        except Exception as e:
+            logger.error(f"Cannot release job {job.id}, it is handed out again when its lease runs out: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Job {job.id} failed on attempt {job.attempts}: {str(e)}")
+        await run_in_threadpool(queue.fail, job, {"error": f"An error occurred while processing the image: {str(e)}"})
+    else:
+        await run_in_threadpool(queue.complete, job, result)
+
+async def run_embedded_worker(app):
+    """
+    Pull jobs from the queue and run them through the executor, the way worker.py does,
+    so the API can serve /jobs without separate worker processes.
+    When the queue cannot be reached the worker logs it and backs off instead of stopping;
+    a job whose outcome could not be stored is handed out again once its lease runs out.
+    """
+    queue = app.state.job_queue
+    while True:
+        try:
+            job = await run_in_threadpool(queue.reserve) if app.state.ready else None
+            if job is not None:
+                await run_embedded_job(queue, job)
+        except Exception as e:
+            logger.error(f"Cannot reach the job queue: {str(e)}")
+            await asyncio.sleep(config.JOB_POLL_INTERVAL * 10)
+            continue
+        if job is None:
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(description="Health insurance card image file"),
+    images: str = Query("none", description="Images to include in the result: all, annotated or none")
+):
+    """Queue a card for asynchronous processing. The result is fetched from GET /jobs/{id}."""
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    if images not in IMAGE_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"images must be one of: {', '.join(IMAGE_OPTIONS)}")
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file received")
+
+    queue = app.state.job_queue
+    if await run_in_threadpool(queue.pending) >= config.JOB_MAX_QUEUED:
+        logger.warning(f"Rejecting job, {config.JOB_MAX_QUEUED} jobs are already waiting")
+        return JSONResponse(status_code=503, content={"error": "Job queue is full, please retry later"})
+    job_id = await run_in_threadpool(queue.enqueue, contents, {"filename": file.filename, "images": images})
+    logger.debug(f"Queued job {job_id} for {file.filename}")
+    return {"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a job; finished jobs carry the card result or the error."""
+    job = await run_in_threadpool(app.state.job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+async def read_stream_frame(contents, frame):
+    """Run OCR on one selected stream frame. Returns the card result, or None if nothing could be read."""
+    try:
+        return await process_contents(contents, f"stream frame {frame}", images="none")
+    except QueueFullError:
+        logger.warning(f"Skipping stream frame {frame}, OCR queue is full")
+    except CardProcessingError as e:
+        if e.reason:
+            metrics.QUALITY_REJECTIONS.inc()
+        logger.debug(f"Stream frame {frame} not read: {e.message}")
+    except Exception as e:
+        logger.error(f"Error processing stream frame {frame}: {str(e)}")
+    return None
+
+@app.websocket("/stream-card")
+async def stream_card(websocket: WebSocket):
+    """
+    Read one card from a stream of camera frames. The client sends every frame as a binary message
+    and may send the text message "end" when it has no more frames. Each frame is scored for blur and
+    motion; only the sharpest frame received while OCR was busy is read next. Fields are fused across
+    the frames read, and the fused card is sent after every read ("update"). As soon as every field is
+    stable, or after STREAM_MAX_READS reads or "end", the final "result" is sent and the socket closed.
+    """
+    await websocket.accept()
+    selector = FrameSelector()
+    fusion = CardFusion()
+    received = 0
+    ended = False
+    receiving = asyncio.ensure_future(websocket.receive())
+    reading = None
+
+    def message(kind):
+        card_info, field_confidence = fusion.result()
+        return {
+            "type": kind,
+            "card_info": card_info,
+            "field_confidence": field_confidence,
+            "stable_fields": fusion.stable_fields(),
+            "frames_received": received,
+            "frames_read": fusion.frames,
+        }
+
+    try:
+        while True:
+            done, _ = await asyncio.wait([task for task in (receiving, reading) if task is not None],
+                                         return_when=asyncio.FIRST_COMPLETED)
+
+            if receiving in done:
+                incoming = receiving.result()
+                if incoming["type"] == "websocket.disconnect":
+                    logger.debug(f"Stream closed by the client after {received} frame(s)")
+                    return
+                if incoming.get("bytes"):
+                    received += 1
+                    metrics.STREAM_FRAMES.inc()
+                    contents = incoming["bytes"]
+                    # Oversized and undecodable frames are ignored like blurry ones
+                    if len(contents) <= config.MAX_UPLOAD_BYTES:
+                        score = await run_in_threadpool(score_frame, contents)
+                        if score is not None:
+                            selector.offer(contents, *score)
+                elif incoming.get("text", "").strip().lower() == "end":
+                    ended = True
+                receiving = None if ended else asyncio.ensure_future(websocket.receive())
+
+            if reading in done:
+                result = reading.result()
+                reading = None
+                if result is not None:
+                    metrics.STREAM_FRAMES_READ.inc()
+                    fusion.add(result["card_info"], result.get("field_confidence", {}))
+                    if fusion.stable() or fusion.frames >= config.STREAM_MAX_READS:
+                        break
+                    await websocket.send_json(message("update"))
+
+            if reading is None:
+                contents = selector.take()
+                if contents is not None:
+                    reading = asyncio.ensure_future(read_stream_frame(contents, received))
+                elif ended:
+                    break
+
+        response = message("result")
+        response["status"] = "success" if fusion.frames else "no_text"
+        response["stable"] = fusion.stable()
+        await websocket.send_json(response)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.debug(f"Stream closed by the client after {received} frame(s)")
+    finally:
+        for task in (receiving, reading):
+            if task is not None:
+                task.cancel()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="debug") 
@@ -0,0 +1,311 @@
+import importlib.util
+import math
+import os
+import time
+import cv2
+import numpy as np
+import config
+from ocr_lines import OcrLines
+from topology import intra_op_threads
+from utils import crop_text_region, logger
+
+BACKENDS = ("paddle", "onnxruntime", "openvino")
+
+# Pre- and post-processing settings, matching PaddleOCR's defaults for the PP-OCRv3 models
+DET_LIMIT_SIDE_LEN = 960
+DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+DET_THRESH = 0.3
+DET_BOX_THRESH = 0.6
+DET_UNCLIP_RATIO = 1.5
+DET_MAX_CANDIDATES = 1000
+DET_MIN_SIZE = 3
+CLS_IMAGE_SHAPE = (3, 48, 192)
+CLS_THRESH = 0.9
+CLS_BATCH_NUM = 6
+REC_IMAGE_SHAPE = (3, 48, 320)
+REC_BATCH_NUM = 6
+DROP_SCORE = 0.5
+
+
+class OnnxRuntimeRunner:
+    """Runs an exported .onnx model with ONNX Runtime on the CPU."""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if intra_op_threads():
+            options.intra_op_num_threads = intra_op_threads()
+        if config.OCR_INTER_OP_THREADS:
+            options.inter_op_num_threads = config.OCR_INTER_OP_THREADS
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self._session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self._session.run(None, {self._input_name: batch})[0]
+
+
+class OpenVinoRunner:
+    """Runs an exported .onnx (or Paddle .pdmodel) model with OpenVINO on the CPU."""
+
+    def __init__(self, path):
+        import openvino as ov
+
+        properties = {}
+        if intra_op_threads():
+            properties["INFERENCE_NUM_THREADS"] = intra_op_threads()
+        if config.OCR_INTER_OP_THREADS:
+            properties["NUM_STREAMS"] = config.OCR_INTER_OP_THREADS
+        core = ov.Core()
+        self._model = core.compile_model(core.read_model(path), "CPU", properties)
+
+    def __call__(self, batch):
+        return self._model(batch)[0]
+
+
+RUNNERS = {"onnxruntime": OnnxRuntimeRunner, "openvino": OpenVinoRunner}
+
+
+def exported_model_path(model_dir, backend, precision="fp32"):
+    """
+    Find the exported model file in a bundled model directory.
+    ONNX Runtime needs inference.onnx (export it with paddle2onnx); OpenVINO can also read
+    the Paddle inference.pdmodel directly. INT8 models are inference.int8.onnx, as written by
+    benchmarks/quantize_models.py. Returns None if there is no usable file.
+    """
+    if precision == "int8":
+        names = ('inference.int8.onnx',)
+    elif backend == "openvino":
+        names = ('inference.onnx', 'inference.pdmodel')
+    else:
+        names = ('inference.onnx',)
+    for name in names:
+        path = os.path.join(model_dir, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_character_dict(rec_model_dir):
+    """
+    Return the recognizer's CTC character list: blank, the dictionary characters, then space.
+    The dictionary is OCR_REC_CHAR_DICT, a latin_dict.txt next to the model, or PaddleOCR's copy.
+    """
+    path = config.OCR_REC_CHAR_DICT or os.path.join(rec_model_dir, 'latin_dict.txt')
+    if not os.path.isfile(path):
+        spec = importlib.util.find_spec('paddleocr')
+        if spec is not None and spec.origin:
+            path = os.path.join(os.path.dirname(spec.origin), 'ppocr', 'utils', 'dict', 'latin_dict.txt')
+    if not os.path.isfile(path):
+        raise FileNotFoundError("No recognizer character dictionary found, set OCR_REC_CHAR_DICT")
+    with open(path, 'rb') as f:
+        characters = [line.decode('utf-8').strip('\n').strip('\r\n') for line in f]
+    return ['blank'] + characters + [' ']
+
+
+def _normalize_crop(crop, image_shape, target_width):
+    """Resize a text crop to the model height keeping its aspect ratio, scale to [-1, 1] and right-pad."""
+    channels, height, _ = image_shape
+    h, w = crop.shape[:2]
+    resized_w = min(target_width, int(math.ceil(height * w / float(h))))
+    resized = cv2.resize(crop, (resized_w, height)).astype(np.float32)
+    resized = (resized.transpose((2, 0, 1)) / 255 - 0.5) / 0.5
+    padded = np.zeros((channels, height, target_width), dtype=np.float32)
+    padded[:, :, :resized_w] = resized
+    return padded
+
+
+def _mini_box(points):
+    """Return the minimum-area rectangle around points as (4x2 corners from top-left clockwise, shorter side)."""
+    rect = cv2.minAreaRect(points)
+    corners = sorted(cv2.boxPoints(rect).tolist(), key=lambda p: p[0])
+    left = sorted(corners[:2], key=lambda p: p[1])
+    right = sorted(corners[2:], key=lambda p: p[1])
+    box = np.array([left[0], right[0], right[1], left[1]], dtype=np.float32)
+    return box, min(rect[1])
+
+
+class DBTextDetector:
+    """DB text detector: resize and normalize, run the model, turn the probability map into boxes."""
+
+    def __init__(self, runner):
+        self._runner = runner
+
+    def preprocess(self, image):
+        """Return the model input for a BGR image."""
+        h, w = image.shape[:2]
+        ratio = min(1.0, DET_LIMIT_SIDE_LEN / max(h, w))
+        resize_h = max(int(round(h * ratio / 32) * 32), 32)
+        resize_w = max(int(round(w * ratio / 32) * 32), 32)
+        resized = cv2.resize(image, (resize_w, resize_h)).astype(np.float32)
+        normalized = (resized / 255 - DET_MEAN) / DET_STD
+        return normalized.transpose((2, 0, 1))[np.newaxis]
+
+    @staticmethod
+    def _box_score(prob_map, box):
+        """Mean probability inside the box, computed over the box's bounding rectangle only."""
+        h, w = prob_map.shape
+        x_min = int(np.clip(np.floor(box[:, 0].min()), 0, w - 1))
+        x_max = int(np.clip(np.ceil(box[:, 0].max()), 0, w - 1))
+        y_min = int(np.clip(np.floor(box[:, 1].min()), 0, h - 1))
+        y_max = int(np.clip(np.ceil(box[:, 1].max()), 0, h - 1))
+        mask = np.zeros((y_max - y_min + 1, x_max - x_min + 1), dtype=np.uint8)
+        cv2.fillPoly(mask, (box - [x_min, y_min]).astype(np.int32)[np.newaxis], 1)
+        return cv2.mean(prob_map[y_min:y_max + 1, x_min:x_max + 1], mask)[0]
+
+    def _boxes_from_map(self, prob_map, dest_width, dest_height):
+        height, width = prob_map.shape
+        bitmap = (prob_map > DET_THRESH).astype(np.uint8) * 255
+        contours, _ = cv2.findContours(bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        for contour in contours[:DET_MAX_CANDIDATES]:
+            box, short_side = _mini_box(contour)
+            if short_side < DET_MIN_SIZE:
+                continue
+            if self._box_score(prob_map, box) < DET_BOX_THRESH:
+                continue
+            # Grow the shrunk text kernel back to the full text line. The rounded polygon offset
+            # PaddleOCR uses has the same minimum-area rectangle as growing each side by the distance.
+            rect = cv2.minAreaRect(box)
+            (rect_w, rect_h) = rect[1]
+            distance = rect_w * rect_h * DET_UNCLIP_RATIO / (2 * (rect_w + rect_h))
+            grown = cv2.boxPoints((rect[0], (rect_w + 2 * distance, rect_h + 2 * distance), rect[2]))
+            box, short_side = _mini_box(grown)
+            if short_side < DET_MIN_SIZE + 2:
+                continue
+            box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0, dest_width)
+            box[:, 1] = np.clip(np.round(box[:, 1] / height * dest_height), 0, dest_height)
+            boxes.append(box)
+        return boxes
+
+    def __call__(self, image):
+        start = time.time()
+        h, w = image.shape[:2]
+        prob_map = self._runner(self.preprocess(image))[0, 0]
+        boxes = []
+        for box in self._boxes_from_map(prob_map, w, h):
+            box[:, 0] = np.clip(box[:, 0], 0, w - 1)
+            box[:, 1] = np.clip(box[:, 1], 0, h - 1)
+            box_w = int(np.linalg.norm(box[0] - box[1]))
+            box_h = int(np.linalg.norm(box[0] - box[3]))
+            if box_w > 3 and box_h > 3:
+                boxes.append(box)
+        return np.array(boxes), time.time() - start
+
+
+class AngleClassifier:
+    """Text direction classifier: turns crops that read upside down by 180 degrees."""
+
+    def __init__(self, runner):
+        self._runner = runner
+        self.cls_thresh = CLS_THRESH
+
+    def __call__(self, crops):
+        start = time.time()
+        crops = list(crops)
+        results = [('', 0.0)] * len(crops)
+        order = np.argsort([crop.shape[1] / float(crop.shape[0]) for crop in crops])
+        for begin in range(0, len(crops), CLS_BATCH_NUM):
+            indices = order[begin:begin + CLS_BATCH_NUM]
+            batch = np.stack([_normalize_crop(crops[i], CLS_IMAGE_SHAPE, CLS_IMAGE_SHAPE[2]) for i in indices])
+            probs = self._runner(batch)
+            for i, prob in zip(indices, probs):
+                label = '180' if prob.argmax() == 1 else '0'
+                results[i] = (label, float(prob.max()))
+                if label == '180' and prob.max() > self.cls_thresh:
+                    crops[i] = cv2.rotate(crops[i], cv2.ROTATE_180)
+        return crops, results, time.time() - start
+
+
+class CTCTextRecognizer:
+    """CRNN/SVTR text recognizer with greedy CTC decoding. Returns a list of (text, confidence)."""
+
+    def __init__(self, runner, characters, batch_num=REC_BATCH_NUM):
+        self._runner = runner
+        self._characters = np.array(characters, dtype=object)
+        self._batch_num = batch_num
+
+    def _decode(self, preds):
+        indices = preds.argmax(axis=2)
+        probs = preds.max(axis=2)
+        texts = []
+        for idx, prob in zip(indices, probs):
+            keep = idx != 0
+            keep[1:] &= idx[1:] != idx[:-1]
+            text = "".join(self._characters[idx[keep]])
+            texts.append((text, float(prob[keep].mean()) if keep.any() else 0.0))
+        return texts
+
+    @staticmethod
+    def preprocess(crops):
+        """Return the model input for a batch of crops, padded to the widest crop."""
+        _, height, width = REC_IMAGE_SHAPE
+        max_ratio = max([width / height] + [crop.shape[1] / float(crop.shape[0]) for crop in crops])
+        target_width = int(height * max_ratio)
+        return np.stack([_normalize_crop(crop, REC_IMAGE_SHAPE, target_width) for crop in crops])
+
+    def __call__(self, crops):
+        start = time.time()
+        results = [('', 0.0)] * len(crops)
+        order = np.argsort([crop.shape[1] / float(crop.shape[0]) for crop in crops])
+        for begin in range(0, len(crops), self._batch_num):
+            indices = order[begin:begin + self._batch_num]
+            batch = self.preprocess([crops[i] for i in indices])
+            for i, result in zip(indices, self._decode(self._runner(batch))):
+                results[i] = result
+        return results, time.time() - start
+
+
+class ExportedModelEngine:
+    """
+    An OCR engine running the bundled models exported for ONNX Runtime or OpenVINO.
+    It exposes the same text_detector, text_classifier, text_recognizer and ocr interface
+    as PaddleOCR, so the rest of the pipeline does not depend on the backend.
+    Args:
+        precision: "fp32" or "int8" for the detector and recognizer (default: OCR_PRECISION);
+            the angle classifier always runs in fp32
+        det_model_dir, rec_model_dir: override the bundled model directories
+    """
+
+    def __init__(self, backend, use_angle_cls=True, rec_batch_num=REC_BATCH_NUM, precision=None,
+                 det_model_dir=None, rec_model_dir=None):
+        if backend not in RUNNERS:
+            raise ValueError(f"Unknown OCR backend: {backend!r}")
+        runner = RUNNERS[backend]
+        self.backend = backend
+        self.precision = precision or config.OCR_PRECISION
+        self.drop_score = DROP_SCORE
+
+        det_model_dir = det_model_dir or config.OCR_DET_MODEL_DIR
+        rec_model_dir = rec_model_dir or config.OCR_REC_MODEL_DIR
+        det_path = exported_model_path(det_model_dir, backend, self.precision)
+        rec_path = exported_model_path(rec_model_dir, backend, self.precision)
+        for name, path, model_dir in (("detection", det_path, det_model_dir),
+                                      ("recognition", rec_path, rec_model_dir)):
+            if path is None:
+                raise FileNotFoundError(f"No exported {self.precision} {name} model for {backend} in {model_dir!r}")
+        self.text_detector = DBTextDetector(runner(det_path))
+        self.text_recognizer = CTCTextRecognizer(runner(rec_path), load_character_dict(rec_model_dir),
+                                                 batch_num=rec_batch_num)
+
+        self.text_classifier = None
+        if use_angle_cls:
+            cls_path = exported_model_path(config.OCR_CLS_MODEL_DIR, backend)
+            if cls_path is not None:
+                self.text_classifier = AngleClassifier(runner(cls_path))
+            else:
+                logger.warning(f"No exported angle classifier for {backend} in {config.OCR_CLS_MODEL_DIR!r}, skipping it")
+
+    def ocr(self, image, cls=True):
+        """Detect, classify and recognize text in a BGR image, in PaddleOCR's result format."""
+        dt_boxes, _ = self.text_detector(image)
+        if len(dt_boxes) == 0:
+            return [None]
+        crops = [crop_text_region(image, box) for box in dt_boxes]
+        if cls and self.text_classifier is not None:
+            crops, _, _ = self.text_classifier(crops)
+        rec_res, _ = self.text_recognizer(crops)
+        return [OcrLines.from_recognition(dt_boxes, rec_res).above(self.drop_score).to_results()]
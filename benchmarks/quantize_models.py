@@ -0,0 +1,200 @@
+"""
+Produce INT8 versions of the exported detection and recognition models, and only promote them
+if field accuracy holds up.
+
+    python benchmarks/quantize_models.py [--corpus DIR] [--count 50] [--calibration-count 40] [--max-drop 0.01]
+
+1. Calibrate: collect detector and recognizer inputs from calibration cards with the fp32 models.
+2. Quantize both models with ONNX Runtime static (QDQ) post-training quantization.
+3. Evaluate: compare field-level accuracy of extract_card_info between fp32 and int8 on the
+   evaluation corpus (--corpus: a directory with truth.jsonl as written by synthetic.py,
+   default: generated cards).
+4. Promote: write inference.int8.onnx next to the fp32 models only if the mean field accuracy
+   drops by at most --max-drop (default OCR_INT8_MAX_ACCURACY_DROP). Exits with status 1 otherwise.
+
+Serve the promoted models with OCR_BACKEND=onnxruntime (or openvino) and OCR_PRECISION=int8.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+import config
+from backends import ExportedModelEngine, exported_model_path
+from ocr_lines import OcrLines
+from ocr_reader import classify_crops, detect_text_boxes, extract_card_info, logger, recognize_crops
+from run_benchmarks import ACCURACY_FIELDS, git_commit, load_truth
+from synthetic import write_corpus
+from utils import crop_text_region, enhance_image, normalize_card
+
+MODELS = (("det", config.OCR_DET_MODEL_DIR), ("rec", config.OCR_REC_MODEL_DIR))
+CALIBRATION_SEED = 100000  # Far from the evaluation seeds, so the two sets do not overlap
+
+
+class ModelInputReader(CalibrationDataReader):
+    """Feeds recorded model inputs to the calibrator one at a time."""
+
+    def __init__(self, input_name, inputs):
+        self._input_name = input_name
+        self._inputs = iter(inputs)
+
+    def get_next(self):
+        batch = next(self._inputs, None)
+        return None if batch is None else {self._input_name: batch}
+
+
+def prepare_image(image):
+    """Prepare a card photo the way process_image_ocr does before detection."""
+    card, _, _ = normalize_card(image, config.CARD_WIDTH)
+    return cv2.cvtColor(enhance_image(card), cv2.COLOR_GRAY2BGR)
+
+
+def read_lines(engine, image):
+    """Run the OCR stages with one engine. Returns OcrLines in reading order."""
+    boxes = detect_text_boxes(engine, image)
+    crops = classify_crops(engine, [crop_text_region(image, box) for box in boxes])
+    return OcrLines.from_recognition(boxes, recognize_crops(engine, crops)).above(engine.drop_score)
+
+
+def load_corpus(directory):
+    """Return (prepared images, ground truth) for a corpus directory."""
+    records = load_truth(directory)
+    images = [prepare_image(cv2.imread(record["path"])) for record in records]
+    return images, [record["truth"] for record in records]
+
+
+def calibration_inputs(engine, images):
+    """Record the detector input of every card and the recognizer input of every detected line."""
+    det_inputs, rec_inputs = [], []
+    for image in images:
+        det_inputs.append(engine.text_detector.preprocess(image))
+        boxes = detect_text_boxes(engine, image)
+        crops = classify_crops(engine, [crop_text_region(image, box) for box in boxes])
+        rec_inputs.extend(engine.text_recognizer.preprocess([crop]) for crop in crops)
+    return {"det": det_inputs, "rec": rec_inputs}
+
+
+def quantize_model(fp32_path, int8_path, inputs, method):
+    """Statically quantize one model to INT8 (per-channel weights, QDQ format)."""
+    prepared_path = int8_path + ".prepared.onnx"
+    quant_pre_process(fp32_path, prepared_path)
+    input_name = onnx.load(prepared_path).graph.input[0].name
+    quantize_static(
+        prepared_path, int8_path, ModelInputReader(input_name, inputs),
+        quant_format=QuantFormat.QDQ, per_channel=True,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod[method],
+    )
+    os.remove(prepared_path)
+
+
+def evaluate(engine, images, truths):
+    """Return the mean field accuracy, per-field accuracy and seconds per card of one engine."""
+    correct = {field: 0 for field in ACCURACY_FIELDS}
+    start = time.perf_counter()
+    for image, truth in zip(images, truths):
+        card_info = extract_card_info(read_lines(engine, image)).to_dict()
+        for field in ACCURACY_FIELDS:
+            correct[field] += card_info[field] == truth[field]
+    seconds = (time.perf_counter() - start) / len(images)
+    per_field = {field: count / len(images) for field, count in correct.items()}
+    return sum(per_field.values()) / len(per_field), per_field, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("onnxruntime", "openvino"), default="onnxruntime",
+                        help="Backend used to evaluate both precisions")
+    parser.add_argument("--corpus", default=None, help="Evaluation corpus directory with truth.jsonl")
+    parser.add_argument("--count", type=int, default=50, help="Cards to generate when no corpus is given")
+    parser.add_argument("--calibration-count", type=int, default=40, help="Synthetic cards used for calibration")
+    parser.add_argument("--method", choices=("MinMax", "Entropy", "Percentile"), default="MinMax",
+                        help="Calibration method")
+    parser.add_argument("--max-drop", type=float, default=config.OCR_INT8_MAX_ACCURACY_DROP,
+                        help="Largest accepted drop in mean field accuracy")
+    parser.add_argument("--dry-run", action="store_true", help="Evaluate without promoting the int8 models")
+    args = parser.parse_args()
+
+    # Quantization starts from the fp32 ONNX models exported with paddle2onnx
+    fp32_paths = {name: exported_model_path(model_dir, "onnxruntime") for name, model_dir in MODELS}
+    missing = [model_dir for name, model_dir in MODELS if fp32_paths[name] is None]
+    if missing:
+        print(f"No exported inference.onnx in {', '.join(missing)}. Export the models to ONNX with paddle2onnx "
+              f"first (see Inference backends in the README), then run this again.")
+        sys.exit(1)
+
+    # Keep debug logging out of the measurements
+    logger.setLevel(logging.WARNING)
+    fp32 = ExportedModelEngine(args.backend, precision="fp32")
+    work_dir = tempfile.mkdtemp(prefix="quantize_")
+    try:
+        print(f"Calibrating on {args.calibration_count} cards...")
+        calibration_dir = os.path.join(work_dir, "calibration")
+        write_corpus(calibration_dir, args.calibration_count, seed=CALIBRATION_SEED, noise=6.0, rotation=4.0)
+        inputs = calibration_inputs(fp32, load_corpus(calibration_dir)[0])
+
+        staged = {}
+        for name, model_dir in MODELS:
+            print(f"Quantizing {name} model ({len(inputs[name])} calibration inputs)...")
+            staged[name] = os.path.join(work_dir, name)
+            os.makedirs(staged[name])
+            quantize_model(fp32_paths[name], os.path.join(staged[name], "inference.int8.onnx"), inputs[name], args.method)
+        int8 = ExportedModelEngine(args.backend, precision="int8",
+                                   det_model_dir=staged["det"], rec_model_dir=staged["rec"])
+
+        corpus_dir = args.corpus
+        if corpus_dir is None:
+            corpus_dir = os.path.join(work_dir, "evaluation")
+            write_corpus(corpus_dir, args.count, seed=0, noise=6.0, rotation=4.0)
+        images, truths = load_corpus(corpus_dir)
+        print(f"Evaluating on {len(images)} cards...")
+        fp32_accuracy, fp32_fields, fp32_seconds = evaluate(fp32, images, truths)
+        int8_accuracy, int8_fields, int8_seconds = evaluate(int8, images, truths)
+
+        for field in ACCURACY_FIELDS:
+            print(f"  {field:18s} fp32 {fp32_fields[field]:7.2%}  int8 {int8_fields[field]:7.2%}")
+        print(f"fp32: {fp32_accuracy:.2%} field accuracy, {fp32_seconds * 1000:.1f} ms/card")
+        print(f"int8: {int8_accuracy:.2%} field accuracy, {int8_seconds * 1000:.1f} ms/card "
+              f"({fp32_seconds / int8_seconds:.2f}x)")
+
+        drop = fp32_accuracy - int8_accuracy
+        if drop > args.max_drop:
+            print(f"REJECTED: int8 loses {drop:.2%} field accuracy, more than the allowed {args.max_drop:.2%}")
+            sys.exit(1)
+        if args.dry_run:
+            print(f"OK: int8 accuracy drop {drop:.2%} is within {args.max_drop:.2%} (dry run, not promoted)")
+            return
+
+        for name, model_dir in MODELS:
+            shutil.copyfile(os.path.join(staged[name], "inference.int8.onnx"),
+                            os.path.join(model_dir, "inference.int8.onnx"))
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "backend": args.backend,
+            "calibration_cards": args.calibration_count,
+            "method": args.method,
+            "evaluation_cards": len(images),
+            "fp32": {"accuracy": fp32_accuracy, "fields": fp32_fields, "ms_per_card": fp32_seconds * 1000},
+            "int8": {"accuracy": int8_accuracy, "fields": int8_fields, "ms_per_card": int8_seconds * 1000},
+        }
+        with open(os.path.join(os.path.dirname(config.OCR_REC_MODEL_DIR), "int8_report.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"PROMOTED: int8 accuracy drop {drop:.2%} is within {args.max_drop:.2%}; "
+              f"serve with OCR_PRECISION=int8")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
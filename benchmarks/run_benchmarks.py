@@ -0,0 +1,308 @@
+"""
+Reproducible end-to-end benchmarks on synthetic cards. Runs on CPU without network access
+once the OCR models are available locally.
+
+    python benchmarks/run_benchmarks.py [latency|throughput|http|accuracy|startup|all] [options]
+
+  latency     process_image_ocr latency per card, with per-stage means
+  throughput  process_images (batch CLI) cards/s for each --workers count
+  http        /process-card/ latency and throughput at --concurrency against --url
+  accuracy    per-field exact-match accuracy of read_card against the generator's ground truth
+  startup     cold start of a fresh API server: time until /healthz and /readyz answer
+
+Every run appends one JSON record (git commit, settings, host, results) to --output,
+so runs can be compared across commits.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep every benchmark on the CPU
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+import config
+import metrics
+from engine_pool import init_engine_pool
+from ocr_reader import logger, process_image_ocr, process_images, process_single_image
+from synthetic import write_corpus
+from topology import resolve_topology
+
+BENCHMARKS = ("latency", "throughput", "http", "accuracy", "startup")
+ACCURACY_FIELDS = ("surname", "first_name", "birth_date", "personal_number", "insurance_code",
+                   "insurance_name", "card_number", "expiry_date", "detected_language")
+
+
+def percentiles(samples):
+    """Summarize latencies in seconds as milliseconds."""
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def load_truth(directory):
+    with open(os.path.join(directory, "truth.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def bench_latency(corpus, warmup=2):
+    """Time process_image_ocr on each card, after a few warm-up runs."""
+    init_engine_pool(size=1)
+    images = [cv2.imread(record["path"]) for record in corpus]
+    for image in images[:warmup]:
+        process_image_ocr(image)
+
+    samples = []
+    stage_totals = {}
+    for image in images:
+        metrics.start_collection()
+        start = time.perf_counter()
+        process_image_ocr(image)
+        samples.append(time.perf_counter() - start)
+        for name, seconds in metrics.collected()["timings"].items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+
+    result = percentiles(samples)
+    result["stages_mean_ms"] = {name: round(total / len(images) * 1000, 2) for name, total in stage_totals.items()}
+    return result
+
+
+def bench_throughput(directory, workers_list):
+    """Run the batch CLI over the corpus once per worker count."""
+    image_count = len(load_truth(directory))
+    results = []
+    for workers in workers_list:
+        output_dir = tempfile.mkdtemp(prefix="bench_batch_")
+        try:
+            start = time.perf_counter()
+            process_images(directory, output_path=os.path.join(output_dir, "results.jsonl"), workers=workers)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        results.append({
+            "workers": workers,
+            "threads": resolve_topology(workers)[1],
+            "seconds": round(elapsed, 3),
+            "cards_per_second": round(image_count / elapsed, 3),
+        })
+    return results
+
+
+def encode_multipart(path):
+    """Build a multipart/form-data body with a single "file" field."""
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as f:
+        contents = f.read()
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(path)}"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + contents + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def post_card(url, path, timeout):
+    """Send one card and return (status code, seconds)."""
+    body, content_type = encode_multipart(path)
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def bench_http(corpus, base_url, concurrency, timeout=60.0):
+    """
+    Post every card of the corpus to /process-card/ from concurrency client threads.
+    Each card is distinct, so the result cache does not short-circuit the OCR.
+    """
+    url = base_url.rstrip("/") + "/process-card/?images=none"
+    paths = [record["path"] for record in corpus]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(lambda path: post_card(url, path, timeout), paths))
+    elapsed = time.perf_counter() - start
+
+    status_counts = {}
+    for status, _ in responses:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    ok = [seconds for status, seconds in responses if status == 200]
+    result = {
+        "concurrency": concurrency,
+        "requests": len(paths),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(ok) / elapsed, 3),
+        "status_counts": status_counts,
+    }
+    if ok:
+        result["latency"] = percentiles(ok)
+    return result
+
+
+def bench_accuracy(corpus):
+    """Compare the fields read from each card with the ground truth."""
+    init_engine_pool(size=1)
+    correct = {field: 0 for field in ACCURACY_FIELDS}
+    cards_correct = 0
+    failures = 0
+    for record in corpus:
+        result = process_single_image(record["path"])
+        card_info = result.get("card_info")
+        if card_info is None:
+            failures += 1
+            continue
+        all_correct = True
+        for field in ACCURACY_FIELDS:
+            if card_info.get(field) == record["truth"][field]:
+                correct[field] += 1
+            else:
+                all_correct = False
+        cards_correct += all_correct
+
+    total = len(corpus)
+    return {
+        "cards": total,
+        "failed": failures,
+        "card_accuracy": round(cards_correct / total, 4),
+        "field_accuracy": {field: round(count / total, 4) for field, count in correct.items()},
+    }
+
+
+def wait_for(url, deadline):
+    """Poll url until it answers 200. Returns the response body, or None on timeout."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return json.loads(response.read())
+        except OSError:
+            time.sleep(0.05)
+    return None
+
+
+def bench_startup(port=8790, timeout=300.0):
+    """Start a fresh API server and time how long it takes to become live and ready."""
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + timeout
+        live = wait_for(base_url + "/healthz", deadline)
+        live_seconds = time.perf_counter() - start
+        ready = wait_for(base_url + "/readyz", deadline)
+        ready_seconds = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "live_seconds": round(live_seconds, 3) if live is not None else None,
+        "ready_seconds": round(ready_seconds, 3) if ready is not None else None,
+        "reported": ready["startup"] if ready is not None else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def settings_snapshot():
+    """The configuration values that affect the measurements."""
+    return {name: getattr(config, name) for name in dir(config)
+            if name.isupper() and name.startswith(("OCR_", "CARD_", "RESULT_CACHE_"))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", nargs="?", choices=BENCHMARKS + ("all",), default="all")
+    parser.add_argument("--count", type=int, default=30, help="Synthetic cards to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=6.0, help="Gaussian noise standard deviation")
+    parser.add_argument("--rotation", type=float, default=4.0, help="Maximum rotation in degrees")
+    parser.add_argument("--scale", type=float, default=1.0, help="Resolution factor")
+    parser.add_argument("--corpus", default=None, help="Reuse or keep the generated corpus in this directory")
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts for the throughput benchmark")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Running API server for the http benchmark")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads for the http benchmark")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.jsonl"),
+                        help="JSONL file the run record is appended to")
+    args = parser.parse_args()
+
+    # Keep debug logging out of the measurements
+    logger.setLevel(logging.WARNING)
+    selected = BENCHMARKS if args.benchmark == "all" else (args.benchmark,)
+    corpus_options = {"count": args.count, "seed": args.seed, "noise": args.noise,
+                      "rotation": args.rotation, "scale": args.scale}
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="bench_cards_")
+    try:
+        if not os.path.exists(os.path.join(corpus_dir, "truth.jsonl")):
+            write_corpus(corpus_dir, args.count, seed=args.seed, noise=args.noise,
+                         rotation=args.rotation, scale=args.scale)
+        corpus = load_truth(corpus_dir)
+
+        results = {}
+        for name in selected:
+            print(f"Running {name} benchmark on {len(corpus)} cards...")
+            if name == "latency":
+                results[name] = bench_latency(corpus)
+            elif name == "throughput":
+                workers = [int(n) for n in args.workers.split(",")]
+                results[name] = bench_throughput(corpus_dir, workers)
+            elif name == "http":
+                results[name] = bench_http(corpus, args.url, args.concurrency)
+            elif name == "accuracy":
+                results[name] = bench_accuracy(corpus)
+            elif name == "startup":
+                results[name] = bench_startup()
+            print(json.dumps(results[name], indent=2))
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "corpus": corpus_options,
+        "settings": settings_snapshot(),
+        "results": results,
+    }
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
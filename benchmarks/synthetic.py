@@ -0,0 +1,194 @@
+"""
+Render synthetic EHIC health insurance cards with known field values.
+
+    python benchmarks/synthetic.py OUT_DIR [--count 50] [--seed 0] [--noise 8] [--rotation 5] [--scale 1.0]
+
+Writes OUT_DIR/card_XXXX.jpg and OUT_DIR/truth.jsonl (one ground-truth record per image).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import CARD_ASPECT_RATIO, FIELD_LABELS, SUPPORTED_LANGUAGES, load_font
+
+EMERGENCY_TEXTS = {
+    'de': "Medizinischer Notfall im Ausland (24h)",
+    'fr': "Urgence médicale à l'étranger (24h)",
+    'it': "Emergenza medica all'estero (24h)",
+}
+CARD_TITLES = {
+    'de': "EUROPÄISCHE KRANKENVERSICHERUNGSKARTE",
+    'fr': "CARTE EUROPÉENNE D'ASSURANCE MALADIE",
+    'it': "TESSERA EUROPEA DI ASSICURAZIONE MALATTIA",
+}
+SURNAMES = ["MUSTERMANN", "MEIER", "ROSSI", "DUPONT", "MÜLLER", "BIANCHI", "FAVRE", "KELLER", "GERBER", "MOREL",
+            "SCHNEIDER", "FONTANA", "BERNASCONI", "ROCHAT", "BRUNNER"]
+FIRST_NAMES = ["MAX", "ANNA", "LUCA", "MARIE", "HANS PETER", "GIULIA", "JEAN", "SOPHIE", "MARCO", "ELENA",
+               "URS", "CHIARA", "LAURENT", "NINA", "RETO"]
+INSURERS = [("0032", "Aquilana"), ("0008", "CSS"), ("0290", "Concordia"), ("1360", "Helsana"),
+            ("1509", "Sanitas"), ("1555", "Visana"), ("1560", "Atupri"), ("1542", "Assura")]
+
+# Label of each rendered field, taken from FIELD_LABELS
+REGION_LABEL_KEYS = {'insurance_code': 'insurance_provider_id'}
+
+# Layout of the Swiss EHIC, measured on detected_images/original_image.jpg, as fractions of the card
+# width and height. It is deliberately kept apart from utils.FIELD_REGIONS, the layout the reader
+# expects, so that a wrong reader layout shows up in the benchmarks instead of being drawn to match.
+TITLE_BAND = (0.015, 0.085)  # White title on the blue card
+STRIPE = (0.085, 0.315)  # Black stripe
+EMERGENCY_BLOCK = (0.335, 0.505)  # Emergency number, printed from x = 0.22
+# Field rows: (label top, value box top, value box bottom, left field, right field).
+# Labels are printed in white above the white value boxes; right fields are right-aligned.
+FIELD_ROWS = [
+    (0.517, 0.555, 0.624, 'surname', None),
+    (0.634, 0.670, 0.742, 'first_name', 'birth_date'),
+    (0.748, 0.785, 0.856, 'personal_number', 'insurance_code'),
+    (0.864, 0.902, 0.972, 'card_number', 'expiry_date'),
+]
+BOX_LEFT, BOX_RIGHT = 0.036, 0.970  # Value boxes, and the outer edges of the labels
+VALUE_LEFT, VALUE_RIGHT = 0.047, 0.961  # Values within their box
+LABEL_HEIGHT = 0.026  # Font sizes, as fractions of the card height
+VALUE_HEIGHT = 0.036
+
+
+def random_card_data(rng, lang=None):
+    """Draw random field values for one card. Returns a dict in the HealthCardInfo layout."""
+    lang = lang or rng.choice(SUPPORTED_LANGUAGES)
+    code, name = rng.choice(INSURERS)
+    ahv = "756" + "".join(str(rng.randint(0, 9)) for _ in range(10))
+    return {
+        "insurance_number": "",
+        "surname": rng.choice(SURNAMES),
+        "first_name": rng.choice(FIRST_NAMES),
+        "birth_date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1940, 2015)}",
+        "personal_number": f"{ahv[:3]}.{ahv[3:7]}.{ahv[7:11]}.{ahv[11:]}",
+        "insurance_code": code,
+        "insurance_name": name,
+        "card_number": "80756" + code + "".join(str(rng.randint(0, 9)) for _ in range(11)),
+        "expiry_date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2030, 2040)}",
+        "detected_language": lang,
+    }
+
+
+def render_card(data, width=1000):
+    """Render a clean, upright card of the given width, laid out like the real card. Returns a BGR image."""
+    height = int(round(width / CARD_ASPECT_RATIO))
+    card = Image.new('RGB', (width, height), (150, 166, 196))
+    draw = ImageDraw.Draw(card)
+    title_font = load_font(int(0.045 * height))
+    label_font = load_font(int(LABEL_HEIGHT * height))
+    value_font = load_font(int(VALUE_HEIGHT * height))
+    white, black = (255, 255, 255), (10, 10, 10)
+    lang = data["detected_language"]
+
+    def text(x, y, value, font, fill, right=False, middle=False):
+        """Draw text at (x, y) fractions: its left or right edge at x, its top (or middle) at y."""
+        left, top, right_edge, bottom = draw.textbbox((0, 0), value, font=font)
+        px = x * width - (right_edge if right else left)
+        py = y * height - (top + bottom) / 2 if middle else y * height - top
+        draw.text((px, py), value, font=font, fill=fill)
+
+    title_width = draw.textlength(CARD_TITLES[lang], font=title_font) / width
+    text((1 - title_width) / 2, (TITLE_BAND[0] + TITLE_BAND[1]) / 2, CARD_TITLES[lang], title_font, white, middle=True)
+    draw.rectangle([0, STRIPE[0] * height, width, STRIPE[1] * height], fill=(0, 0, 0))
+    draw.rectangle([0.2 * width, EMERGENCY_BLOCK[0] * height, 0.8 * width, EMERGENCY_BLOCK[1] * height],
+                   fill=(196, 206, 224))
+    text(0.22, 0.37, EMERGENCY_TEXTS[lang], label_font, black)
+    text(0.22, 0.43, "+41 41 480 44 22", label_font, black)
+
+    values = dict(data)
+    values["insurance_code"] = f"{data['insurance_code']} - {data['insurance_name']}"
+    for label_top, box_top, box_bottom, left_field, right_field in FIELD_ROWS:
+        draw.rectangle([BOX_LEFT * width, box_top * height, BOX_RIGHT * width, box_bottom * height], fill=white)
+        middle = (box_top + box_bottom) / 2
+        for field, right in ((left_field, False), (right_field, True)):
+            if field is None:
+                continue
+            label = FIELD_LABELS[REGION_LABEL_KEYS.get(field, field)][lang][0]
+            text(BOX_RIGHT if right else BOX_LEFT, label_top, label, label_font, white, right=right)
+            text(VALUE_RIGHT if right else VALUE_LEFT, middle, values[field], value_font, black, right=right,
+                 middle=True)
+
+    return cv2.cvtColor(np.array(card), cv2.COLOR_RGB2BGR)
+
+
+def degrade(card, rng, noise=0.0, rotation=0.0, scale=1.0, background=True):
+    """
+    Turn a clean card into a photo-like image.
+    Args:
+        noise: standard deviation of added Gaussian noise
+        rotation: maximum rotation in degrees (a random angle in [-rotation, rotation] is used)
+        scale: resolution factor applied to the final image
+        background: place the card on a darker background with a margin around it
+    """
+    image = card
+    if background:
+        h, w = image.shape[:2]
+        margin_x, margin_y = int(w * 0.15), int(h * 0.15)
+        canvas = np.full((h + 2 * margin_y, w + 2 * margin_x, 3), (70, 60, 55), dtype=np.uint8)
+        canvas[margin_y:margin_y + h, margin_x:margin_x + w] = image
+        image = canvas
+
+    if rotation:
+        angle = rng.uniform(-rotation, rotation)
+        h, w = image.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        image = cv2.warpAffine(image, matrix, (w, h), borderValue=(70, 60, 55))
+
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+
+    if noise:
+        noise_rng = np.random.default_rng(rng.randint(0, 2 ** 32 - 1))
+        image = np.clip(image + noise_rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    return image
+
+
+def generate_card(seed, lang=None, noise=0.0, rotation=0.0, scale=1.0, background=True):
+    """Generate one synthetic card photo. Returns (BGR image, ground-truth dict)."""
+    rng = random.Random(seed)
+    data = random_card_data(rng, lang)
+    image = degrade(render_card(data), rng, noise=noise, rotation=rotation, scale=scale, background=background)
+    return image, data
+
+
+def write_corpus(directory, count, seed=0, **options):
+    """Write count synthetic cards and their ground truth to directory. Returns the image paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    with open(os.path.join(directory, "truth.jsonl"), 'w', encoding='utf-8') as truth:
+        for i in range(count):
+            image, data = generate_card(seed + i, **options)
+            path = os.path.join(directory, f"card_{i:04d}.jpg")
+            cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            truth.write(json.dumps({"path": path, "truth": data}, ensure_ascii=False) + "\n")
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lang", choices=SUPPORTED_LANGUAGES, default=None, help="Card language (default: random)")
+    parser.add_argument("--noise", type=float, default=0.0, help="Gaussian noise standard deviation")
+    parser.add_argument("--rotation", type=float, default=0.0, help="Maximum rotation in degrees")
+    parser.add_argument("--scale", type=float, default=1.0, help="Resolution factor")
+    parser.add_argument("--no-background", action="store_true", help="Render the card edge to edge")
+    args = parser.parse_args()
+    paths = write_corpus(args.directory, args.count, seed=args.seed, lang=args.lang, noise=args.noise,
+                         rotation=args.rotation, scale=args.scale, background=not args.no_background)
+    print(f"Wrote {len(paths)} cards to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import config
+from utils import logger
+
+
+def content_hash(contents):
+    """Hash the raw uploaded bytes."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+class ResultCache:
+    """
+    Caches card results by upload content hash.
+    A size-bounded in-memory LRU sits in front of an optional sqlite tier; both expire
+    entries after ttl seconds. Only the exact same upload is answered from the cache:
+    two photos of different cards can look alike, so images are never matched by similarity.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # key -> (created, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def _remember(self, key, value, created):
+        """Insert into the memory tier, evicting the least recently used entries."""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Look up a result by content hash. Returns None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self._disk_hits += 1
+                    return value
+
+            self._misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store a result under its content hash."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), now),
+                    )
+                    self._evict_disk(now)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not write result cache entry: {e}")
+
+    def _evict_disk(self, now):
+        if self.ttl > 0:
+            self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes."""
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk": self._db is not None,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round((lookups - self._misses) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def create_result_cache():
+    """Create the result cache from configuration, or None if caching is disabled."""
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    cache = ResultCache(
+        max_entries=config.RESULT_CACHE_SIZE,
+        ttl=config.RESULT_CACHE_TTL,
+        path=config.RESULT_CACHE_PATH or None,
+        max_disk_entries=config.RESULT_CACHE_DISK_SIZE,
+    )
+    logger.info(f"Result cache ready: {cache.max_entries} entries in memory, disk tier {'on' if config.RESULT_CACHE_PATH else 'off'}")
+    return cache
+
+
+class ImageStore:
+    """
+    Keeps response images in memory for a short time so clients can fetch them
+    by id instead of receiving them inline as base64.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._images = OrderedDict()  # image_id -> (created, {kind: jpeg bytes})
+        self._lock = threading.Lock()
+
+    def put(self, images):
+        """Store a dict of JPEG images and return the id to fetch them with."""
+        image_id = uuid.uuid4().hex
+        with self._lock:
+            self._images[image_id] = (time.time(), images)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return image_id
+
+    def get(self, image_id, kind):
+        """Return the JPEG bytes of one stored image, or None if unknown or expired."""
+        with self._lock:
+            entry = self._images.get(image_id)
+            if entry is None:
+                return None
+            created, images = entry
+            if time.time() - created > self.ttl:
+                del self._images[image_id]
+                return None
+            return images.get(kind)
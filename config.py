@@ -0,0 +1,133 @@
+import os
+from dotenv import load_dotenv
+
+# Load settings from a local .env file if present
+load_dotenv()
+
+
+def env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be an integer, got {value!r}")
+
+
+def env_float(name, default):
+    """Read a float setting from the environment."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be a number, got {value!r}")
+
+
+def env_bool(name, default):
+    """Read a boolean setting from the environment."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# OCR models, loaded from the bundled inference/ directory
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference")
+OCR_DET_MODEL_DIR = os.getenv("OCR_DET_MODEL_DIR", os.path.join(MODEL_DIR, "det"))
+OCR_REC_MODEL_DIR = os.getenv("OCR_REC_MODEL_DIR", os.path.join(MODEL_DIR, "latin_mobile_v3_rec"))
+OCR_CLS_MODEL_DIR = os.getenv("OCR_CLS_MODEL_DIR", os.path.join(MODEL_DIR, "cls"))
+OCR_OFFLINE = env_bool("OCR_OFFLINE", False)  # Fail instead of downloading models that are not bundled
+
+# Inference backend
+OCR_BACKEND = os.getenv("OCR_BACKEND", "paddle")  # "paddle", "onnxruntime" or "openvino"
+OCR_INTRA_OP_THREADS = env_int("OCR_INTRA_OP_THREADS", 0)  # Threads per worker for model calls, OpenCV and BLAS (0 = CPUs / workers)
+OCR_INTER_OP_THREADS = env_int("OCR_INTER_OP_THREADS", 0)  # Parallel operators / streams per model (0 = backend default)
+OCR_REC_CHAR_DICT = os.getenv("OCR_REC_CHAR_DICT", "")  # Recognizer dictionary for exported models (empty = latin_dict.txt)
+OCR_PRECISION = os.getenv("OCR_PRECISION", "fp32")  # "fp32" or "int8" detector and recognizer (exported backends only)
+OCR_INT8_MAX_ACCURACY_DROP = env_float("OCR_INT8_MAX_ACCURACY_DROP", 0.01)  # Largest field accuracy loss accepted to promote int8
+
+# OCR engine pool
+OCR_POOL_SIZE = env_int("OCR_POOL_SIZE", 2)  # Number of PaddleOCR engines kept loaded
+OCR_POOL_WARMUP = env_bool("OCR_POOL_WARMUP", True)  # Run a dummy inference on each engine at startup
+OCR_POOL_TIMEOUT = env_int("OCR_POOL_TIMEOUT", 30)  # Seconds to wait for a free engine
+
+# Request executor
+OCR_EXECUTOR = os.getenv("OCR_EXECUTOR", "thread")  # "thread" or "process"
+OCR_WORKERS = env_int("OCR_WORKERS", OCR_POOL_SIZE)  # Cards processed in parallel
+OCR_MAX_QUEUE = env_int("OCR_MAX_QUEUE", 16)  # Cards allowed to wait for a worker before rejecting
+OCR_CPU_AFFINITY = env_bool("OCR_CPU_AFFINITY", False)  # Pin each worker process to its own CPUs, within one NUMA node
+
+# Cross-request recognition batching (thread executor only)
+OCR_BATCHING = env_bool("OCR_BATCHING", False)
+OCR_BATCH_MAX_SIZE = env_int("OCR_BATCH_MAX_SIZE", 32)  # Max text crops per recognizer call
+OCR_BATCH_MAX_WAIT_MS = env_int("OCR_BATCH_MAX_WAIT_MS", 10)  # How long a batch waits for more crops
+
+# Result cache
+RESULT_CACHE_ENABLED = env_bool("RESULT_CACHE_ENABLED", True)
+RESULT_CACHE_SIZE = env_int("RESULT_CACHE_SIZE", 1024)  # Entries kept in memory
+RESULT_CACHE_TTL = env_int("RESULT_CACHE_TTL", 3600)  # Seconds before an entry expires (0 = never)
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")  # sqlite file for the on-disk tier (empty = memory only)
+RESULT_CACHE_DISK_SIZE = env_int("RESULT_CACHE_DISK_SIZE", 100000)  # Entries kept on disk
+
+# Card geometry normalization
+CARD_NORMALIZE = env_bool("CARD_NORMALIZE", True)  # Localize, deskew and resize the card before OCR
+CARD_WIDTH = env_int("CARD_WIDTH", 1000)  # Width in pixels of the normalized card
+CARD_CROP_FIELDS = env_bool("CARD_CROP_FIELDS", False)  # Only OCR the band holding fields 3-9
+CARD_ORIENTATION_CHECK = env_bool("CARD_ORIENTATION_CHECK", True)  # Turn warped cards that are upside down upright
+
+# Template mode: recognize only the fixed EHIC field regions on normalized cards
+CARD_TEMPLATE_MODE = env_bool("CARD_TEMPLATE_MODE", False)
+CARD_TEMPLATE_MIN_CONFIDENCE = env_float("CARD_TEMPLATE_MIN_CONFIDENCE", 0.8)  # Below this, fall back to full OCR
+
+# Adaptive pipeline
+QUALITY_CHECK = env_bool("QUALITY_CHECK", True)  # Reject unusable photos before running OCR
+QUALITY_MIN_SHARPNESS = env_float("QUALITY_MIN_SHARPNESS", 100.0)  # Variance of the Laplacian at 500px card width
+QUALITY_MIN_BRIGHTNESS = env_float("QUALITY_MIN_BRIGHTNESS", 40.0)  # Mean gray level (0-255)
+QUALITY_MAX_BRIGHTNESS = env_float("QUALITY_MAX_BRIGHTNESS", 240.0)
+QUALITY_REQUIRE_CARD = env_bool("QUALITY_REQUIRE_CARD", False)  # Reject photos where no card outline is found
+OCR_CLS_SAMPLE = env_int("OCR_CLS_SAMPLE", 3)  # Lines classified first; the rest only if one is upside down (0 = all)
+CARD_REQUIRED_FIELDS = [field.strip() for field in os.getenv(
+    "CARD_REQUIRED_FIELDS", "surname,first_name,birth_date,personal_number,card_number").split(",") if field.strip()]
+CARD_SECOND_PASS = env_bool("CARD_SECOND_PASS", True)  # Read the regions of missing required fields again
+CARD_SECOND_PASS_MIN_CONFIDENCE = env_float("CARD_SECOND_PASS_MIN_CONFIDENCE", 0.7)  # Required fields read with less are read again
+CARD_SECOND_PASS_SCALE = env_float("CARD_SECOND_PASS_SCALE", 2.0)  # Upscaling of those regions
+
+# Camera frame streams (/stream-card)
+STREAM_MIN_SHARPNESS = env_float("STREAM_MIN_SHARPNESS", QUALITY_MIN_SHARPNESS)  # Blurrier frames are not read
+STREAM_MAX_MOTION = env_float("STREAM_MAX_MOTION", 12)  # Mean gray level change from the previous frame above which it is not read
+STREAM_STABLE_FRAMES = env_int("STREAM_STABLE_FRAMES", 2)  # Frames that must agree on a field before it is stable
+STREAM_MAX_READS = env_int("STREAM_MAX_READS", 8)  # Frames read before answering even if some fields are not stable
+
+# Insurer registry, used to correct and cross-check the insurance code and name
+INSURER_CHECK = env_bool("INSURER_CHECK", True)
+INSURER_REGISTRY_PATH = os.getenv("INSURER_REGISTRY_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "insurers.csv"))  # CSV with code and name columns
+INSURER_MAX_DISTANCE = env_int("INSURER_MAX_DISTANCE", 2)  # Most character edits corrected in a name
+INSURER_RELOAD_INTERVAL = env_float("INSURER_RELOAD_INTERVAL", 30)  # Seconds between checks for a changed registry file
+
+# Upload handling
+MAX_UPLOAD_BYTES = env_int("MAX_UPLOAD_BYTES", 20 * 1024 * 1024)  # Largest card image accepted, checked as it streams in
+DECODE_MAX_SIDE = env_int("DECODE_MAX_SIDE", 2000)  # Longer side images are decoded at (0 = full resolution)
+
+# Images returned by id instead of inline base64
+IMAGE_STORE_SIZE = env_int("IMAGE_STORE_SIZE", 256)  # Responses whose images are kept in memory
+IMAGE_STORE_TTL = env_int("IMAGE_STORE_TTL", 300)  # Seconds images stay available
+
+# Batch endpoint
+BATCH_MAX_RETRIES = env_int("BATCH_MAX_RETRIES", 5)  # Times a batch card waits for queue space before failing
+BATCH_MAX_FILES = env_int("BATCH_MAX_FILES", 1000)  # Files accepted in one batch upload
+BATCH_MAX_UPLOAD_BYTES = env_int("BATCH_MAX_UPLOAD_BYTES", 1024 * 1024 * 1024)  # Largest batch request body
+
+# Job queue (POST /jobs, served by worker.py)
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite://")  # sqlite:// (in memory), sqlite:///path/jobs.db or redis://host:6379/0
+JOB_EMBEDDED_WORKERS = env_int("JOB_EMBEDDED_WORKERS", 1)  # Jobs the API process runs itself (0 = only worker.py)
+JOB_VISIBILITY_TIMEOUT = env_int("JOB_VISIBILITY_TIMEOUT", 120)  # Seconds before an unfinished job is handed out again
+JOB_MAX_ATTEMPTS = env_int("JOB_MAX_ATTEMPTS", 3)  # Attempts before a job fails
+JOB_RETRY_DELAY = env_int("JOB_RETRY_DELAY", 5)  # Seconds before a failed attempt is retried
+JOB_RESULT_TTL = env_int("JOB_RESULT_TTL", 3600)  # Seconds finished job results are kept
+JOB_MAX_QUEUED = env_int("JOB_MAX_QUEUED", 10000)  # Waiting jobs before POST /jobs is rejected
+JOB_POLL_INTERVAL = env_float("JOB_POLL_INTERVAL", 0.2)  # Seconds an idle worker waits before polling again
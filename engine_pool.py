@@ -0,0 +1,165 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+import config
+from topology import intra_op_threads
+from utils import logger
+
+# Files an exported PaddleOCR inference model directory must contain
+MODEL_FILES = ('inference.pdmodel', 'inference.pdiparams')
+
+
+@lru_cache(maxsize=1)
+def bundled_model_dirs():
+    """
+    Return the PaddleOCR model directory options for the bundled models that are present.
+    Models that are missing are downloaded by PaddleOCR on first use,
+    unless OCR_OFFLINE is set, in which case a missing model is an error.
+    """
+    options = {}
+    for option, path in (('det_model_dir', config.OCR_DET_MODEL_DIR),
+                         ('rec_model_dir', config.OCR_REC_MODEL_DIR),
+                         ('cls_model_dir', config.OCR_CLS_MODEL_DIR)):
+        if path and all(os.path.isfile(os.path.join(path, name)) for name in MODEL_FILES):
+            options[option] = path
+        elif config.OCR_OFFLINE:
+            raise FileNotFoundError(f"No inference model found in {path!r} for {option} and OCR_OFFLINE is set")
+        else:
+            logger.warning(f"No inference model found in {path!r}, PaddleOCR will use its default {option}")
+    return options
+
+
+def create_engine(backend=None):
+    """
+    Create an OCR engine with the settings used across the project.
+    Args:
+        backend: "paddle", "onnxruntime" or "openvino" (default: OCR_BACKEND).
+            All engines expose PaddleOCR's text_detector, text_classifier and text_recognizer.
+    """
+    backend = backend or config.OCR_BACKEND
+    options = {}
+    if config.OCR_BATCHING:
+        # Let the recognizer take a whole cross-request batch in one forward pass
+        options['rec_batch_num'] = config.OCR_BATCH_MAX_SIZE
+
+    if backend != "paddle":
+        from backends import ExportedModelEngine
+        return ExportedModelEngine(backend, use_angle_cls=True, **options)
+    if config.OCR_PRECISION != "fp32":
+        raise ValueError(f"OCR_PRECISION={config.OCR_PRECISION} needs the onnxruntime or openvino backend")
+
+    # paddle takes seconds to import, so it is only loaded when the first engine is built
+    from paddleocr import PaddleOCR
+
+    options.update(bundled_model_dirs())
+    if intra_op_threads():
+        options['cpu_threads'] = intra_op_threads()
+    return PaddleOCR(use_angle_cls=True, lang='latin', show_log=False, **options)
+
+
+class EnginePoolTimeout(Exception):
+    """Raised when no OCR engine becomes free within the checkout timeout."""
+
+
+class OCREnginePool:
+    """
+    A fixed-size pool of PaddleOCR engines.
+    Engines are created once, checked out for a single request and returned afterwards,
+    so model loading only happens at startup instead of on every image.
+    """
+
+    def __init__(self, size=1, factory=create_engine, warmup=True, timeout=None):
+        if size < 1:
+            raise ValueError("Engine pool size must be at least 1")
+        self.size = size
+        self.timeout = timeout
+        self._engines = queue.Queue(maxsize=size)
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._waiting = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+        start = time.perf_counter()
+        for _ in range(size):
+            engine = factory()
+            if warmup:
+                self._warmup(engine)
+            self._engines.put(engine)
+        logger.info(f"OCR engine pool ready: {size} engine(s) in {time.perf_counter() - start:.2f}s")
+
+    @staticmethod
+    def _warmup(engine):
+        """Run a dummy inference so the first real request does not pay graph setup time."""
+        dummy = np.full((64, 256, 3), 255, dtype=np.uint8)
+        try:
+            engine.ocr(dummy, cls=True)
+        except Exception as e:
+            logger.warning(f"OCR engine warm-up failed: {e}")
+
+    @contextmanager
+    def engine(self, timeout=None):
+        """Check out an engine for the duration of the with-block."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        try:
+            engine = self._engines.get(timeout=timeout)
+        except queue.Empty:
+            raise EnginePoolTimeout(f"No OCR engine available after {timeout}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        try:
+            yield engine
+        finally:
+            self._engines.put(engine)
+
+    def stats(self):
+        """Return pool occupancy and checkout wait statistics."""
+        with self._lock:
+            available = self._engines.qsize()
+            return {
+                "size": self.size,
+                "available": available,
+                "in_use": self.size - available,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "avg_wait_ms": round(self._total_wait / self._checkouts * 1000, 2) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_engine_pool(size=None, warmup=None):
+    """Create the process-wide engine pool. Calling it again keeps the existing pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OCREnginePool(
+                size=config.OCR_POOL_SIZE if size is None else size,
+                warmup=config.OCR_POOL_WARMUP if warmup is None else warmup,
+                timeout=config.OCR_POOL_TIMEOUT,
+            )
+        return _pool
+
+
+def get_engine_pool():
+    """Return the process-wide engine pool, creating it on first use."""
+    if _pool is None:
+        return init_engine_pool()
+    return _pool
@@ -0,0 +1,150 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import config
+from engine_pool import init_engine_pool
+from topology import configure_worker, limit_threads, next_worker_index, resolve_topology, worker_counter
+from utils import logger
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue is full and a request has to be rejected."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _init_process_worker(counter, threads):
+    """Limit the threads of an executor process, optionally pin it, and load its OCR engine."""
+    configure_worker(next_worker_index(counter), threads)
+    init_engine_pool(size=1)
+
+
+def _worker_ready():
+    """Report which worker ran this; it only runs once the process has loaded its engine."""
+    # Stay busy briefly so the other warm-up tasks are picked up by other processes
+    time.sleep(0.1)
+    return os.getpid()
+
+
+def _timed_call(fn, args):
+    """Run fn in the worker and report when it actually started."""
+    started = time.time()
+    return started, fn(*args)
+
+
+class BoundedExecutor:
+    """
+    Runs CPU-bound card processing off the event loop with bounded admission.
+    At most max_workers jobs run at once and at most max_queue more may wait;
+    anything beyond that is rejected with QueueFullError instead of queueing forever.
+    """
+
+    def __init__(self, kind="thread", max_workers=1, max_queue=0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        _, self.threads = resolve_topology(max_workers)
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_process_worker,
+                                                 initargs=(worker_counter(), self.threads))
+        else:
+            # Thread workers share the process, so its limits are each card's share of the CPUs
+            limit_threads(self.threads)
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr")
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_service = 0.0
+
+    def _retry_after(self):
+        """Estimate how long until a slot frees up, in whole seconds."""
+        avg_service = self._total_service / self._completed if self._completed else 1.0
+        return max(1, math.ceil(avg_service * (self.max_queue + 1) / self.max_workers))
+
+    async def submit(self, fn, *args, timings=None):
+        """
+        Run fn(*args) in the executor, or raise QueueFullError if the queue is full.
+        If a timings dict is given, the time spent waiting for a worker is added to it as "queue_wait".
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(self._retry_after())
+            self._in_flight += 1
+
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            started, result = await loop.run_in_executor(self._executor, _timed_call, fn, args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        finished = time.time()
+        waited = max(0.0, started - submitted)
+        if timings is not None:
+            timings["queue_wait"] = timings.get("queue_wait", 0.0) + waited
+        with self._lock:
+            self._completed += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._total_service += finished - started
+        return result
+
+    def stats(self):
+        """Return queue depth and wait time statistics."""
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.max_workers),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / self._completed * 1000, 2) if self._completed else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "avg_service_ms": round(self._total_service / self._completed * 1000, 2) if self._completed else 0.0,
+            }
+
+    def warmup(self):
+        """
+        Start every worker process and wait until each has loaded its OCR engine.
+        Thread workers share the engine pool, which is warmed up separately.
+        """
+        if self.kind != "process":
+            return
+        # Tasks submitted while no worker is idle each start a new process
+        pids = set()
+        for _ in range(10):
+            futures = [self._executor.submit(_worker_ready) for _ in range(self.max_workers)]
+            pids.update(future.result() for future in futures)
+            if len(pids) >= self.max_workers:
+                break
+        logger.info(f"{len(pids)} OCR worker process(es) ready")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def create_executor():
+    """Create the request executor from configuration."""
+    executor = BoundedExecutor(
+        kind=config.OCR_EXECUTOR,
+        max_workers=config.OCR_WORKERS,
+        max_queue=config.OCR_MAX_QUEUE,
+    )
+    logger.info(f"OCR executor ready: {executor.kind} x{executor.max_workers} with {executor.threads} thread(s) each, "
+                f"queue {executor.max_queue}")
+    return executor
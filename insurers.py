@@ -0,0 +1,204 @@
+import csv
+import os
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+import config
+from utils import logger
+
+Insurer = namedtuple("Insurer", ["code", "name"])
+
+# Letters OCR commonly reads as digits inside a name
+_DIGIT_LETTERS = str.maketrans("0158", "OISB")
+
+
+def normalize_name(name):
+    """Comparison key of an insurer name: upper case, accents and anything but letters removed."""
+    name = unicodedata.normalize("NFKD", name.upper().translate(_DIGIT_LETTERS))
+    return "".join(c for c in name if c.isalpha() and c.isascii())
+
+
+def normalize_code(code):
+    """Comparison key of a BAG code, which cards print zero-padded (0032 and 32 are the same insurer)."""
+    return int(code) if code and code.isdigit() else None
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over strings for edit distance lookups: a search only descends into
+    the children whose distance to their parent is within max_distance of the query's.
+    """
+
+    def __init__(self):
+        self._root = None  # [key, value, {distance: child}]
+
+    def add(self, key, value):
+        if self._root is None:
+            self._root = [key, value, {}]
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(key, node[0])
+            if distance == 0:
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                return
+            node = child
+
+    def search(self, key, max_distance):
+        """Return (distance, value) for every key within max_distance, closest first."""
+        found = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = edit_distance(key, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+
+class InsurerRegistry:
+    """
+    The Swiss health insurers, indexed by BAG code and by name. Exact code and name lookups
+    are hash lookups; misread names are matched by edit distance in a BK-tree.
+    """
+
+    def __init__(self, insurers, path=None, mtime=None):
+        self.path = path
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self._by_code = {}
+        self._by_name = {}
+        self._names = BKTree()
+        for insurer in insurers:
+            code = normalize_code(insurer.code)
+            if code is None:
+                raise ValueError(f"Invalid insurer code {insurer.code!r}")
+            if code in self._by_code:
+                raise ValueError(f"Duplicate insurer code {insurer.code!r}")
+            self._by_code[code] = insurer
+            key = normalize_name(insurer.name)
+            self._by_name[key] = insurer
+            self._names.add(key, insurer)
+
+    @classmethod
+    def load(cls, path):
+        """Load a CSV file with code and name columns; lines starting with # are comments."""
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = csv.DictReader(line for line in f if not line.startswith("#"))
+            insurers = [Insurer(row["code"].strip(), row["name"].strip()) for row in rows]
+        return cls(insurers, path, mtime)
+
+    def __len__(self):
+        return len(self._by_code)
+
+    def by_code(self, code):
+        return self._by_code.get(normalize_code(code))
+
+    def match_name(self, name, max_distance=None):
+        """
+        Return (insurer, distance) for the closest insurer name, or (None, None) if none is close enough
+        or two are equally close. Short names allow fewer edits: at most a quarter of their letters.
+        """
+        key = normalize_name(name)
+        if not key:
+            return None, None
+        insurer = self._by_name.get(key)
+        if insurer is not None:
+            return insurer, 0
+        if max_distance is None:
+            max_distance = config.INSURER_MAX_DISTANCE
+        max_distance = min(max_distance, len(key) // 4)
+        if max_distance == 0:
+            return None, None
+        matches = self._names.search(key, max_distance)
+        if not matches or (len(matches) > 1 and matches[1][0] == matches[0][0]):
+            return None, None
+        distance, insurer = matches[0]
+        return insurer, distance
+
+    def verify(self, code, name):
+        """
+        Cross-validate an insurance code and name read from a card.
+        Returns (verdict, insurer):
+            "valid": both match the same insurer as read
+            "corrected": they were reconciled with insurer (a misread name or code, or a missing one)
+            "mismatch": they point to different insurers, or the name is unknown for a known code
+            "unknown": neither is in the registry; insurer is None
+        """
+        by_code = self.by_code(code)
+        by_name, distance = self.match_name(name) if name else (None, None)
+
+        if by_code is not None and by_name is by_code:
+            exact = distance == 0 and name == by_code.name and code == by_code.code
+            return ("valid" if exact else "corrected"), by_code
+        if by_code is not None and not name:
+            return "corrected", by_code
+        if by_name is not None and by_code is None:
+            return "corrected", by_name
+        if by_code is not None and by_name is not None:
+            # An exactly read name overrides a code with a single misread digit
+            misread = len(code) == len(by_name.code) and sum(a != b for a, b in zip(code, by_name.code)) == 1
+            if distance == 0 and misread:
+                return "corrected", by_name
+            return "mismatch", by_name
+        if by_code is not None:
+            return "mismatch", by_code
+        return "unknown", None
+
+    def stats(self):
+        return {"path": self.path, "insurers": len(self), "loaded_at": self.loaded_at}
+
+
+_registry = None
+_next_check = 0.0
+_lock = threading.Lock()
+
+
+def get_insurer_registry():
+    """
+    Return the insurer registry, loading it on first use. The file is checked for changes at most
+    every INSURER_RELOAD_INTERVAL seconds and reloaded when it changed, so the registry can be
+    updated without restarting; if the new file cannot be read, the previous registry stays in use.
+    """
+    global _registry, _next_check
+    now = time.monotonic()
+    if _registry is not None and now < _next_check:
+        return _registry
+    with _lock:
+        if _registry is not None and now < _next_check:
+            return _registry
+        _next_check = now + config.INSURER_RELOAD_INTERVAL
+        path = config.INSURER_REGISTRY_PATH
+        try:
+            changed = _registry is None or os.stat(path).st_mtime_ns != _registry.mtime
+            if changed:
+                registry = InsurerRegistry.load(path)
+                logger.info(f"Loaded {len(registry)} insurers from {path}")
+                _registry = registry
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Cannot load the insurer registry from {path}: {str(e)}")
+            if _registry is None:
+                _registry = InsurerRegistry([], path)
+    return _registry
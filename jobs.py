@@ -0,0 +1,383 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import config
+from utils import logger
+
+# A job handed to a worker. lease identifies this hand-out: once the visibility timeout
+# passes the job may be handed to another worker, and the first one can no longer finish it.
+Job = namedtuple("Job", "id payload options attempts lease")
+
+TIMED_OUT = "Worker did not finish the job within the visibility timeout"
+
+
+class JobQueue(ABC):
+    """
+    Interface of the job queue behind POST /jobs.
+    Jobs are handed to one worker at a time: reserve() hides a job for visibility_timeout seconds,
+    after which it is handed out again unless the worker completed or failed it. Failed jobs are
+    retried after retry_delay seconds until max_attempts is reached. Finished jobs keep their
+    result (never the uploaded image) for result_ttl seconds.
+    """
+
+    def __init__(self, visibility_timeout=120, max_attempts=3, retry_delay=5, result_ttl=3600):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.result_ttl = result_ttl
+
+    @abstractmethod
+    def enqueue(self, payload, options):
+        """Add a job with the uploaded bytes and its options dict. Returns the job id."""
+
+    @abstractmethod
+    def reserve(self):
+        """Hand out the oldest visible job to the caller, or return None if there is none."""
+
+    @abstractmethod
+    def complete(self, job, result):
+        """Store the result of a reserved job. Returns False if the lease had already run out."""
+
+    @abstractmethod
+    def fail(self, job, error, retry=True):
+        """
+        Record a failed attempt. The job is retried if retry is set and attempts are left,
+        otherwise it fails with the error dict. Returns False if the lease had already run out.
+        """
+
+    @abstractmethod
+    def release(self, job, delay=0):
+        """Put a reserved job back without using up an attempt, e.g. when the worker is too busy."""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Return the status record of a job, or None if it is unknown or expired."""
+
+    @abstractmethod
+    def pending(self):
+        """Number of jobs waiting for a worker."""
+
+    @abstractmethod
+    def stats(self):
+        """Queue state reported by /health: the backend name and the job counts it can report."""
+
+
+class SqliteJobQueue(JobQueue):
+    """
+    Job queue in a sqlite database. With path ":memory:" it lives inside the API process and
+    only its embedded workers can use it; a file can be shared with worker processes on the same host.
+    """
+
+    def __init__(self, path=":memory:", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload BLOB, options TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease TEXT, visible_at REAL NOT NULL, "
+            "created REAL NOT NULL, finished REAL, result TEXT, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_visible ON jobs (status, visible_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+
+    def enqueue(self, payload, options):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, payload, options, visible_at, created) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, payload, json.dumps(options), now, now),
+            )
+        return job_id
+
+    def reserve(self):
+        now = time.time()
+        lease = uuid.uuid4().hex
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes cannot claim the same job
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM jobs WHERE finished < ?", (now - self.result_ttl,))
+                # Leases that ran out on the last attempt fail instead of being handed out again
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', payload = NULL, lease = NULL, finished = ?, error = ? "
+                    "WHERE status = 'running' AND visible_at <= ? AND attempts >= ?",
+                    (now, json.dumps({"error": TIMED_OUT}), now, self.max_attempts),
+                )
+                row = self._db.execute(
+                    "SELECT id, payload, options, attempts FROM jobs "
+                    "WHERE status IN ('queued', 'running') AND visible_at <= ? ORDER BY visible_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease = ?, visible_at = ? "
+                        "WHERE id = ?",
+                        (lease, now + self.visibility_timeout, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3] + 1, lease)
+
+    def _finish(self, job, status, column, value):
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE jobs SET status = ?, {column} = ?, payload = NULL, lease = NULL, finished = ? "
+                f"WHERE id = ? AND lease = ?",
+                (status, json.dumps(value, ensure_ascii=False), time.time(), job.id, job.lease),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job, result):
+        return self._finish(job, "done", "result", result)
+
+    def fail(self, job, error, retry=True):
+        if not retry or job.attempts >= self.max_attempts:
+            return self._finish(job, "failed", "error", error)
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', lease = NULL, visible_at = ?, error = ? WHERE id = ? AND lease = ?",
+                (time.time() + self.retry_delay, json.dumps(error, ensure_ascii=False), job.id, job.lease),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, job, delay=0):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', lease = NULL, attempts = attempts - 1, visible_at = ? "
+                "WHERE id = ? AND lease = ?",
+                (time.time() + delay, job.id, job.lease),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, attempts, created, finished, result, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None or (row[3] is not None and time.time() - row[3] > self.result_ttl):
+            return None
+        status, attempts, created, finished, result, error = row
+        return job_record(job_id, status, attempts, created, finished, result, error)
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"backend": "sqlite", "path": self.path,
+                **{status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")}}
+
+
+# Requeues leases that ran out (or retries whose delay passed), then hands out the oldest queued job.
+# KEYS: queue list, leases sorted set. ARGV: now, visibility timeout, max attempts, lease, key prefix,
+# result ttl, timeout error.
+_RESERVE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(due) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = ARGV[5] .. id
+    if redis.call('HGET', key, 'status') == 'running' and tonumber(redis.call('HGET', key, 'attempts')) >= tonumber(ARGV[3]) then
+        redis.call('HSET', key, 'status', 'failed', 'finished', ARGV[1], 'error', ARGV[7])
+        redis.call('HDEL', key, 'payload', 'lease')
+        redis.call('EXPIRE', key, ARGV[6])
+    elseif redis.call('EXISTS', key) == 1 then
+        redis.call('HSET', key, 'status', 'queued')
+        redis.call('HDEL', key, 'lease')
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+local id = redis.call('RPOP', KEYS[1])
+if not id then
+    return nil
+end
+local key = ARGV[5] .. id
+local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'running', 'lease', ARGV[4])
+redis.call('ZADD', KEYS[2], tonumber(ARGV[1]) + tonumber(ARGV[2]), id)
+return {id, redis.call('HGET', key, 'payload'), redis.call('HGET', key, 'options'), attempts}
+"""
+
+# Finishes, retries or releases a job if the caller still holds its lease.
+# KEYS: job hash, leases sorted set. ARGV: lease, job id, status, field, value, now, result ttl,
+# score in the leases set (retries and releases), attempts to add.
+_FINISH_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[1] then
+    return 0
+end
+redis.call('HDEL', KEYS[1], 'lease')
+if ARGV[3] == 'queued' then
+    redis.call('HSET', KEYS[1], 'status', 'queued')
+    if ARGV[4] ~= '' then
+        redis.call('HSET', KEYS[1], ARGV[4], ARGV[5])
+    end
+    redis.call('HINCRBY', KEYS[1], 'attempts', ARGV[9])
+    redis.call('ZADD', KEYS[2], ARGV[8], ARGV[2])
+    return 1
+end
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HSET', KEYS[1], 'status', ARGV[3], ARGV[4], ARGV[5], 'finished', ARGV[6])
+redis.call('HDEL', KEYS[1], 'payload')
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+return 1
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Job queue on a Redis-compatible server, shared by API and worker processes on any host.
+    Each job is a hash; a list holds queued ids and a sorted set holds the deadline of every
+    lease and delayed retry. The state changes run as Lua scripts so they are atomic.
+    """
+
+    def __init__(self, client, prefix="ocr:jobs", **kwargs):
+        super().__init__(**kwargs)
+        self._client = client
+        self._queue_key = f"{prefix}:queue"
+        self._leases_key = f"{prefix}:leases"
+        self._job_prefix = f"{prefix}:job:"
+        self._reserve = client.register_script(_RESERVE_SCRIPT)
+        self._finish_script = client.register_script(_FINISH_SCRIPT)
+
+    def enqueue(self, payload, options):
+        job_id = uuid.uuid4().hex
+        pipe = self._client.pipeline()
+        pipe.hset(self._job_prefix + job_id, mapping={
+            "status": "queued", "payload": payload, "options": json.dumps(options),
+            "attempts": 0, "created": time.time(),
+        })
+        pipe.lpush(self._queue_key, job_id)
+        pipe.execute()
+        return job_id
+
+    def reserve(self):
+        lease = uuid.uuid4().hex
+        reply = self._reserve(
+            keys=[self._queue_key, self._leases_key],
+            args=[time.time(), self.visibility_timeout, self.max_attempts, lease, self._job_prefix,
+                  self.result_ttl, json.dumps({"error": TIMED_OUT})],
+        )
+        if reply is None:
+            return None
+        job_id, payload, options, attempts = reply
+        return Job(job_id.decode(), payload, json.loads(options), int(attempts), lease)
+
+    def _finish(self, job, status, field="", value=None, score=0, attempts=0):
+        return self._finish_script(
+            keys=[self._job_prefix + job.id, self._leases_key],
+            args=[job.lease, job.id, status, field, json.dumps(value, ensure_ascii=False) if field else "",
+                  time.time(), self.result_ttl, score, attempts],
+        ) == 1
+
+    def complete(self, job, result):
+        return self._finish(job, "done", "result", result)
+
+    def fail(self, job, error, retry=True):
+        if not retry or job.attempts >= self.max_attempts:
+            return self._finish(job, "failed", "error", error)
+        return self._finish(job, "queued", "error", error, score=time.time() + self.retry_delay)
+
+    def release(self, job, delay=0):
+        return self._finish(job, "queued", score=time.time() + delay, attempts=-1)
+
+    def get(self, job_id):
+        fields = self._client.hmget(self._job_prefix + job_id,
+                                    ["status", "attempts", "created", "finished", "result", "error"])
+        if fields[0] is None:
+            return None
+        status, attempts, created, finished, result, error = (
+            value.decode() if value is not None else None for value in fields
+        )
+        return job_record(job_id, status, int(attempts), float(created),
+                          float(finished) if finished is not None else None, result, error)
+
+    def pending(self):
+        return self._client.llen(self._queue_key)
+
+    def stats(self):
+        return {"backend": "redis", "queued": self.pending(), "leased_or_delayed": self._client.zcard(self._leases_key)}
+
+
+def job_record(job_id, status, attempts, created, finished, result, error):
+    """Build the GET /jobs/{id} response from stored job fields."""
+    record = {"id": job_id, "status": status, "attempts": attempts, "created": created}
+    if finished is not None:
+        record["finished"] = float(finished)
+    if result is not None:
+        record["result"] = json.loads(result)
+    if error is not None:
+        # Kept while a job waits for a retry, so clients can see why it is still queued
+        record["error"] = json.loads(error)
+    return record
+
+
+def create_job_queue(url=None):
+    """
+    Create the job queue for a JOB_QUEUE_URL:
+    sqlite:// (in memory, API process only), sqlite:///path/to/jobs.db or redis://host:6379/0.
+    """
+    url = config.JOB_QUEUE_URL if url is None else url
+    options = {
+        "visibility_timeout": config.JOB_VISIBILITY_TIMEOUT,
+        "max_attempts": config.JOB_MAX_ATTEMPTS,
+        "retry_delay": config.JOB_RETRY_DELAY,
+        "result_ttl": config.JOB_RESULT_TTL,
+    }
+    if url.startswith("sqlite://"):
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else ""
+        queue = SqliteJobQueue(path or ":memory:", **options)
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        import redis  # Optional dependency, only needed for a shared queue across hosts
+
+        queue = RedisJobQueue(redis.Redis.from_url(url), **options)
+    else:
+        raise ValueError(f"Unsupported JOB_QUEUE_URL: {url!r}")
+    logger.info(f"Job queue ready: {queue.stats()['backend']}")
+    return queue
+
+
+def card_error(error):
+    """Error record of a card the pipeline could not process (a CardProcessingError)."""
+    record = {"error": error.message, "status_code": error.status_code}
+    if error.reason:
+        record["reason"] = error.reason
+    return record
+
+
+def run_job(queue, job):
+    """
+    Run one reserved job through the card pipeline in this process and store the outcome.
+    Cards that cannot be processed (invalid image, no text, rejected photo) fail right away;
+    unexpected errors are retried.
+    """
+    from pipeline import CardProcessingError, process_card_bytes
+
+    start = time.perf_counter()
+    try:
+        response_data, card_metrics = process_card_bytes(job.payload, job.options.get("images", "none"))
+    except CardProcessingError as e:
+        queue.fail(job, card_error(e), retry=False)
+        return
+    except Exception as e:
+        logger.error(f"Job {job.id} failed on attempt {job.attempts}: {str(e)}")
+        queue.fail(job, {"error": f"An error occurred while processing the image: {str(e)}"})
+        return
+
+    response_data["timings"] = {name: round(seconds, 4) for name, seconds in card_metrics["timings"].items()}
+    if not queue.complete(job, response_data):
+        logger.warning(f"Job {job.id} finished after its lease ran out, result discarded")
+    logger.debug(f"Job {job.id} done in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,216 @@
+import bisect
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds for stage latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds for text lines detected per card
+LINE_BUCKETS = (0, 5, 10, 15, 20, 30, 40, 60, 100)
+# Upper bounds in bytes for the memory held while processing one card
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+class Histogram:
+    """A Prometheus-style cumulative histogram, safe to observe from several threads."""
+
+    def __init__(self, name, help_text, buckets, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._series = {}  # label value -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=""):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, (counts, total, count) in sorted(self._series.items()):
+                base = f'{self.label}="{label_value}",' if self.label else ""
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{base}le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{base}le="+Inf"}} {count}')
+                label_set = f"{{{base.rstrip(',')}}}" if base else ""
+                lines.append(f"{self.name}_sum{label_set} {total}")
+                lines.append(f"{self.name}_count{label_set} {count}")
+        return lines
+
+
+class Counter:
+    """A monotonically increasing counter."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter", f"{self.name} {self._value}"]
+
+
+STAGE_SECONDS = Histogram("ocr_stage_seconds", "Time spent in each card processing stage.", LATENCY_BUCKETS, label="stage")
+REQUEST_SECONDS = Histogram("ocr_request_seconds", "Total time to answer a card request.", LATENCY_BUCKETS)
+TEXT_LINES = Histogram("ocr_text_lines_per_card", "Text lines recognized per card.", LINE_BUCKETS)
+LOW_CONFIDENCE = Counter("ocr_low_confidence_lines_total", "Recognized text lines dropped for low confidence.")
+CARDS = Counter("ocr_cards_processed_total", "Cards run through OCR.")
+QUALITY_REJECTIONS = Counter("ocr_quality_rejections_total", "Photos rejected by the image quality check before OCR.")
+CLASSIFICATION_SKIPPED = Counter("ocr_classification_skipped_total",
+                                 "Cards whose sampled lines were upright, so the other lines were not angle-classified.")
+CARDS_TURNED = Counter("ocr_cards_turned_total", "Warped cards found upside down and turned upright.")
+SECOND_PASS_FIELDS = Counter("ocr_second_pass_fields_total",
+                             "Field regions read again because a required field was missing or low-confidence.")
+SECOND_PASS_RECOVERED = Counter("ocr_second_pass_recovered_total", "Fields recovered or improved by the second pass.")
+INSURER_CORRECTED = Counter("ocr_insurer_corrected_total",
+                            "Cards whose insurance code or name was corrected or filled in from the insurer registry.")
+INSURER_MISMATCHES = Counter("ocr_insurer_mismatches_total",
+                             "Cards whose insurance code and name could not be matched to the same registered insurer.")
+STREAM_FRAMES = Counter("ocr_stream_frames_total", "Camera frames received on /stream-card.")
+STREAM_FRAMES_READ = Counter("ocr_stream_frames_read_total", "Stream frames selected and run through OCR.")
+CARD_PEAK_BYTES = Histogram("ocr_card_peak_bytes", "Peak size of the image buffers held while processing a card.",
+                            MEMORY_BUCKETS)
+
+_METRICS = (STAGE_SECONDS, REQUEST_SECONDS, TEXT_LINES, LOW_CONFIDENCE, CARDS, QUALITY_REJECTIONS,
+            CLASSIFICATION_SKIPPED, CARDS_TURNED, SECOND_PASS_FIELDS, SECOND_PASS_RECOVERED, INSURER_CORRECTED, INSURER_MISMATCHES,
+            STREAM_FRAMES, STREAM_FRAMES_READ, CARD_PEAK_BYTES)
+
+# Per-thread collection of the card currently being processed. Worker code only fills
+# plain dicts here; they are returned to the API process and recorded there, which
+# works the same for thread and process executors.
+_current = threading.local()
+
+
+def start_collection():
+    """Start collecting stage timings, counts and memory for the card processed in this thread."""
+    _current.timings = {}
+    _current.counts = {}
+    _current.held_bytes = 0
+    _current.peak_bytes = 0
+
+
+def collected():
+    """Return the timings, counts and peak memory collected in this thread since start_collection."""
+    return {
+        "timings": getattr(_current, "timings", {}),
+        "counts": getattr(_current, "counts", {}),
+        "peak_bytes": getattr(_current, "peak_bytes", 0),
+    }
+
+
+@contextmanager
+def stage(name):
+    """Time a processing stage of the current card."""
+    timings = getattr(_current, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def count(name, amount=1):
+    """Add to a per-card counter of the current card."""
+    counts = getattr(_current, "counts", None)
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + amount
+
+
+def allocated(nbytes):
+    """
+    Account an image buffer the current card now holds (upload bytes, decoded or normalized
+    images, text crops, encoded outputs). The running total's high-water mark is the card's peak memory.
+    """
+    if getattr(_current, "timings", None) is None:
+        return
+    _current.held_bytes += nbytes
+    _current.peak_bytes = max(_current.peak_bytes, _current.held_bytes)
+
+
+def released(nbytes):
+    """Account an image buffer the current card no longer holds."""
+    if getattr(_current, "timings", None) is not None:
+        _current.held_bytes -= nbytes
+
+
+@contextmanager
+def holding(nbytes):
+    """Account a buffer held for the duration of the with-block."""
+    allocated(nbytes)
+    try:
+        yield
+    finally:
+        released(nbytes)
+
+
+def record(timings, counts=None, peak_bytes=None):
+    """Record the stage timings, counts and peak memory of one card in the process-wide metrics."""
+    for name, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, name)
+    if counts:
+        CARDS.inc()
+        TEXT_LINES.observe(counts.get("text_lines", 0))
+        LOW_CONFIDENCE.inc(counts.get("low_confidence_lines", 0))
+        CLASSIFICATION_SKIPPED.inc(counts.get("classification_skipped", 0))
+        CARDS_TURNED.inc(counts.get("cards_turned", 0))
+        SECOND_PASS_FIELDS.inc(counts.get("second_pass_fields", 0))
+        SECOND_PASS_RECOVERED.inc(counts.get("second_pass_recovered", 0))
+        INSURER_CORRECTED.inc(counts.get("insurer_corrected", 0))
+        INSURER_MISMATCHES.inc(counts.get("insurer_mismatch", 0))
+    if peak_bytes:
+        CARD_PEAK_BYTES.observe(peak_bytes)
+
+
+def process_memory():
+    """Return (resident, peak resident) memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak *= 1024  # Reported in kilobytes on Linux, bytes on macOS
+    try:
+        with open("/proc/self/statm") as f:
+            resident = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        resident = peak
+    return resident, peak
+
+
+def server_timing(timings):
+    """Format stage timings as a Server-Timing header value (durations in milliseconds)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def render(gauges=None, counters=None):
+    """
+    Render all metrics in the Prometheus text exposition format.
+    Args:
+        gauges: extra values that go up and down, as {name: (help text, value)}
+        counters: extra running totals kept elsewhere, as {name: (help text, value)}; names end in _total
+    """
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for kind, values in (("gauge", gauges), ("counter", counters)):
+        for name, (help_text, value) in (values or {}).items():
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
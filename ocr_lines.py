@@ -0,0 +1,106 @@
+import numpy as np
+
+# Boxes whose tops are less than this many pixels apart are on the same text line
+LINE_TOLERANCE = 10
+
+
+def group_lines(tops, tolerance=LINE_TOLERANCE):
+    """
+    Assign a text line id to every box from the y coordinates of the box tops.
+    Going down the page, a new line starts wherever the next box top is tolerance or more below the previous one.
+    """
+    by_top = np.argsort(tops, kind="stable")
+    starts = np.diff(tops[by_top], prepend=-np.inf) >= tolerance
+    line_ids = np.empty(len(tops), dtype=np.int32)
+    line_ids[by_top] = np.cumsum(starts) - 1
+    return line_ids
+
+
+class OcrLines:
+    """
+    The text lines recognized in one image, as parallel arrays:
+    boxes is a contiguous float32 array of shape (n, 4, 2), scores a float32 array of
+    confidences and texts a list of strings. The box extents used for ordering (tops, lefts)
+    are computed once on construction.
+    Lines are kept in reading order: text line by text line, left to right within a line.
+    Indexing with a boolean mask or an index array selects a subset without copying texts.
+    """
+
+    __slots__ = ("boxes", "scores", "texts", "tops", "lefts")
+
+    def __init__(self, boxes, texts, scores, sort=True):
+        """
+        Args:
+            boxes: n quadrilaterals, anything convertible to an (n, 4, 2) array
+            texts: n recognized texts
+            scores: n confidences
+            sort: put the lines in reading order; without it they keep the given order
+        """
+        boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        tops = boxes[:, :, 1].min(axis=1)
+        lefts = boxes[:, :, 0].min(axis=1)
+        texts = list(texts)
+        if sort:
+            order = np.lexsort((lefts, group_lines(tops)))
+            boxes, scores, tops, lefts = boxes[order], scores[order], tops[order], lefts[order]
+            texts = [texts[i] for i in order]
+        self._set(boxes, scores, texts, tops, lefts)
+
+    def _set(self, boxes, scores, texts, tops, lefts):
+        self.boxes = boxes
+        self.scores = scores
+        self.texts = texts
+        self.tops = tops
+        self.lefts = lefts
+        return self
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 4, 2), dtype=np.float32), [], [])
+
+    @classmethod
+    def from_recognition(cls, boxes, rec_res, sort=True):
+        """Build from detector boxes and the recognizer's (text, confidence) for each of them."""
+        return cls(boxes, [text for text, _ in rec_res], [score for _, score in rec_res], sort=sort)
+
+    @classmethod
+    def from_results(cls, results, sort=True):
+        """Build from results in PaddleOCR's format: [[points, (text, confidence)], ...]."""
+        return cls([result[0] for result in results], [result[1][0] for result in results],
+                   [result[1][1] for result in results], sort=sort)
+
+    def to_results(self):
+        """Return the lines in PaddleOCR's result format."""
+        return [[box, (text, score)] for box, text, score in zip(self.boxes.tolist(), self.texts, self.scores.tolist())]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        """Select lines with a boolean mask or an array of indices, keeping their order."""
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        return OcrLines.__new__(OcrLines)._set(
+            self.boxes[index], self.scores[index], [self.texts[i] for i in index],
+            self.tops[index], self.lefts[index],
+        )
+
+    def above(self, min_score):
+        """Lines with a confidence of at least min_score."""
+        return self[self.scores >= min_score]
+
+    def with_boxes(self, boxes):
+        """The same lines, in the same order, with their boxes replaced (e.g. mapped to other coordinates)."""
+        boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        return OcrLines.__new__(OcrLines)._set(
+            boxes, self.scores, self.texts, boxes[:, :, 1].min(axis=1), boxes[:, :, 0].min(axis=1),
+        )
+
+    def concat(self, other):
+        """These lines followed by other's, without sorting them together."""
+        return OcrLines.__new__(OcrLines)._set(
+            np.concatenate([self.boxes, other.boxes]), np.concatenate([self.scores, other.scores]),
+            self.texts + other.texts, np.concatenate([self.tops, other.tops]), np.concatenate([self.lefts, other.lefts]),
+        )
@@ -1,12 +1,34 @@
 from multiprocessing import Pool
+from functools import partial
+import argparse
+import logging
 import os
-import cv2
+import threading
+import time
+import re
 import json
+import numpy as np
 from datetime import datetime
-from paddleocr import PaddleOCR
+import config
+import metrics
+from batching import get_batcher
+from engine_pool import get_engine_pool, init_engine_pool
+from insurers import get_insurer_registry
+from topology import configure_worker, next_worker_index, resolve_topology, worker_counter
+from ocr_lines import OcrLines
 from utils import (
     create_annotated_image,
+    crop_text_region,
+    decode_image,
+    enhance_region,
+    field_band,
+    field_label_box,
+    field_value_boxes,
+    image_quality,
+    normalize_card,
+    restore_box_coordinates,
     FIELD_LABELS,
+    FIELD_REGIONS,
     COUNTRY_CODES,
     EXCLUDED_WORDS,
     SUPPORTED_LANGUAGES,
@@ -15,7 +37,17 @@ from utils import (
 )
 
 class HealthCardInfo:
-    def __init__(self):
+    """
+    The fields read from one card. For every field that was read, confidence holds the lowest
+    confidence of the text lines it came from and sources the indices of those lines in lines,
+    the OcrLines the card was read from (see source_boxes).
+    """
+
+    FIELDS = ("insurance_number", "surname", "first_name", "birth_date", "personal_number",
+              "insurance_code", "insurance_name", "card_number", "expiry_date")
+    __slots__ = FIELDS + ("detected_language", "lines", "confidence", "sources")
+
+    def __init__(self, lines=None):
         self.insurance_number = ""
         self.surname = ""
         self.first_name = ""
@@ -26,6 +58,22 @@ class HealthCardInfo:
         self.card_number = ""
         self.expiry_date = ""
         self.detected_language = ""
+        self.lines = lines
+        self.confidence = {}
+        self.sources = {}
+
+    def set(self, field, value, confidence, sources):
+        """Set a field read from the lines at the indices in sources."""
+        setattr(self, field, value)
+        self.confidence[field] = confidence
+        self.sources[field] = sources
+
+    def source_boxes(self, field):
+        """Boxes of the lines a field was read from, or None if it was not read."""
+        sources = self.sources.get(field)
+        if sources is None or self.lines is None:
+            return None
+        return self.lines.boxes[list(sources)]
 
     def to_dict(self):
         return {
@@ -41,267 +89,852 @@ class HealthCardInfo:
             "detected_language": self.detected_language
         }
 
-def detect_card_language(results):
-    """Detect the language of the card based on field labels."""
-    language_scores = {lang: 0 for lang in SUPPORTED_LANGUAGES}
-    
-    for result in results:
-        text = result[1][0]  # PaddleOCR format: [[[points]], [text, confidence]]
-        prob = result[1][1]
-        
-        if prob < 0.4:
-            continue
-            
-        text = text.strip()
-        
-        # Give higher weight to card titles which are strong language indicators
-        if "CARTE EUROPEENNE" in text or "CARTE EUROPÉENNE" in text:
-            language_scores['fr'] += 5  # Add 5 points for French title
-            continue
-            
-        if "EUROPÄISCHE" in text:
-            language_scores['de'] += 5  # Add 5 points for German title
-            continue
-            
-        if "TESSERA EUROPEA" in text:
-            language_scores['it'] += 5  # Add 5 points for Italian title
-            continue
-        
-        # Check field labels
-        for field in FIELD_LABELS:
-            for lang in SUPPORTED_LANGUAGES:
-                if any(label in text for label in FIELD_LABELS[field][lang]):
-                    language_scores[lang] += 1
-    
-    # Get the language with the highest score
+class ImageQualityError(Exception):
+    """Raised when a photo is unusable for OCR, with a short reason code and advice for the user."""
+
+    def __init__(self, reason, message):
+        super().__init__(reason, message)
+        self.reason = reason
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+# Card titles are strong language indicators, checked in this order
+TITLE_LANGUAGES = (
+    ("CARTE EUROPEENNE", 'fr'),
+    ("CARTE EUROPÉENNE", 'fr'),
+    ("EUROPÄISCHE", 'de'),
+    ("TESSERA EUROPEA", 'it'),
+)
+
+def _trie_pattern(words):
+    """
+    Build a regex matching any of the words, with common prefixes shared (e.g. Nom(?:e)?).
+    Longer continuations are tried first, so the longest word at a position wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        ends_here = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if ends_here:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+def _compile_label_matcher(field_labels):
+    """
+    Compile every field label into a single regex that reports all labels found in a text.
+    The lookahead yields the longest label starting at each position. Any shorter label
+    starting there is a prefix of it, so its (field, language) pairs are merged in up front.
+    """
+    label_keys = {}
+    for field, labels_by_lang in field_labels.items():
+        for lang, labels in labels_by_lang.items():
+            for label in labels:
+                label_keys.setdefault(label, set()).add((field, lang))
+    keys_by_label = {
+        label: frozenset(key for other, keys in label_keys.items() if label.startswith(other) for key in keys)
+        for label in label_keys
+    }
+    return re.compile(f'(?=({_trie_pattern(label_keys)}))'), keys_by_label
+
+_LABEL_PATTERN, _LABEL_KEYS = _compile_label_matcher(FIELD_LABELS)
+# All labels of a language in one string, to test whether a text is part of any label with a single search
+_LABEL_TEXT = {
+    lang: '\x00'.join(label for labels in FIELD_LABELS.values() for label in labels[lang])
+    for lang in SUPPORTED_LANGUAGES
+}
+_EXCLUDED_PATTERNS = {
+    lang: re.compile('|'.join(re.escape(word) for word in words))
+    for lang, words in EXCLUDED_WORDS.items()
+}
+_COUNTRY_CODES = frozenset(COUNTRY_CODES)
+_INSURANCE_NUMBER_KEYS = frozenset(('insurance_number', lang) for lang in SUPPORTED_LANGUAGES)
+_NAME_PATTERN = re.compile(r'(?:[^\W\d_]|\s)+')  # Letters and whitespace only
+_NON_DIGITS = re.compile(r'\D')
+_DATE_PATTERN = re.compile(r'(\d{2})/(\d{2})/(\d{4})')
+
+def _digits(text):
+    return _NON_DIGITS.sub('', text)
+
+def _looks_like_name(text):
+    """Names are printed in upper case, with letters and whitespace only."""
+    return len(text) > 2 and text.isupper() and _NAME_PATTERN.fullmatch(text) is not None
+
+def _is_excluded_name(text, lang):
+    """Whether a text that looks like a name is a field label, an excluded word or a country code in the card language."""
+    return text in _COUNTRY_CODES or text in _LABEL_TEXT[lang] or _EXCLUDED_PATTERNS[lang].search(text) is not None
+
+def _score_line(text, language_scores):
+    """
+    Add the language evidence of one OCR line to language_scores.
+    Returns the (field, language) pairs whose labels occur in the line.
+    """
+    hits = set()
+    for match in _LABEL_PATTERN.finditer(text):
+        hits |= _LABEL_KEYS[match.group(1)]
+
+    for title, lang in TITLE_LANGUAGES:
+        if title in text:
+            language_scores[lang] += 5
+            return hits
+
+    for _, lang in hits:
+        language_scores[lang] += 1
+    return hits
+
+def _best_language(language_scores):
     detected_lang = max(language_scores.items(), key=lambda x: x[1])[0]
     logger.debug(f"Detected language: {detected_lang} (scores: {language_scores})")
     return detected_lang
 
-def extract_card_info(results):
-    card_info = HealthCardInfo()
-    
-    # First detect the language
-    detected_lang = detect_card_language(results)
-    card_info.detected_language = detected_lang
-    
-    print(f"\nDetected language: {detected_lang}")
-    print("\nDetected text:")
-    for result in results:
-        text = result[1][0]
-        prob = result[1][1]
-        print(f"{text} ({prob:.2%})")
-    
-    detected_values = {}
-    potential_names = []
-    
-    for idx, result in enumerate(results):
-        bbox = result[0]
-        text = result[1][0]
-        prob = result[1][1]
-        
-        text = text.strip()
-        
+def detect_card_language(lines):
+    """Detect the language of the card based on field labels."""
+    language_scores = dict.fromkeys(SUPPORTED_LANGUAGES, 0)
+    for text in lines.above(0.4).texts:
+        _score_line(text.strip(), language_scores)
+    return _best_language(language_scores)
+
+def extract_card_info(lines):
+    """
+    Extract card fields from OcrLines in a single pass.
+    Language-dependent checks (label and excluded-word matching) are collected during
+    the pass and resolved once the card language is known.
+    """
+    card_info = HealthCardInfo(lines)
+    language_scores = dict.fromkeys(SUPPORTED_LANGUAGES, 0)
+    current_date = datetime.now()
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    texts = lines.texts
+    scores = lines.scores.tolist()
+    detected_values = {}  # field -> (value, indices of the source lines)
+    name_candidates = []  # (text, line index) of lines that look like names
+    insurance_numbers = []  # (label hits, number, source line) for lines carrying an insurance number label
+
+    for idx, (text, prob) in enumerate(zip(texts, scores)):
+        if debug:
+            logger.debug(f"Detected text: {text} ({prob:.2%})")
+
         if prob < 0.4:
             continue
+        text = text.strip()
+
+        hits = _score_line(text, language_scores)
 
-        if text in COUNTRY_CODES:
+        if text in _COUNTRY_CODES:
             continue
-            
+
         # Simplified name detection - names are uppercase, without numbers, and have good confidence
-        if text.isupper() and len(text) > 2 and prob > 0.7:
-            # Check if text contains only letters and spaces
-            if all(c.isalpha() or c.isspace() for c in text):
-                if not any(text in label for labels in FIELD_LABELS.values() for label in labels[detected_lang]) and \
-                   not any(word in text for word in EXCLUDED_WORDS[detected_lang]):
-                    y_min = min(point[1] for point in bbox)
-                    x_min = min(point[0] for point in bbox)
-                    potential_names.append((text, y_min, x_min))
-        
+        if prob > 0.7 and _looks_like_name(text):
+            name_candidates.append((text, idx))
+
         # Universal personal number detection - "756.XXXX.XXXX.XX" is a standard Swiss format
-        if "756" in text and prob > 0.7:
-            # Clean the text to handle variations
-            cleaned_text = text.strip()
-            
+        if prob > 0.7 and "756" in text:
             # Case 1: Already formatted with periods (e.g., "756.1234.5678.90")
-            if cleaned_text.count('.') >= 2 and cleaned_text.startswith('756'):
-                detected_values['personal_number'] = cleaned_text
-            
+            if text.startswith('756') and text.count('.') >= 2:
+                detected_values['personal_number'] = (text, (idx,))
             # Case 2: Just digits or missing periods (e.g., "7561234567890")
             else:
-                digits = ''.join(filter(str.isdigit, cleaned_text))
+                digits = _digits(text)
                 if digits.startswith("756") and len(digits) >= 13:
-                    # Format it correctly with periods
-                    formatted = digits[:3] + "." + digits[3:7] + "." + digits[7:11]
-                    if len(digits) >= 13:
-                        formatted += "." + digits[11:13]
-                    detected_values['personal_number'] = formatted
-        
-        # Check field labels in detected language for insurance number
-        if any(label in text for label in FIELD_LABELS['insurance_number'][detected_lang]):
-            # Extract the number from this text or the next item
-            number = ''.join(filter(str.isdigit, text))
-            if number and len(number) >= 6:
-                detected_values['insurance_number'] = number
-            elif idx + 1 < len(results):
-                next_text = results[idx + 1][1][0].strip()
-                number = ''.join(filter(str.isdigit, next_text))
-                if number and len(number) >= 6:
-                    detected_values['insurance_number'] = number
-        
+                    detected_values['personal_number'] = (f"{digits[:3]}.{digits[3:7]}.{digits[7:11]}.{digits[11:13]}", (idx,))
+
+        # Insurance number label: extract the number from this text or the next item.
+        # Whether the label counts depends on the card language, which is resolved after the pass.
+        if not hits.isdisjoint(_INSURANCE_NUMBER_KEYS):
+            number, source = _digits(text), idx
+            if len(number) < 6 and idx + 1 < len(texts):
+                number, source = _digits(texts[idx + 1].strip()), idx + 1
+            if len(number) >= 6:
+                insurance_numbers.append((hits, number, source))
+
         # Universal insurance code-name detection
         # This handles both combined format "0032 - Aquilana" and separate occurrences
-        if '-' in text and prob > 0.6:
+        if prob > 0.6 and '-' in text:
             parts = [p.strip() for p in text.split('-')]
             if len(parts) == 2:
                 # First part should contain the insurance code (4-5 digits)
-                code = ''.join(filter(str.isdigit, parts[0]))
-                if len(code) >= 4 and len(code) <= 5:
-                    detected_values['insurance_code'] = code
-                    
+                code = _digits(parts[0])
+                if 4 <= len(code) <= 5:
+                    detected_values['insurance_code'] = (code, (idx,))
                     # Second part is the insurance name
                     if parts[1]:
-                        detected_values['insurance_name'] = parts[1].split()[0]  # Take first word
-        
+                        detected_values['insurance_name'] = (parts[1].split()[0], (idx,))  # Take first word
+
         # If we find a standalone numeric code that looks like an insurance code
-        elif text.isdigit() and len(text) in (4, 5) and prob > 0.7:
-            detected_values['insurance_code'] = text
-            
+        elif prob > 0.7 and len(text) in (4, 5) and text.isdigit():
+            detected_values['insurance_code'] = (text, (idx,))
+
             # Check if the next text might be the insurance provider name
-            if idx + 1 < len(results):
-                next_text = results[idx + 1][1][0].strip()
-                next_prob = results[idx + 1][1][1]
-                
+            if idx + 1 < len(texts):
+                next_text, next_prob = texts[idx + 1].strip(), scores[idx + 1]
                 if next_prob > 0.7 and len(next_text) > 2 and next_text[0].isupper():
                     if not any(c.isdigit() for c in next_text):  # No digits in insurance name
-                        detected_values['insurance_name'] = next_text.split()[0]
-        
+                        detected_values['insurance_name'] = (next_text.split()[0], (idx + 1,))
+
         # Card number detection - typically starts with "80756" followed by many digits
-        if text.startswith("80756") and len(text) > 15 and prob > 0.7:
-            detected_values['card_number'] = text
-        
+        if prob > 0.7 and len(text) > 15 and text.startswith("80756"):
+            detected_values['card_number'] = (text, (idx,))
+
         # Date detection - finds both birth dates and expiry dates in DD/MM/YYYY format
-        if len(text) == 10 and text.count("/") == 2:
-            try:
-                day, month, year = map(int, text.split("/"))
-                # Basic date validation
+        if len(text) == 10:
+            match = _DATE_PATTERN.fullmatch(text)
+            if match:
+                day, month, year = map(int, match.groups())
                 if 1 <= day <= 31 and 1 <= month <= 12 and 1900 <= year <= 2100:
-                    # Convert to datetime object for proper comparison
-                    detected_date = datetime(year, month, day)
-                    current_date = datetime.now()
-                    
-                    # If date is in the future, it's likely an expiry date
-                    if detected_date > current_date:
-                        detected_values['expiry_date'] = text
-                    # If date is in the past, it's likely a birth date
-                    else:
-                        detected_values['birth_date'] = text
-            except (ValueError, TypeError):
-                # Skip invalid dates
-                pass
-    
-    # Sort potential names by vertical (y) position first, then horizontal (x) position
-    potential_names.sort(key=lambda x: (x[1], x[2]))
-    
-    # Filter out potential names that have already been assigned to other fields
-    # particularly the insurance name
-    filtered_names = []
-    for name_tuple in potential_names:
-        name_text = name_tuple[0]
-        # Skip this text if it's already identified as insurance name or other non-name fields
-        is_duplicate = False
-        for field, value in detected_values.items():
-            if field not in ['surname', 'first_name'] and value == name_text:
-                is_duplicate = True
-                break
-        
-        if not is_duplicate:
-            filtered_names.append(name_tuple)
-    
-    if filtered_names:
-        if len(filtered_names) >= 2:
-            # If multiple names are detected, use a simple convention based on health card layouts:
-            # The first name in order (higher on card) is the surname
-            # The second name in order (lower on card) is the first name
-            detected_values['surname'] = filtered_names[0][0]
-            detected_values['first_name'] = ' '.join([name[0] for name in filtered_names[1:]])
-            print(f"Names assigned: surname={detected_values['surname']}, first_name={detected_values['first_name']}")
-        elif len(filtered_names) == 1:
-            # If only one name is detected, assume it's the surname
-            detected_values['surname'] = filtered_names[0][0]
-            print(f"Single name detected: surname={detected_values['surname']}")
-    
-    for key, value in detected_values.items():
-        print(f"- {key}: {value}")
-        
+                    try:
+                        detected_date = datetime(year, month, day)
+                    except ValueError:
+                        detected_date = None
+                    # Future dates are expiry dates, past dates are birth dates
+                    if detected_date is not None:
+                        if detected_date > current_date:
+                            detected_values['expiry_date'] = (text, (idx,))
+                        else:
+                            detected_values['birth_date'] = (text, (idx,))
+
+    detected_lang = _best_language(language_scores)
+    card_info.detected_language = detected_lang
+
+    for hits, number, source in insurance_numbers:
+        if ('insurance_number', detected_lang) in hits:
+            detected_values['insurance_number'] = (number, (source,))
+
+    # Drop name candidates that are field labels or excluded words in the card language,
+    # or that were already assigned to another field (e.g. the insurance name)
+    assigned = {value for field, (value, _) in detected_values.items() if field not in ('surname', 'first_name')}
+    names = [
+        (text, idx) for text, idx in name_candidates
+        if not _is_excluded_name(text, detected_lang) and text not in assigned
+    ]
+    # Sort by vertical (y) position first, then horizontal (x) position
+    names.sort(key=lambda name: (lines.tops[name[1]], lines.lefts[name[1]]))
+
+    if len(names) >= 2:
+        # If multiple names are detected, use a simple convention based on health card layouts:
+        # The first name in order (higher on card) is the surname
+        # The following names (lower on card) are the first names
+        detected_values['surname'] = (names[0][0], (names[0][1],))
+        detected_values['first_name'] = (' '.join(name[0] for name in names[1:]), tuple(name[1] for name in names[1:]))
+    elif len(names) == 1:
+        # If only one name is detected, assume it's the surname
+        detected_values['surname'] = (names[0][0], (names[0][1],))
+
     # Update card_info with detected values
-    for field, value in detected_values.items():
-        setattr(card_info, field, value)
-    
+    for field, (value, sources) in detected_values.items():
+        if debug:
+            logger.debug(f"- {field}: {value}")
+        card_info.set(field, value, min(scores[idx] for idx in sources), sources)
+
     return card_info
 
-def process_image_ocr(image):
+def detect_text_boxes(engine, image):
+    """Run the text detector and return the boxes as an (n, 4, 2) array; OcrLines puts them in reading order."""
+    dt_boxes, _ = engine.text_detector(image)
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return np.empty((0, 4, 2), dtype=np.float32)
+    return np.asarray(dt_boxes, dtype=np.float32)
+
+def classify_crops(engine, crops):
+    """Rotate upside-down text crops using the angle classifier."""
+    if engine.text_classifier is None or not crops:
+        return crops
+    crops, _, _ = engine.text_classifier(crops)
+    return crops
+
+def classify_crops_sampled(engine, crops, sample):
+    """
+    Run the angle classifier on the sample widest crops first. Cards are upright in the common case,
+    so unless one of those reads upside down the other crops are returned without classification.
+    Returns (crops, skipped): skipped is True if the remaining crops were not classified.
+    """
+    if engine.text_classifier is None or not sample or len(crops) <= sample:
+        return classify_crops(engine, crops), False
+    widest = sorted(range(len(crops)), key=lambda i: crops[i].shape[1], reverse=True)[:sample]
+    sampled, cls_res, _ = engine.text_classifier([crops[i] for i in widest])
+    threshold = engine.text_classifier.cls_thresh
+    if not any(label == '180' and score > threshold for label, score in cls_res):
+        return crops, True
+
+    crops = list(crops)
+    for i, crop in zip(widest, sampled):
+        crops[i] = crop
+    rest = [i for i in range(len(crops)) if i not in set(widest)]
+    for i, crop in zip(rest, classify_crops(engine, [crops[i] for i in rest])):
+        crops[i] = crop
+    return crops, False
+
+def recognize_crops(engine, crops):
+    """Recognize a list of text crops in one call. Returns a list of (text, confidence)."""
+    if not crops:
+        return []
+    rec_res, _ = engine.text_recognizer(crops)
+    return rec_res
+
+def recognize_with_pool(crops):
+    """Recognize crops with an engine checked out from the pool."""
+    with get_engine_pool().engine() as ocr:
+        return recognize_crops(ocr, crops)
+
+def run_ocr(image, cls=True):
+    """
+    Run text detection, angle classification and recognition on a prepared image.
+    The stages are run one by one (rather than through PaddleOCR.ocr) so each can be timed.
+    Args:
+        image: enhanced grayscale or BGR image
+        cls: whether to run the angle classifier
+    Returns:
+        lines: OcrLines at or above the engine's drop score, in reading order
+    """
+    import cv2
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        # The converted copy is released when this function returns
+        metrics.allocated(image.nbytes)
+        converted_bytes = image.nbytes
+    else:
+        converted_bytes = 0
+
+    batcher = get_batcher()
+    rec_res = []
+    with get_engine_pool().engine() as ocr:
+        with metrics.stage("detection"):
+            boxes = detect_text_boxes(ocr, image)
+            crops = [crop_text_region(image, box) for box in boxes]
+        crop_bytes = sum(crop.nbytes for crop in crops)
+        metrics.allocated(crop_bytes)
+        if cls:
+            with metrics.stage("classification"):
+                crops, skipped = classify_crops_sampled(ocr, crops, config.OCR_CLS_SAMPLE)
+            metrics.count("classification_skipped", int(skipped))
+        drop_score = ocr.drop_score
+        if batcher is None:
+            with metrics.stage("recognition"):
+                rec_res = recognize_crops(ocr, crops)
+
+    # With batching, recognition runs together with crops from other concurrent requests
+    if batcher is not None and crops:
+        with metrics.stage("recognition"):
+            rec_res = batcher.recognize(crops)
+    metrics.released(crop_bytes)
+
+    lines = OcrLines.from_recognition(boxes, rec_res).above(drop_score)
+    metrics.count("text_lines", len(lines))
+    metrics.count("low_confidence_lines", len(boxes) - len(lines))
+    metrics.released(converted_bytes)
+    return lines
+
+# Text lines angle-classified to decide whether a warped card is upside down
+ORIENTATION_LINES = 5
+
+def card_is_upside_down(engine, card):
     """
-    Process an image through OCR and return the results.
+    Decide whether a warped card is upside down: text lines are detected on a half-size copy and
+    the ORIENTATION_LINES widest are angle-classified. The card is upside down if most of them are.
+    """
+    import cv2
+    small = cv2.resize(card, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    crops = [crop_text_region(small, box) for box in detect_text_boxes(engine, small)]
+    widest = sorted(crops, key=lambda crop: crop.shape[1], reverse=True)[:ORIENTATION_LINES]
+    if not widest:
+        return False
+    _, cls_res, _ = engine.text_classifier(widest)
+    threshold = engine.text_classifier.cls_thresh
+    flipped = sum(1 for label, score in cls_res if label == '180' and score > threshold)
+    return flipped * 2 > len(cls_res)
+
+def orient_card(card, matrix):
+    """
+    Turn a warped card upright. The warp only makes the card landscape: a card photographed upside
+    down, or in portrait and turned the wrong way, comes out rotated by 180 degrees.
+    Returns (card, matrix) with the transform from image to card coordinates updated to match.
+    """
+    import cv2
+    with get_engine_pool().engine() as ocr:
+        if ocr.text_classifier is None or not card_is_upside_down(ocr, card):
+            return card, matrix
+    h, w = card.shape[:2]
+    rotation = np.float32([[-1, 0, w - 1], [0, -1, h - 1], [0, 0, 1]])
+    metrics.count("cards_turned")
+    return cv2.rotate(card, cv2.ROTATE_180), (rotation @ matrix).astype(np.float32)
+
+def normalize_upright_card(image):
+    """
+    Normalize the card with normalize_card and, when its outline was found, turn it upright.
+    Returns (card, matrix, found) like normalize_card.
+    """
+    with metrics.stage("normalize"):
+        card, matrix, found = normalize_card(image, config.CARD_WIDTH)
+    if found and config.CARD_ORIENTATION_CHECK:
+        with metrics.stage("orientation"):
+            card, matrix = orient_card(card, matrix)
+    return card, matrix, found
+
+def process_image_ocr(image, normalized=None):
+    """
+    Process an image through OCR and return the recognized lines.
     Args:
         image: numpy array of the image
+        normalized: optional (card, matrix, found) from normalize_upright_card, to avoid repeating it
+    Returns:
+        lines: OcrLines with boxes in original image coordinates, in reading order on the card
+    """
+    if not config.CARD_NORMALIZE:
+        with metrics.stage("enhance"):
+            enhanced = enhance_image(image)
+        with metrics.holding(enhanced.nbytes):
+            return run_ocr(enhanced, cls=True)
+
+    if normalized is None:
+        normalized = normalize_upright_card(image)
+    card, matrix, found = normalized
+    offset = (0, 0)
+    if found and config.CARD_CROP_FIELDS:
+        card, offset = field_band(card)
+
+    with metrics.stage("enhance"):
+        enhanced = enhance_image(card)
+    # A card whose outline was found has been turned upright, so its lines need no angle classification
+    with metrics.holding(enhanced.nbytes):
+        lines = run_ocr(enhanced, cls=not (found and config.CARD_ORIENTATION_CHECK))
+    return restore_box_coordinates(lines, matrix, offset)
+
+TEMPLATE_REQUIRED_FIELDS = ('surname', 'first_name', 'birth_date', 'personal_number', 'card_number')
+
+def _parse_template_field(field, text, lang):
+    """
+    Validate and normalize the value read from a single field region. Returns "" if invalid.
+    Names get the same checks as in extract_card_info, with the labels and excluded words of lang.
+    """
+    text = text.strip()
+    if field in ('surname', 'first_name'):
+        return text if _looks_like_name(text) and not _is_excluded_name(text, lang) else ""
+    if field in ('birth_date', 'expiry_date'):
+        match = re.fullmatch(r'(\d{2})[/.](\d{2})[/.](\d{4})', text.replace(' ', ''))
+        if not match:
+            return ""
+        day, month, year = map(int, match.groups())
+        try:
+            datetime(year, month, day)
+        except ValueError:
+            return ""
+        return f"{day:02d}/{month:02d}/{year}"
+    digits = _digits(text)
+    if field == 'personal_number':
+        if digits.startswith('756') and len(digits) == 13:
+            return f"{digits[:3]}.{digits[3:7]}.{digits[7:11]}.{digits[11:]}"
+        return ""
+    if field == 'card_number':
+        return digits if digits.startswith('80756') and len(digits) > 15 else ""
+    return text
+
+def _parse_region(region, text, lang):
+    """Parse the text read in one field region of a card in lang. Returns a dict with the valid field values found."""
+    if region == 'insurance_code':
+        # Field 7 reads like "0032 - Aquilana"
+        code, _, name = text.partition('-')
+        code = _digits(code)
+        if not 4 <= len(code) <= 5:
+            return {}
+        if name.strip():
+            return {'insurance_code': code, 'insurance_name': name.strip().split()[0]}
+        return {'insurance_code': code}
+    value = _parse_template_field(region, text, lang)
+    return {region: value} if value else {}
+
+def extract_card_info_from_fields(lines, fields, detected_lang):
+    """
+    Fill a HealthCardInfo from text recognized in the fixed field regions.
+    Args:
+        lines: OcrLines whose first lines were read from the regions of fields, in that order
+        fields: field name of each region
+        detected_lang: card language
+    Returns:
+        (card_info, confidence): confidence is the lowest score among required fields,
+        or 0 if any required field is missing or malformed
+    """
+    card_info = HealthCardInfo(lines)
+    card_info.detected_language = detected_lang
+    confidence = 1.0
+
+    scores = lines.scores.tolist()
+    for idx, field in enumerate(fields):
+        values = _parse_region(field, lines.texts[idx], detected_lang)
+        for name, value in values.items():
+            card_info.set(name, value, scores[idx], (idx,))
+        if field in TEMPLATE_REQUIRED_FIELDS:
+            confidence = min(confidence, scores[idx] if values else 0.0)
+
+    return card_info, confidence
+
+def process_card_template(image, normalized=None):
+    """
+    Read a card by recognizing only the known field regions, without text detection.
+    Returns (lines, card_info), or None if the card is not found or the template
+    read is not confident enough, in which case the full OCR path should be used.
+    """
+    import cv2
+    card, matrix, found = normalized or normalize_upright_card(image)
+    if not found:
+        return None
+
+    with metrics.stage("enhance"):
+        enhanced = cv2.cvtColor(enhance_image(card), cv2.COLOR_GRAY2BGR)
+    value_boxes = field_value_boxes(enhanced)
+    fields = list(value_boxes)
+    # The birth date label is read as well so the card language can be detected
+    boxes = [value_boxes[field] for field in fields] + [field_label_box(enhanced, 'birth_date')]
+    crops = [crop_text_region(enhanced, box) for box in boxes]
+
+    batcher = get_batcher()
+    with metrics.holding(enhanced.nbytes + sum(crop.nbytes for crop in crops)), metrics.stage("recognition"):
+        rec_res = batcher.recognize(crops) if batcher is not None else recognize_with_pool(crops)
+
+    # Kept in region order, so line i was read from the region of fields[i]
+    lines = OcrLines.from_recognition(boxes, rec_res, sort=False)
+    with metrics.stage("extract"):
+        detected_lang = detect_card_language(lines[[len(fields)]])
+        card_info, confidence = extract_card_info_from_fields(lines, fields, detected_lang)
+    if confidence < config.CARD_TEMPLATE_MIN_CONFIDENCE:
+        logger.debug(f"Template read not confident enough ({confidence:.2f}), falling back to full OCR")
+        return None
+
+    metrics.count("text_lines", len(lines))
+    card_info.lines = restore_box_coordinates(lines, matrix)
+    return card_info.lines, card_info
+
+def check_image_quality(image, found=None):
+    """
+    Reject photos that cannot be read before any inference runs.
+    Args:
+        image: the normalized card, or the photo when normalization is disabled
+        found: whether the card outline was found (None if unknown)
+    Raises:
+        ImageQualityError: with advice on how to take a better photo
+    """
+    sharpness, brightness = image_quality(image)
+    logger.debug(f"Image quality: sharpness {sharpness:.0f}, brightness {brightness:.0f}")
+    if brightness < config.QUALITY_MIN_BRIGHTNESS:
+        raise ImageQualityError("too_dark", f"Image is too dark (brightness {brightness:.0f}, minimum "
+                                f"{config.QUALITY_MIN_BRIGHTNESS:.0f}). Take the photo in better light.")
+    if brightness > config.QUALITY_MAX_BRIGHTNESS:
+        raise ImageQualityError("too_bright", f"Image is overexposed (brightness {brightness:.0f}, maximum "
+                                f"{config.QUALITY_MAX_BRIGHTNESS:.0f}). Avoid direct light and glare on the card.")
+    if sharpness < config.QUALITY_MIN_SHARPNESS:
+        raise ImageQualityError("blurry", f"Image is too blurry (sharpness {sharpness:.0f}, minimum "
+                                f"{config.QUALITY_MIN_SHARPNESS:.0f}). Hold the camera steady and make sure "
+                                f"the card is in focus.")
+    if found is False and config.QUALITY_REQUIRE_CARD:
+        raise ImageQualityError("card_not_found", "No card found in the image. Photograph the whole card "
+                                "on a plain background that contrasts with it.")
+
+def missing_fields(card_info):
+    """Return the required fields that were not read, or were read below CARD_SECOND_PASS_MIN_CONFIDENCE."""
+    return [
+        field for field in config.CARD_REQUIRED_FIELDS
+        if not getattr(card_info, field)
+        or card_info.confidence.get(field, 0.0) < config.CARD_SECOND_PASS_MIN_CONFIDENCE
+    ]
+
+def read_missing_fields(card, matrix, card_info):
+    """
+    Second pass for the required fields the first pass missed or read with low confidence: only
+    their regions on the normalized card are read again, upscaled and with stronger enhancement.
+    A field read again is set on card_info if it was empty or the new read is more confident,
+    and the second-pass lines are appended to card_info.lines.
+    Returns:
+        lines: the lines of both passes, in original image coordinates
+    """
+    h, w = card.shape[:2]
+    scale = config.CARD_SECOND_PASS_SCALE
+    # Insurance code and name share a region
+    regions = dict.fromkeys('insurance_code' if field == 'insurance_name' else field
+                            for field in missing_fields(card_info))
+    first = card_info.lines
+    second = OcrLines.empty()
+    value_boxes = field_value_boxes(card)
+    for region in regions:
+        if region not in FIELD_REGIONS:
+            continue
+        x0, y0, x1, y1 = FIELD_REGIONS[region]
+        left, top = int(x0 * w), int(y0 * h)
+        # Values are only taken from the value box below the field label, in region coordinates
+        value_top = value_boxes[region][0][1] - top
+        with metrics.stage("enhance"):
+            enhanced = enhance_region(card[top:int(y1 * h), left:int(x1 * w)], scale)
+        # The card outline was found, so the card has been turned upright
+        with metrics.holding(enhanced.nbytes):
+            lines = run_ocr(enhanced, cls=not config.CARD_ORIENTATION_CHECK)
+        metrics.count("second_pass_fields")
+
+        # Indices in the combined lines of both passes
+        first_index = len(first) + len(second)
+        centers = (lines.boxes[:, :, 1].mean(axis=1) / scale).tolist()
+        for idx, (text, prob) in enumerate(zip(lines.texts, lines.scores.tolist())):
+            # Skip the field label printed above the value, and text outside the value box
+            if prob <= 0.7 or centers[idx] < value_top or _LABEL_PATTERN.search(text):
+                continue
+            for field, value in _parse_region(region, text, card_info.detected_language).items():
+                if not getattr(card_info, field) or prob > card_info.confidence.get(field, 0.0):
+                    card_info.set(field, value, prob, (first_index + idx,))
+                    metrics.count("second_pass_recovered")
+        second = second.concat(lines.with_boxes(lines.boxes / scale + np.float32([left, top])))
+
+    card_info.lines = first.concat(restore_box_coordinates(second, matrix))
+    return card_info.lines
+
+def check_insurer(card_info):
+    """
+    Cross-check the insurance code and name against the insurer registry and correct them when
+    one of them was misread or missed: the corrected field takes the confidence and source lines
+    of the field it was confirmed by. Values that cannot be reconciled are left as read.
+    """
+    code, name = card_info.insurance_code, card_info.insurance_name
+    if not code and not name:
+        return
+    registry = get_insurer_registry()
+    verdict, insurer = registry.verify(code, name)
+    if verdict == "corrected":
+        # The side that found the insurer vouches for the other one
+        evidence = 'insurance_code' if registry.by_code(code) is insurer else 'insurance_name'
+        confidence, sources = card_info.confidence.get(evidence, 0.0), card_info.sources.get(evidence, ())
+        if code != insurer.code:
+            logger.debug(f"Insurance code corrected: {code!r} -> {insurer.code!r}")
+            card_info.set('insurance_code', insurer.code, confidence, sources)
+        if name != insurer.name:
+            logger.debug(f"Insurance name corrected: {name!r} -> {insurer.name!r}")
+            card_info.set('insurance_name', insurer.name, confidence, sources)
+        metrics.count("insurer_corrected")
+    elif verdict == "mismatch":
+        logger.debug(f"Insurance code {code!r} and name {name!r} do not match a registered insurer")
+        metrics.count("insurer_mismatch")
+
+def read_card(image):
+    """
+    Run OCR on a card image and extract the card information.
+    Unusable photos are rejected before inference. Uses the field template when enabled and
+    confident, the full detection path otherwise, followed by a second pass over the regions
+    of required fields that could not be read. The insurance code and name are then checked
+    against the insurer registry.
     Returns:
-        results: list of OCR results
+        (lines, card_info): OcrLines in original image coordinates; card_info is None if no text was detected
+    Raises:
+        ImageQualityError: if the photo is too blurry, too dark or too bright to read
     """
-    enhanced = enhance_image(image)
-    ocr = PaddleOCR(use_angle_cls=True, lang='latin', show_log=False)
-    results = ocr.ocr(enhanced, cls=True)
-    return results[0] if results else []
+    normalized = None
+    if config.CARD_NORMALIZE:
+        normalized = normalize_upright_card(image)
+    with metrics.holding(normalized[0].nbytes if normalized is not None else 0):
+        if config.QUALITY_CHECK:
+            with metrics.stage("quality"):
+                if normalized is not None:
+                    check_image_quality(normalized[0], normalized[2])
+                else:
+                    check_image_quality(image)
+
+        template = None
+        if config.CARD_TEMPLATE_MODE and normalized is not None:
+            template = process_card_template(image, normalized)
+        if template is not None:
+            lines, card_info = template
+        else:
+            lines = process_image_ocr(image, normalized)
+            if not lines:
+                return lines, None
+            with metrics.stage("extract"):
+                card_info = extract_card_info(lines)
+
+            card, matrix, found = normalized if normalized is not None else (None, None, False)
+            # Field regions are only known on a card whose outline was found
+            if config.CARD_SECOND_PASS and found and missing_fields(card_info):
+                lines = read_missing_fields(card, matrix, card_info)
+
+    if config.INSURER_CHECK:
+        with metrics.stage("insurer"):
+            check_insurer(card_info)
+    return lines, card_info
+
+def _init_worker(counter, threads):
+    """Limit the threads of a batch worker process, optionally pin it, and load its OCR engine."""
+    configure_worker(next_worker_index(counter), threads)
+    init_engine_pool(size=1)
 
-def process_single_image(image_path):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def iter_image_files(directory_path):
+    """Lazily walk a directory tree and yield image paths, one directory at a time."""
+    pending = [directory_path]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Cannot read directory {current}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        # Reverse so subdirectories are visited in name order
+        pending.extend(reversed(subdirs))
+
+def load_checkpoint(manifest_path):
+    """Return the set of image paths already recorded in the checkpoint manifest."""
+    if not os.path.exists(manifest_path):
+        return set()
+    with open(manifest_path, encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+def process_single_image(image_path, annotate_dir=None):
+    """
+    Run OCR on one image file and return a result record for the JSONL output.
+    Args:
+        image_path: path of the image file
+        annotate_dir: if set, an annotated copy of the image is written there
+    Returns:
+        record: dict with the path, status and card info or error message
+    """
+    import cv2
+    start = time.perf_counter()
+    record = {"path": image_path}
+    metrics.start_collection()
     try:
-        output_dir = "detected_results"
-        json_dir = "card_data"
-        os.makedirs(output_dir, exist_ok=True)
-        os.makedirs(json_dir, exist_ok=True)
-
-        print(f"\nProcessing: {os.path.basename(image_path)}")
-        
-        image = cv2.imread(image_path)
-        results = process_image_ocr(image)
-        
-        if not results:
-            print(f"No text detected in {image_path}")
-            return
-        
-        card_info = extract_card_info(results)
-        
-        json_filename = f"card_data_{os.path.splitext(os.path.basename(image_path))[0]}.json"
-        json_path = os.path.join(json_dir, json_filename)
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(card_info.to_dict(), f, ensure_ascii=False, indent=2)
-        
-        annotated = create_annotated_image(image, results)
-        output_path = os.path.join(output_dir, f"detected_{os.path.basename(image_path)}")
-        cv2.imwrite(output_path, annotated)
-        
-        print(f"\nExtracted Card Information for {os.path.basename(image_path)}:")
-        # Custom printing order to ensure names are displayed first
-        display_order = ['surname', 'first_name', 'birth_date', 'personal_number', 'insurance_code', 
-                         'insurance_name', 'card_number', 'expiry_date', 'detected_language']
-        card_dict = card_info.to_dict()
-        for key in display_order:
-            if card_dict.get(key):
-                print(f"{key}: {card_dict[key]}")
+        with metrics.stage("decode"):
+            with open(image_path, 'rb') as f:
+                contents = f.read()
+            with metrics.holding(len(contents)):
+                image = decode_image(contents, config.DECODE_MAX_SIDE)
+            del contents
+        if image is None:
+            record.update(status="error", error="Invalid image file")
+            return record
+        metrics.allocated(image.nbytes)
+
+        lines, card_info = read_card(image)
+        if card_info is None:
+            record.update(status="no_text")
+            return record
+
+        record.update(status="success", card_info=card_info.to_dict(),
+                      field_confidence={field: round(score, 4) for field, score in card_info.confidence.items()})
+
+        if annotate_dir:
+            with metrics.stage("annotate"):
+                annotated = create_annotated_image(image, lines, in_place=True)
+                output_path = os.path.join(annotate_dir, f"detected_{os.path.basename(image_path)}")
+                cv2.imwrite(output_path, annotated)
+    except ImageQualityError as e:
+        record.update(status="rejected", reason=e.reason, error=e.message)
     except Exception as e:
         print(f"Error processing {image_path}: {str(e)}")
+        record.update(status="error", error=str(e))
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        card_metrics = metrics.collected()
+        record["timings"] = {name: round(seconds, 4) for name, seconds in card_metrics["timings"].items()}
+        record["peak_bytes"] = card_metrics["peak_bytes"]
+    return record
+
+class BatchProgress:
+    """Tracks throughput and ETA while a batch runs."""
+
+    def __init__(self, skipped=0, report_every=10.0):
+        self.skipped = skipped
+        self.report_every = report_every
+        self.total = None  # Filled in by a background count once the walk finishes
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+
+    def count_in_background(self, directory_path):
+        def count():
+            self.total = sum(1 for _ in iter_image_files(directory_path))
+        threading.Thread(target=count, daemon=True).start()
+
+    def update(self, record):
+        self.done += 1
+        if record["status"] == "error":
+            self.failed += 1
+        now = time.perf_counter()
+        if now - self._last_report >= self.report_every:
+            self._last_report = now
+            print(self.summary())
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"Processed {self.done} images ({self.failed} failed, {self.skipped} skipped) - {rate:.2f} images/s"
+        if self.total is not None and rate > 0:
+            remaining = max(0, self.total - self.skipped - self.done)
+            line += f" - {remaining} left, ETA {remaining / rate:.0f}s"
+        return line
+
+def process_images(directory_path, output_path="card_data/results.jsonl", workers=None,
+                   annotate=False, chunksize=4):
+    """
+    Process every image under directory_path and append one JSON line per image to output_path.
+    Finished images are recorded in a checkpoint manifest next to the output,
+    so an interrupted run can be restarted and skips work already done. Images that failed with
+    an error (which may be temporary, e.g. out of memory or an unreadable share) are not recorded,
+    so the next run tries them again.
+    Without workers, the available CPUs are divided into workers of OCR_INTRA_OP_THREADS threads (1 if unset).
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    annotate_dir = "detected_results" if annotate else None
+    if annotate_dir:
+        os.makedirs(annotate_dir, exist_ok=True)
+
+    manifest_path = output_path + ".done"
+    completed = load_checkpoint(manifest_path)
+    if completed:
+        print(f"Resuming: {len(completed)} images already processed")
+
+    progress = BatchProgress(skipped=len(completed))
+    progress.count_in_background(directory_path)
+    pending = (path for path in iter_image_files(directory_path) if path not in completed)
+    worker = partial(process_single_image, annotate_dir=annotate_dir)
+    workers, threads = resolve_topology(workers)
+    print(f"Processing with {workers} worker(s) x {threads} thread(s)")
+
+    with Pool(processes=workers, initializer=_init_worker, initargs=(worker_counter(), threads)) as pool, \
+            open(output_path, 'a', encoding='utf-8') as output, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest:
+        for record in pool.imap_unordered(worker, pending, chunksize=chunksize):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            # Only mark the image done once its result line is written
+            if record["status"] != "error":
+                manifest.write(record["path"] + "\n")
+                manifest.flush()
+            progress.update(record)
 
-def process_images(directory_path):
-    output_dir = "detected_results"
-    json_dir = "card_data"
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(json_dir, exist_ok=True)
-    
-    image_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path)
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    
-    with Pool() as pool:
-        pool.map(process_single_image, image_files)
+    print(progress.summary())
 
 if __name__ == "__main__":
-    process_images("ids")
+    parser = argparse.ArgumentParser(description="Extract health insurance card data from a directory of images")
+    parser.add_argument("directory", nargs="?", default="ids", help="Directory to scan recursively for card images")
+    parser.add_argument("--output", default="card_data/results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPUs / OCR_INTRA_OP_THREADS)")
+    parser.add_argument("--chunksize", type=int, default=4, help="Images handed to a worker at a time")
+    parser.add_argument("--annotate", action="store_true", help="Also write annotated images to detected_results/")
+    args = parser.parse_args()
+    process_images(args.directory, output_path=args.output, workers=args.workers,
+                   annotate=args.annotate, chunksize=args.chunksize)
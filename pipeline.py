@@ -0,0 +1,109 @@
+import base64
+import config
+import metrics
+from ocr_lines import OcrLines
+from ocr_reader import ImageQualityError, read_card
+from utils import decode_image, encode_image_to_base64, encode_image_to_jpeg, create_annotated_image
+
+
+class CardProcessingError(Exception):
+    """Raised when a card cannot be processed, carrying the HTTP status and an optional reason code to report."""
+
+    def __init__(self, status_code, message, reason=None):
+        # Keep all values in args so the error survives pickling from a worker process
+        super().__init__(status_code, message, reason)
+        self.status_code = status_code
+        self.message = message
+        self.reason = reason
+
+    def __str__(self):
+        return self.message
+
+
+IMAGE_OPTIONS = ("all", "annotated", "none")
+
+def card_images(contents, image, lines, images="all", inline=True):
+    """
+    Build the response images of a card: the uploaded original and the image annotated with the OCR lines.
+    Returns None if images is "none". The image is drawn on, so pass a copy if it is still needed.
+    """
+    if images == "none":
+        return None
+    encode = encode_image_to_base64 if inline else encode_image_to_jpeg
+    response_images = {}
+    if images == "all":
+        # The client's own bytes are returned as the original instead of re-encoding the image
+        with metrics.stage("encode"):
+            response_images["original"] = base64.b64encode(contents).decode('utf-8') if inline else contents
+        if inline:
+            metrics.allocated(len(response_images["original"]))
+    with metrics.stage("annotate"):
+        annotated = create_annotated_image(image, lines, in_place=True)
+    with metrics.stage("encode"):
+        response_images["annotated"] = encode(annotated)
+    metrics.allocated(len(response_images["annotated"]))
+    return response_images
+
+def rebuild_card_images(contents, results, images="all", inline=True):
+    """
+    Rebuild the response images of a card answered from the result cache, from the upload and the
+    OCR lines cached with the result (in PaddleOCR's result format). No OCR is run.
+    Returns (response_images, card_metrics).
+    """
+    metrics.start_collection()
+    with metrics.stage("decode"):
+        image = decode_image(contents, config.DECODE_MAX_SIDE)
+    if image is None:
+        raise CardProcessingError(400, "Invalid image file")
+    response_images = card_images(contents, image, OcrLines.from_results(results, sort=False), images, inline)
+    return response_images, metrics.collected()
+
+def process_card_bytes(contents, images="all", inline=True, keep_lines=False):
+    """
+    Run the full card pipeline on an uploaded image.
+    This is CPU-bound and meant to run in a worker thread or process, not on the event loop.
+    Args:
+        contents: raw bytes of the uploaded image
+        images: which images to return - "all", "annotated" or "none"
+        inline: return images as base64 strings, or as raw encoded bytes for the caller to store
+        keep_lines: also return the OCR lines under "lines", in PaddleOCR's result format, so the images
+            can be rebuilt later with rebuild_card_images
+    Returns:
+        (response_data, card_metrics): the response dict with card info, confidence scores and
+        the requested images, and the stage timings, counts and peak memory collected for this card
+    """
+    metrics.start_collection()
+    metrics.allocated(len(contents))
+
+    # Decoded at reduced resolution; a 12MP photo is never held at full size
+    with metrics.stage("decode"):
+        image = decode_image(contents, config.DECODE_MAX_SIDE)
+
+    if image is None:
+        raise CardProcessingError(400, "Invalid image file")
+    metrics.allocated(image.nbytes)
+
+    # Process image with OCR and extract card information
+    try:
+        lines, card_info = read_card(image)
+    except ImageQualityError as e:
+        raise CardProcessingError(422, e.message, e.reason)
+
+    if card_info is None:
+        raise CardProcessingError(422, "No text detected in the image")
+
+    response_images = card_images(contents, image, lines, images, inline)
+
+    confident = lines[lines.scores > 0.5]
+    response_data = {
+        "status": "success",
+        "card_info": card_info.to_dict(),
+        "field_confidence": {field: round(score, 4) for field, score in card_info.confidence.items()},
+        "confidence_scores": {
+            text: f"{score:.2%}" for text, score in zip(confident.texts, confident.scores.tolist())
+        },
+        "images": response_images,
+    }
+    if keep_lines:
+        response_data["lines"] = lines.to_results()
+    return response_data, metrics.collected()
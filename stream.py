@@ -0,0 +1,140 @@
+import config
+from ocr_reader import HealthCardInfo
+from utils import decode_image, image_quality
+
+# Frames are scored on a copy decoded at this size; JPEG DCT scaling makes that a few milliseconds
+SCORE_SIDE = 500
+# Frames are compared for motion on tiny grayscale thumbnails of this size
+THUMBNAIL_SIZE = (64, 40)
+
+
+def score_frame(contents):
+    """
+    Cheap measures of one camera frame, to choose which frames are worth running OCR on.
+    Returns (sharpness, thumbnail): the variance of the Laplacian at SCORE_SIDE pixels and a small
+    grayscale thumbnail for motion_between, or None if the frame cannot be decoded.
+    """
+    import cv2
+    image = decode_image(contents, SCORE_SIDE)
+    if image is None:
+        return None
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    sharpness, _ = image_quality(gray, SCORE_SIDE)
+    thumbnail = cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return sharpness, thumbnail
+
+
+def motion_between(previous, thumbnail):
+    """Mean absolute gray level difference between two frame thumbnails (0-255)."""
+    import cv2
+    if previous is None:
+        return 0.0
+    return float(cv2.absdiff(previous, thumbnail).mean())
+
+
+class FrameSelector:
+    """
+    Keeps the sharpest usable frame received since OCR last took one. Blurry frames and frames
+    taken while the card or camera moved are dropped, and while OCR is busy with one frame the
+    following ones only compete for the next slot, so most frames of a burst are never read.
+    """
+
+    def __init__(self, min_sharpness=None, max_motion=None):
+        self.min_sharpness = config.STREAM_MIN_SHARPNESS if min_sharpness is None else min_sharpness
+        self.max_motion = config.STREAM_MAX_MOTION if max_motion is None else max_motion
+        self._previous = None
+        self._best = None  # (sharpness, contents)
+
+    def offer(self, contents, sharpness, thumbnail):
+        """Consider a scored frame. Returns True if it is now the best candidate."""
+        motion = motion_between(self._previous, thumbnail)
+        self._previous = thumbnail
+        if sharpness < self.min_sharpness or motion > self.max_motion:
+            return False
+        if self._best is not None and sharpness <= self._best[0]:
+            return False
+        self._best = (sharpness, contents)
+        return True
+
+    def take(self):
+        """Return the best candidate frame and clear it, or None if there is none."""
+        best, self._best = self._best, None
+        return best[1] if best is not None else None
+
+
+class CardFusion:
+    """
+    Fuses the fields read from several frames of the same card by confidence voting: every frame
+    votes for the value it read with that field's confidence, and the value with the highest total wins.
+    A field is stable once its winner was read in at least stable_frames frames and holds the majority
+    of the votes. A field that is not required may also settle on being absent: when at least
+    stable_frames frames, and most frames, did not read it.
+    """
+
+    def __init__(self, stable_frames=None, required_fields=None):
+        self.stable_frames = config.STREAM_STABLE_FRAMES if stable_frames is None else stable_frames
+        self.required_fields = config.CARD_REQUIRED_FIELDS if required_fields is None else required_fields
+        self.frames = 0
+        self._votes = {field: {} for field in HealthCardInfo.FIELDS}  # field -> value -> [weight, frames]
+        self._languages = {}
+
+    def add(self, card_info, field_confidence):
+        """Add the card_info dict and field_confidence read from one frame."""
+        self.frames += 1
+        for field, votes in self._votes.items():
+            value = card_info.get(field)
+            if not value:
+                continue
+            vote = votes.setdefault(value, [0.0, 0])
+            vote[0] += field_confidence.get(field, 0.0)
+            vote[1] += 1
+        language = card_info.get("detected_language")
+        if language:
+            self._languages[language] = self._languages.get(language, 0) + 1
+
+    def _absent(self, field):
+        """Whether a field that is not required was not read in enough frames to settle on absent."""
+        if field in self.required_fields:
+            return False
+        missed = self.frames - sum(vote[1] for vote in self._votes[field].values())
+        return missed >= self.stable_frames and missed * 2 > self.frames
+
+    def _winner(self, field):
+        """Return (value, weight, frames) of the leading value of a field, or None if it is absent."""
+        votes = self._votes[field]
+        if not votes or self._absent(field):
+            return None
+        value = max(votes, key=lambda candidate: votes[candidate][0])
+        return value, votes[value][0], votes[value][1]
+
+    def is_stable(self, field):
+        if self._absent(field):
+            return True
+        winner = self._winner(field)
+        if winner is None:
+            return False
+        _, weight, frames = winner
+        total = sum(vote[0] for vote in self._votes[field].values())
+        return frames >= self.stable_frames and weight * 2 > total
+
+    def stable_fields(self):
+        return [field for field in HealthCardInfo.FIELDS if self.is_stable(field)]
+
+    def stable(self):
+        return self.frames > 0 and all(self.is_stable(field) for field in HealthCardInfo.FIELDS)
+
+    def result(self):
+        """
+        Return (card_info, field_confidence) with the winning value of every field. A field's confidence
+        is the total confidence of its winning value divided by the number of frames read, so frames that
+        read another value or nothing count against it.
+        """
+        card_info = {}
+        field_confidence = {}
+        for field in HealthCardInfo.FIELDS:
+            winner = self._winner(field)
+            card_info[field] = winner[0] if winner is not None else ""
+            if winner is not None:
+                field_confidence[field] = round(winner[1] / self.frames, 4)
+        card_info["detected_language"] = max(self._languages, key=self._languages.get) if self._languages else ""
+        return card_info, field_confidence
@@ -0,0 +1,76 @@
+"""
+The exported-model backends must read the same text as Paddle. Every backend runs the same detection,
+classification and recognition stages on the same prepared synthetic cards, and its text lines are
+compared with Paddle's. Skipped unless PaddleOCR, the backend's runtime and the exported models are installed.
+"""
+import os
+import sys
+from collections import Counter
+import pytest
+import config
+from backends import exported_model_path
+from engine_pool import create_engine
+from ocr_lines import OcrLines
+from ocr_reader import classify_crops, detect_text_boxes, extract_card_info, recognize_crops
+from utils import crop_text_region, enhance_image, normalize_card
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from synthetic import generate_card
+
+CARD_COUNT = 20
+MIN_AGREEMENT = 0.98
+
+
+def read_lines(engine, image):
+    """Run the OCR stages with one engine. Returns OcrLines in reading order."""
+    boxes = detect_text_boxes(engine, image)
+    crops = classify_crops(engine, [crop_text_region(image, box) for box in boxes])
+    return OcrLines.from_recognition(boxes, recognize_crops(engine, crops)).above(engine.drop_score)
+
+
+def compare(reference, candidate):
+    """Line agreement, identical cards and cards with identical extracted fields."""
+    matched = total = identical = fields = 0
+    for ref, cand in zip(reference, candidate):
+        matched += sum((Counter(ref.texts) & Counter(cand.texts)).values())
+        total += max(len(ref.texts), len(cand.texts))
+        identical += ref.texts == cand.texts
+        fields += extract_card_info(ref).to_dict() == extract_card_info(cand).to_dict()
+    return {
+        "line_agreement": matched / total if total else 1.0,
+        "identical_cards": identical,
+        "identical_fields": fields,
+    }
+
+
+@pytest.fixture(scope="module")
+def cards():
+    """Synthetic cards prepared the way process_image_ocr prepares them."""
+    import cv2
+
+    prepared = []
+    for seed in range(CARD_COUNT):
+        image, _ = generate_card(seed, noise=6.0, rotation=4.0)
+        card, _, _ = normalize_card(image, config.CARD_WIDTH)
+        prepared.append(cv2.cvtColor(enhance_image(card), cv2.COLOR_GRAY2BGR))
+    return prepared
+
+
+@pytest.fixture(scope="module")
+def reference(cards):
+    pytest.importorskip("paddleocr")
+    engine = create_engine("paddle")
+    return [read_lines(engine, card) for card in cards]
+
+
+@pytest.mark.parametrize("backend", ["onnxruntime", "openvino"])
+def test_backend_reads_the_same_text_as_paddle(backend, request):
+    pytest.importorskip(backend)
+    for model_dir in (config.OCR_DET_MODEL_DIR, config.OCR_REC_MODEL_DIR):
+        if exported_model_path(model_dir, backend) is None:
+            pytest.skip(f"no model exported for {backend} in {model_dir}")
+    cards, reference = request.getfixturevalue("cards"), request.getfixturevalue("reference")
+
+    engine = create_engine(backend)
+    summary = compare(reference, [read_lines(engine, card) for card in cards])
+    assert summary["line_agreement"] >= MIN_AGREEMENT, summary
@@ -0,0 +1,29 @@
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from onnx import TensorProto, helper
+from backends import ExportedModelEngine
+
+
+def write_identity_model(path):
+    """An ONNX model that returns its input, standing in for an exported model."""
+    graph = helper.make_graph(
+        [helper.make_node("Identity", ["x"], ["y"])], "identity",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, None)],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, None)],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+    onnx.save(model, str(path))
+
+
+def test_recognizer_reads_the_dictionary_of_its_own_model_dir(tmp_path):
+    det_dir, rec_dir = tmp_path / "det", tmp_path / "rec"
+    for model_dir in (det_dir, rec_dir):
+        model_dir.mkdir()
+        write_identity_model(model_dir / "inference.onnx")
+    (rec_dir / "latin_dict.txt").write_text("a\nb\nc\n", encoding="utf-8")
+
+    engine = ExportedModelEngine("onnxruntime", use_angle_cls=False, precision="fp32",
+                                 det_model_dir=str(det_dir), rec_model_dir=str(rec_dir))
+    assert engine.text_recognizer._characters.tolist() == ["blank", "a", "b", "c", " "]
@@ -0,0 +1,60 @@
+import json
+import os
+import pytest
+import ocr_reader
+from ocr_reader import load_checkpoint, process_images
+
+
+class InlinePool:
+    """Runs the batch in this process, in order, instead of in worker processes."""
+
+    def __init__(self, processes=None, initializer=None, initargs=()):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return map(func, iterable)
+
+
+@pytest.fixture
+def scans(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_reader, "Pool", InlinePool)
+    directory = tmp_path / "scans"
+    directory.mkdir()
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        (directory / name).write_bytes(b"")
+    return directory
+
+
+def run_batch(monkeypatch, directory, output_path, failing=()):
+    """Process the batch with every image in failing raising an error, and return the paths processed."""
+    processed = []
+
+    def process_single_image(image_path, annotate_dir=None):
+        processed.append(image_path)
+        if image_path.endswith(failing):
+            return {"path": image_path, "status": "error", "error": "Cannot allocate memory"}
+        return {"path": image_path, "status": "success"}
+
+    monkeypatch.setattr(ocr_reader, "process_single_image", process_single_image)
+    process_images(str(directory), output_path=str(output_path), workers=1)
+    return [os.path.basename(path) for path in processed]
+
+
+def test_resume_retries_images_that_failed(scans, tmp_path, monkeypatch):
+    output_path = tmp_path / "results.jsonl"
+    assert run_batch(monkeypatch, scans, output_path, failing=("b.jpg",)) == ["a.jpg", "b.jpg", "c.jpg"]
+    assert {os.path.basename(path) for path in load_checkpoint(str(output_path) + ".done")} == {"a.jpg", "c.jpg"}
+
+    # Only the image that failed is processed again
+    assert run_batch(monkeypatch, scans, output_path) == ["b.jpg"]
+    assert len(load_checkpoint(str(output_path) + ".done")) == 3
+    records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert [record["status"] for record in records if record["path"].endswith("b.jpg")] == ["error", "success"]
+
+    assert run_batch(monkeypatch, scans, output_path) == []
@@ -0,0 +1,84 @@
+import threading
+from batching import RecognitionBatcher
+
+
+class RecordingRecognizer:
+    """Recognizes a crop as its own text and records the size of every batch."""
+
+    def __init__(self, started=None):
+        self.batches = []
+        self.started = started
+
+    def __call__(self, crops):
+        if self.started is not None:
+            self.started.wait()
+        self.batches.append(len(crops))
+        return [(crop, 1.0) for crop in crops]
+
+
+def recognize_concurrently(batcher, requests):
+    results = [None] * len(requests)
+
+    def run(index):
+        results[index] = batcher.recognize(requests[index])
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_results_are_routed_to_each_caller():
+    recognizer = RecordingRecognizer()
+    batcher = RecognitionBatcher(recognizer, max_batch_size=32, max_wait_ms=50)
+    requests = [[f"{index}-{crop}" for crop in range(index + 1)] for index in range(6)]
+    results = recognize_concurrently(batcher, requests)
+    for crops, result in zip(requests, results):
+        assert result == [(crop, 1.0) for crop in crops]
+    assert sum(recognizer.batches) == sum(len(crops) for crops in requests)
+    assert batcher.stats()["batches"] == len(recognizer.batches)
+
+
+def test_recognition_errors_reach_every_caller():
+    def fail(crops):
+        raise RuntimeError("recognizer failed")
+
+    batcher = RecognitionBatcher(fail, max_batch_size=8, max_wait_ms=10)
+    errors = []
+
+    def run():
+        try:
+            batcher.recognize(["crop"])
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == ["recognizer failed"] * 3
+
+
+def test_batches_never_exceed_max_batch_size():
+    # Hold the first batch so the following requests pile up in the queue
+    started = threading.Event()
+    recognizer = RecordingRecognizer(started)
+    batcher = RecognitionBatcher(recognizer, max_batch_size=8, max_wait_ms=50)
+    requests = [[f"{index}-{crop}" for crop in range(size)] for index, size in enumerate([5, 4, 3, 6, 2])]
+    threading.Timer(0.1, started.set).start()
+    results = recognize_concurrently(batcher, requests)
+    assert max(recognizer.batches) <= 8
+    assert sum(recognizer.batches) == 20
+    for crops, result in zip(requests, results):
+        assert result == [(crop, 1.0) for crop in crops]
+
+
+def test_oversized_request_is_split():
+    recognizer = RecordingRecognizer()
+    batcher = RecognitionBatcher(recognizer, max_batch_size=4, max_wait_ms=10)
+    crops = [f"crop-{index}" for index in range(10)]
+    assert batcher.recognize(crops) == [(crop, 1.0) for crop in crops]
+    assert max(recognizer.batches) <= 4
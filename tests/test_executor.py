@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+import api
+from executor import BoundedExecutor, QueueFullError
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not reached in time")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def busy_executor():
+    """A thread executor with one worker and no queue, whose only slot is held until the test ends."""
+    executor = BoundedExecutor("thread", max_workers=1, max_queue=0)
+    release = threading.Event()
+    holder = threading.Thread(target=asyncio.run, args=(executor.submit(release.wait),))
+    holder.start()
+    wait_until(lambda: executor.stats()["in_flight"] == 1)
+    yield executor
+    release.set()
+    holder.join()
+    executor.shutdown()
+
+
+def test_submit_runs_and_records_wait():
+    executor = BoundedExecutor("thread", max_workers=1, max_queue=0)
+    timings = {}
+    try:
+        assert asyncio.run(executor.submit(sum, [1, 2, 3], timings=timings)) == 6
+    finally:
+        executor.shutdown()
+    assert "queue_wait" in timings
+    assert executor.stats()["completed"] == 1
+
+
+def test_submit_rejects_when_full(busy_executor):
+    with pytest.raises(QueueFullError) as excinfo:
+        asyncio.run(busy_executor.submit(sum, [1]))
+    assert excinfo.value.retry_after >= 1
+    assert busy_executor.stats()["rejected"] == 1
+
+
+def test_queue_admits_up_to_max_queue():
+    executor = BoundedExecutor("thread", max_workers=1, max_queue=1)
+    release = threading.Event()
+    holders = [threading.Thread(target=asyncio.run, args=(executor.submit(release.wait),)) for _ in range(2)]
+    try:
+        for holder in holders:
+            holder.start()
+        wait_until(lambda: executor.stats()["in_flight"] == 2)
+        assert executor.stats()["queue_depth"] == 1
+        with pytest.raises(QueueFullError):
+            asyncio.run(executor.submit(sum, [1]))
+    finally:
+        release.set()
+        for holder in holders:
+            holder.join()
+        executor.shutdown()
+
+
+def test_process_card_answers_503_with_retry_after(busy_executor):
+    api.app.state.executor = busy_executor
+    api.app.state.result_cache = None
+    client = TestClient(api.app)
+    response = client.post("/process-card/", files={"file": ("card.jpg", b"\xff\xd8not a card", "image/jpeg")})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_api_does_not_load_heavy_modules():
+    code = "import sys, api; print(sorted(m for m in ('cv2', 'paddle', 'paddleocr') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip().splitlines()[-1] == "[]"
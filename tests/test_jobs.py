@@ -0,0 +1,274 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import pytest
+import api
+import jobs
+from jobs import TIMED_OUT, JobQueue, RedisJobQueue, SqliteJobQueue
+
+PREFIX = "test:jobs"
+
+
+class Clock:
+    """Stands in for the time module in jobs, so leases and delays run out without waiting."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request, clock):
+    """Build a queue on the backend under test; Redis is faked with fakeredis."""
+    if request.param == "sqlite":
+        return lambda **options: SqliteJobQueue(**options)
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    return lambda **options: RedisJobQueue(client, prefix=PREFIX, **options)
+
+
+def test_enqueue_and_reserve(make_queue, clock):
+    queue = make_queue()
+    first = queue.enqueue(b"first", {"images": "all"})
+    clock.advance(1)
+    second = queue.enqueue(b"second", {})
+    assert queue.pending() == 2
+    assert queue.get(first)["status"] == "queued"
+
+    job = queue.reserve()
+    assert (job.id, job.payload, job.options, job.attempts) == (first, b"first", {"images": "all"}, 1)
+    assert queue.get(first)["status"] == "running"
+    assert queue.reserve().id == second
+    assert queue.reserve() is None
+    assert queue.pending() == 0
+
+
+def test_complete_stores_the_result(make_queue):
+    queue = make_queue()
+    job_id = queue.enqueue(b"card", {})
+    job = queue.reserve()
+    assert queue.complete(job, {"surname": "MÜLLER"})
+    record = queue.get(job_id)
+    assert record["status"] == "done" and record["result"] == {"surname": "MÜLLER"}
+    assert "finished" in record
+    # The lease ended with the job
+    assert not queue.complete(job, {"surname": "OTHER"})
+    assert queue.reserve() is None
+
+
+def test_fail_without_retry(make_queue):
+    queue = make_queue(max_attempts=3)
+    job_id = queue.enqueue(b"card", {})
+    assert queue.fail(queue.reserve(), {"error": "No text detected"}, retry=False)
+    record = queue.get(job_id)
+    assert record["status"] == "failed" and record["error"] == {"error": "No text detected"}
+    assert queue.reserve() is None
+
+
+def test_failed_attempt_is_retried_after_the_delay(make_queue, clock):
+    queue = make_queue(max_attempts=3, retry_delay=5)
+    job_id = queue.enqueue(b"card", {})
+    assert queue.fail(queue.reserve(), {"error": "boom"})
+    record = queue.get(job_id)
+    # The error of the last attempt is shown while the job waits for its retry
+    assert record["status"] == "queued" and record["error"] == {"error": "boom"}
+    assert queue.reserve() is None
+
+    clock.advance(6)
+    job = queue.reserve()
+    assert job.id == job_id and job.attempts == 2
+
+
+def test_retry_limit(make_queue, clock):
+    queue = make_queue(max_attempts=2, retry_delay=5)
+    job_id = queue.enqueue(b"card", {})
+    assert queue.fail(queue.reserve(), {"error": "boom"})
+    clock.advance(6)
+    job = queue.reserve()
+    assert job.attempts == 2
+    assert queue.fail(job, {"error": "boom again"})
+    record = queue.get(job_id)
+    assert record["status"] == "failed" and record["error"] == {"error": "boom again"}
+    clock.advance(6)
+    assert queue.reserve() is None
+
+
+def test_expired_lease_is_handed_out_again(make_queue, clock):
+    queue = make_queue(visibility_timeout=10, max_attempts=3)
+    job_id = queue.enqueue(b"card", {})
+    stale = queue.reserve()
+    clock.advance(5)
+    assert queue.reserve() is None
+
+    clock.advance(6)
+    job = queue.reserve()
+    assert job.id == job_id and job.attempts == 2 and job.lease != stale.lease
+    # The first worker can no longer finish the job
+    assert not queue.complete(stale, {"surname": "LATE"})
+    assert not queue.fail(stale, {"error": "late"})
+    assert queue.complete(job, {"surname": "ON TIME"})
+    assert queue.get(job_id)["result"] == {"surname": "ON TIME"}
+
+
+def test_expired_lease_on_the_last_attempt_fails(make_queue, clock):
+    queue = make_queue(visibility_timeout=10, max_attempts=1)
+    job_id = queue.enqueue(b"card", {})
+    queue.reserve()
+    clock.advance(11)
+    assert queue.reserve() is None
+    record = queue.get(job_id)
+    assert record["status"] == "failed" and record["error"] == {"error": TIMED_OUT}
+
+
+def test_release_keeps_the_attempt(make_queue, clock):
+    queue = make_queue(max_attempts=1)
+    job_id = queue.enqueue(b"card", {})
+    assert queue.release(queue.reserve(), delay=3)
+    assert queue.reserve() is None
+    clock.advance(4)
+    job = queue.reserve()
+    assert job.id == job_id and job.attempts == 1
+
+
+def test_sqlite_results_expire_after_the_ttl(clock):
+    queue = SqliteJobQueue(result_ttl=60)
+    job_id = queue.enqueue(b"card", {})
+    queue.complete(queue.reserve(), {"surname": "MUSTERMANN"})
+    clock.advance(30)
+    assert queue.get(job_id)["status"] == "done"
+
+    clock.advance(31)
+    assert queue.get(job_id) is None
+    # Expired jobs are deleted on the next reserve
+    queue.reserve()
+    assert queue.stats()["done"] == 0
+
+
+def test_redis_results_expire_after_the_ttl(clock):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    queue = RedisJobQueue(client, prefix=PREFIX, result_ttl=60)
+    job_id = queue.enqueue(b"card", {})
+    key = f"{PREFIX}:job:{job_id}"
+    # Jobs do not expire while they wait or run
+    assert client.ttl(key) == -1
+    job = queue.reserve()
+    assert client.ttl(key) == -1
+
+    queue.complete(job, {"surname": "MUSTERMANN"})
+    assert 0 < client.ttl(key) <= 60
+    # The uploaded image is dropped with the lease
+    assert client.hget(key, "payload") is None
+    assert client.zcard(f"{PREFIX}:leases") == 0
+
+
+class UnreachableQueue(SqliteJobQueue):
+    """A queue whose first reserve and complete calls fail as if the server were down."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.outages = {"reserve": 1, "complete": 1}
+
+    def _outage(self, method):
+        if self.outages[method]:
+            self.outages[method] -= 1
+            raise ConnectionError(f"{method}: connection refused")
+
+    def reserve(self):
+        self._outage("reserve")
+        return super().reserve()
+
+    def complete(self, job, result):
+        self._outage("complete")
+        return super().complete(job, result)
+
+
+def test_embedded_worker_backs_off_while_the_queue_is_unreachable(monkeypatch):
+    monkeypatch.setattr(api.config, "JOB_POLL_INTERVAL", 0.001)
+
+    async def process_contents(contents, name, images):
+        return {"text": contents.decode()}
+
+    monkeypatch.setattr(api, "process_contents", process_contents)
+    queue = UnreachableQueue(visibility_timeout=0.05)
+    job_id = queue.enqueue(b"card", {})
+    app = SimpleNamespace(state=SimpleNamespace(job_queue=queue, ready=True))
+
+    async def run():
+        worker = asyncio.create_task(api.run_embedded_worker(app))
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if queue.get(job_id)["status"] == "done":
+                break
+        assert not worker.done(), "the worker stopped"
+        worker.cancel()
+
+    asyncio.run(run())
+    record = queue.get(job_id)
+    # The result of the first attempt was lost, so the job was handed out again once its lease ran out
+    assert record["status"] == "done" and record["attempts"] == 2
+    assert record["result"] == {"text": "card"}
+
+
+class ReleaseThreadQueue(SqliteJobQueue):
+    """Records the thread each release runs on."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release_threads = []
+
+    def release(self, job, delay=0):
+        self.release_threads.append(threading.get_ident())
+        return super().release(job, delay)
+
+
+def test_cancelled_embedded_worker_releases_its_job_off_the_event_loop(monkeypatch):
+    started = asyncio.Event()
+
+    async def process_contents(contents, name, images):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(api, "process_contents", process_contents)
+    queue = ReleaseThreadQueue()
+    job_id = queue.enqueue(b"card", {})
+    app = SimpleNamespace(state=SimpleNamespace(job_queue=queue, ready=True))
+
+    async def run():
+        worker = asyncio.create_task(api.run_embedded_worker(app))
+        await asyncio.wait_for(started.wait(), 5)
+        worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await worker
+
+    asyncio.run(run())
+    assert queue.release_threads and threading.get_ident() not in queue.release_threads
+    # Released without using up an attempt
+    record = queue.get(job_id)
+    assert record["status"] == "queued" and record["attempts"] == 0
+
+
+def test_incomplete_backend_fails_on_creation():
+    class NoStats(JobQueue):
+        def enqueue(self, payload, options): ...
+        def reserve(self): ...
+        def complete(self, job, result): ...
+        def fail(self, job, error, retry=True): ...
+        def release(self, job, delay=0): ...
+        def get(self, job_id): ...
+        def pending(self): ...
+
+    with pytest.raises(TypeError, match="stats"):
+        NoStats()
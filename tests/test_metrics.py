@@ -0,0 +1,37 @@
+import re
+from fastapi.testclient import TestClient
+import api
+import metrics
+from cache import ResultCache
+from executor import BoundedExecutor
+from jobs import SqliteJobQueue
+
+
+def metric_types(text):
+    return dict(re.findall(r"^# TYPE (\S+) (\S+)$", text, re.MULTILINE))
+
+
+def test_render_types_gauges_and_counters():
+    text = metrics.render({"queue_depth": ("Waiting.", 3)}, {"rejected_total": ("Rejected.", 5)})
+    types = metric_types(text)
+    assert types["queue_depth"] == "gauge"
+    assert types["rejected_total"] == "counter"
+    assert "\nrejected_total 5\n" in text
+
+
+def test_every_counter_is_a_total():
+    executor = BoundedExecutor("thread", max_workers=1, max_queue=0)
+    api.app.state.executor = executor
+    api.app.state.result_cache = ResultCache()
+    api.app.state.job_queue = SqliteJobQueue()
+    api.app.state.ready = False
+    api.app.state.startup = {"import_seconds": 0.1}
+    try:
+        response = TestClient(api.app).get("/metrics")
+    finally:
+        executor.shutdown()
+    types = metric_types(response.text)
+    counters = [name for name, kind in types.items() if kind == "counter"]
+    assert {"ocr_executor_rejected_total", "ocr_result_cache_hits_total", "ocr_result_cache_misses_total"} <= set(counters)
+    assert all(name.endswith("_total") for name in counters)
+    assert not any(name.endswith("_total") for name, kind in types.items() if kind == "gauge")
@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+import pytest
+import engine_pool
+from engine_pool import OCREnginePool
+from ocr_reader import normalize_upright_card
+
+CARD_SIZE = (856, 540)  # ID-1 aspect ratio
+# Text lines as (x0, y0, x1, y1) fractions of the card, roughly where the EHIC values are printed
+TEXT_LINES = [(0.04, 0.56, 0.40, 0.62), (0.04, 0.67, 0.30, 0.73), (0.80, 0.67, 0.95, 0.73),
+              (0.04, 0.79, 0.45, 0.84), (0.70, 0.79, 0.95, 0.84), (0.04, 0.90, 0.50, 0.96)]
+
+
+class UnderlineClassifier:
+    """Reads a text line as upside down when its underline is at the top."""
+    cls_thresh = 0.9
+
+    def __call__(self, crops):
+        results = []
+        for crop in crops:
+            gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+            quarter = max(1, gray.shape[0] // 4)
+            upside_down = gray[:quarter].mean() < gray[-quarter:].mean()
+            results.append(('180' if upside_down else '0', 0.99))
+        return crops, results, 0
+
+
+class UnderlineEngine:
+    """Stand-in OCR engine for synthetic cards whose text lines are gray bars underlined in black."""
+    drop_score = 0.5
+
+    def __init__(self):
+        self.text_classifier = UnderlineClassifier()
+
+    def text_detector(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        mask = cv2.inRange(gray, 0, 160)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w > 3 * h and h < 0.15 * gray.shape[0]:
+                boxes.append([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+        return np.float32(boxes), 0
+
+
+def draw_card():
+    """A white card with a dark stripe at the top and underlined text lines, on a dark background."""
+    w, h = CARD_SIZE
+    card = np.full((h, w, 3), 250, np.uint8)
+    card[int(0.09 * h):int(0.32 * h), int(0.03 * w):int(0.97 * w)] = 30
+    for x0, y0, x1, y1 in TEXT_LINES:
+        card[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)] = 150
+        card[int((y1 - 0.012) * h):int(y1 * h), int(x0 * w):int(x1 * w)] = 0
+    photo = np.full((h + 160, w + 160, 3), 60, np.uint8)
+    photo[80:80 + h, 80:80 + w] = card
+    return photo
+
+
+@pytest.fixture(autouse=True)
+def fake_engine(monkeypatch):
+    monkeypatch.setattr(engine_pool, "_pool", OCREnginePool(size=1, factory=UnderlineEngine, warmup=False))
+
+
+def assert_upright(card):
+    h = card.shape[0]
+    stripe = card[int(0.12 * h):int(0.28 * h)].mean()
+    bottom = card[int(0.72 * h):int(0.88 * h)].mean()
+    assert stripe < bottom, "the dark stripe should be at the top of the card"
+
+
+@pytest.mark.parametrize("rotation", [None, cv2.ROTATE_180, cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE])
+def test_warped_card_is_turned_upright(rotation):
+    photo = draw_card()
+    if rotation is not None:
+        photo = cv2.rotate(photo, rotation)
+    card, matrix, found = normalize_upright_card(photo)
+    assert found
+    assert card.shape[1] > card.shape[0]
+    assert_upright(card)
+
+
+def test_matrix_follows_the_turn():
+    photo = cv2.rotate(draw_card(), cv2.ROTATE_180)
+    card, matrix, found = normalize_upright_card(photo)
+    h, w = card.shape[:2]
+    # The top left corner of the upright card is the bottom right corner of the card in the photo
+    corner = np.linalg.inv(matrix) @ np.float32([0, 0, 1])
+    x, y = corner[:2] / corner[2]
+    assert abs(x - (photo.shape[1] - 81)) < 5
+    assert abs(y - (photo.shape[0] - 81)) < 5
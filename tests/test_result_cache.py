@@ -0,0 +1,73 @@
+import asyncio
+import numpy as np
+import pytest
+import api
+from cache import ImageStore, ResultCache, content_hash
+from executor import BoundedExecutor
+from utils import encode_image_to_jpeg
+
+CARD_RESULT = {
+    "card_info": {"surname": "MUSTER"},
+    "field_confidence": {"surname": 0.99},
+    "confidence_scores": {"MUSTER": "99.00%"},
+}
+LINES = [[[[10, 10], [90, 10], [90, 30], [10, 30]], ["MUSTER", 0.99]]]
+
+
+def test_get_returns_only_exact_uploads(tmp_path):
+    cache = ResultCache(max_entries=2, ttl=0, path=str(tmp_path / "cache.sqlite"))
+    cache.put("a", CARD_RESULT)
+    assert cache.get("a") == CARD_RESULT
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_disk_tier_survives_memory_eviction(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(max_entries=1, ttl=0, path=path)
+    cache.put("a", CARD_RESULT)
+    cache.put("b", CARD_RESULT)
+    assert cache.get("a") == CARD_RESULT
+    assert cache.stats()["disk_hits"] == 1
+
+
+@pytest.fixture
+def cached_upload():
+    """An upload whose result (with its OCR lines) is already in the cache of the app."""
+    contents = encode_image_to_jpeg(np.full((100, 200, 3), 255, np.uint8))
+    cache = ResultCache(ttl=0)
+    cache.put(content_hash(contents), {**CARD_RESULT, "lines": LINES})
+    executor = BoundedExecutor("thread", max_workers=1, max_queue=0)
+    api.app.state.result_cache = cache
+    api.app.state.executor = executor
+    api.app.state.image_store = ImageStore()
+    yield contents
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("images, kinds", [("all", {"original", "annotated"}), ("annotated", {"annotated"})])
+def test_cache_hit_returns_the_requested_images(cached_upload, images, kinds):
+    response = asyncio.run(api.process_contents(cached_upload, "card.jpg", images))
+    assert response["cached"] is True
+    assert response["card_info"] == CARD_RESULT["card_info"]
+    assert set(response["images"]) == kinds
+    assert "lines" not in response
+
+
+def test_cache_hit_without_images(cached_upload):
+    response = asyncio.run(api.process_contents(cached_upload, "card.jpg", "none"))
+    assert response["cached"] is True
+    assert response["images"] is None
+
+
+def test_cache_hit_serves_image_urls(cached_upload):
+    response = asyncio.run(api.process_contents(cached_upload, "card.jpg", "all", inline=False))
+    assert set(response["images"]) == {"original", "annotated"}
+    assert all(url.startswith("/images/") for url in response["images"].values())
+
+
+def test_cached_lines_are_not_exposed(cached_upload):
+    asyncio.run(api.process_contents(cached_upload, "card.jpg", "none"))
+    cached = api.app.state.result_cache.get(content_hash(cached_upload))
+    assert cached["lines"] == LINES
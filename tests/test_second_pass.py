@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import ocr_reader
+from ocr_lines import OcrLines
+from ocr_reader import HealthCardInfo, _parse_region, missing_fields, read_missing_fields
+from utils import FIELD_REGIONS
+
+CARD_WIDTH, CARD_HEIGHT = 1000, 630
+
+
+@pytest.mark.parametrize("text, lang, expected", [
+    ("MUSTERMANN", "de", {'surname': 'MUSTERMANN'}),
+    ("Mustermann", "de", {}),  # Names are printed in upper case
+    ("MU", "de", {}),
+    ("MUSTER-MANN", "de", {}),
+    ("CH", "de", {}),
+    ("EUROPÄISCHE KARTE", "de", {}),
+    ("CARTE", "fr", {}),
+    ("CARTE", "de", {'surname': 'CARTE'}),  # Excluded words depend on the card language
+])
+def test_names_get_the_one_pass_checks(text, lang, expected):
+    assert _parse_region('surname', text, lang) == expected
+
+
+def region_line(region, text, top_fraction, scale):
+    """A line at top_fraction of the height of a field region, in the coordinates of the upscaled region."""
+    x0, y0, x1, y1 = FIELD_REGIONS[region]
+    width, height = (x1 - x0) * CARD_WIDTH * scale, (y1 - y0) * CARD_HEIGHT * scale
+    top, bottom = top_fraction * height, (top_fraction + 0.3) * height
+    return [[0, top], [width / 2, top], [width / 2, bottom], [0, bottom]], text
+
+
+def read_region(monkeypatch, region, texts_at, first_pass=None):
+    """
+    Run the second pass for a required field with run_ocr reading texts_at, a list of (text, top_fraction).
+    first_pass maps fields the first pass read to their (value, confidence).
+    """
+    scale = ocr_reader.config.CARD_SECOND_PASS_SCALE
+    lines = [region_line(region, text, top, scale) for text, top in texts_at]
+    monkeypatch.setattr(ocr_reader.config, "CARD_REQUIRED_FIELDS", [region])
+    monkeypatch.setattr(ocr_reader, "run_ocr", lambda image, cls=True: OcrLines(
+        [box for box, _ in lines], [text for _, text in lines], [0.95] * len(lines)))
+    card_info = HealthCardInfo(OcrLines.empty())
+    card_info.detected_language = 'de'
+    for field, (value, confidence) in (first_pass or {}).items():
+        card_info.set(field, value, confidence, ())
+    read_missing_fields(np.zeros((CARD_HEIGHT, CARD_WIDTH, 3), np.uint8), np.eye(3, dtype=np.float32), card_info)
+    return card_info
+
+
+def read_surname(monkeypatch, texts_at):
+    return read_region(monkeypatch, 'surname', texts_at)
+
+
+def test_second_pass_reads_the_value_below_the_label(monkeypatch):
+    card_info = read_surname(monkeypatch, [("3. Name", 0.05), ("MUSTERMANN", 0.6)])
+    assert card_info.surname == 'MUSTERMANN'
+    assert card_info.lines.texts[card_info.sources['surname'][0]] == 'MUSTERMANN'
+
+
+def test_second_pass_ignores_text_outside_the_value_box(monkeypatch):
+    # Upper-case text in the label part of the region, e.g. from the row above
+    card_info = read_surname(monkeypatch, [("EMERGENCY", 0.05)])
+    assert card_info.surname == ''
+
+
+def test_second_pass_rejects_excluded_words(monkeypatch):
+    card_info = read_surname(monkeypatch, [("KRANKENVERSICHERUNGSKARTE", 0.6)])
+    assert card_info.surname == ''
+
+
+def test_low_confidence_field_is_read_again(monkeypatch):
+    # Dates are kept from lines down to 0.4 confidence in the first pass
+    monkeypatch.setattr(ocr_reader.config, "CARD_SECOND_PASS_MIN_CONFIDENCE", 0.7)
+    card_info = read_region(monkeypatch, 'birth_date', [("08/10/1964", 0.6)],
+                            first_pass={'birth_date': ("08/10/1954", 0.45)})
+    assert card_info.birth_date == '08/10/1964'
+    assert card_info.confidence['birth_date'] == pytest.approx(0.95)
+    assert card_info.lines.texts[card_info.sources['birth_date'][0]] == '08/10/1964'
+
+
+def test_missing_fields_includes_low_confidence_fields(monkeypatch):
+    monkeypatch.setattr(ocr_reader.config, "CARD_REQUIRED_FIELDS", ['surname', 'birth_date', 'card_number'])
+    monkeypatch.setattr(ocr_reader.config, "CARD_SECOND_PASS_MIN_CONFIDENCE", 0.7)
+    card_info = HealthCardInfo(OcrLines.empty())
+    card_info.set('surname', 'MUSTERMANN', 0.9, ())
+    card_info.set('birth_date', '08/10/1964', 0.45, ())
+    assert missing_fields(card_info) == ['birth_date', 'card_number']
@@ -0,0 +1,81 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from utils import FIELD_REGIONS, crop_text_region, field_band, field_label_box, field_value_boxes, warp_card
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REAL_CARD = os.path.join(ROOT, "detected_images", "original_image.jpg")
+# Corners of the card in the photo, measured by hand; the card fills the frame, so its outline is not detected
+REAL_CARD_CORNERS = np.float32([[4.5, 11], [1181.5, 11], [1181.5, 753], [4.5, 753]])
+REAL_CARD_VALUES = {
+    'surname': 'MUSTERMANN',
+    'first_name': 'HANS',
+    'birth_date': '08/10/1964',
+    'personal_number': '756.1234.1234.56',
+    'insurance_code': '0509',
+    'card_number': '80756005090012312345',
+    'expiry_date': '31/03/2025',
+}
+RIGHT_ALIGNED = ('birth_date', 'insurance_code', 'expiry_date')
+
+
+@pytest.fixture(scope="module")
+def real_card():
+    image = cv2.imread(REAL_CARD)
+    card, matrix = warp_card(image, REAL_CARD_CORNERS)
+    return image, card, matrix
+
+
+def ink_extent(crop):
+    """Rows and columns of a crop holding dark text pixels."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    ink = gray < 100
+    return np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+
+
+@pytest.mark.parametrize("field", list(FIELD_REGIONS))
+def test_value_box_holds_the_whole_value(real_card, field):
+    _, card, _ = real_card
+    crop = crop_text_region(card, np.float32(field_value_boxes(card)[field]))
+    rows, columns = ink_extent(crop)
+    assert len(rows), f"no text in the {field} box"
+    # The text is not cut off by the box
+    assert rows[0] > 0 and rows[-1] < crop.shape[0] - 1
+    if field in RIGHT_ALIGNED:
+        assert columns[0] > 0
+    else:
+        assert columns[-1] < crop.shape[1] - 1
+
+
+def test_label_box_holds_the_birth_date_label(real_card):
+    _, card, _ = real_card
+    crop = crop_text_region(card, np.float32(field_label_box(card, 'birth_date')))
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    # The labels are printed in white on the blue card
+    assert (gray > 235).any(axis=1).sum() > crop.shape[0] // 3
+
+
+def test_field_band_keeps_every_field(real_card):
+    _, card, _ = real_card
+    band, (left, top) = field_band(card)
+    for field, box in field_value_boxes(card).items():
+        box = np.float32(box)
+        assert box[:, 0].min() >= left and box[:, 1].min() >= top, field
+        assert box[:, 0].max() <= left + band.shape[1] and box[:, 1].max() <= top + band.shape[0], field
+    # The card number row, at the bottom of the card, is inside the band
+    rows, _ = ink_extent(band[-int(0.1 * card.shape[0]):])
+    assert len(rows)
+
+
+def test_template_mode_reads_the_real_card(real_card):
+    pytest.importorskip("paddleocr")
+    from ocr_reader import process_card_template
+
+    image, card, matrix = real_card
+    result = process_card_template(image, (card, matrix, True))
+    assert result is not None, "template read not confident enough"
+    _, card_info = result
+    for field, value in REAL_CARD_VALUES.items():
+        assert getattr(card_info, field) == value, field
+    assert card_info.detected_language == 'de'
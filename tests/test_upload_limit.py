@@ -0,0 +1,50 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from api import UploadLimitMiddleware
+
+LIMIT = 100
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"received": len(await request.body())}
+
+    @app.post("/unlimited")
+    async def unlimited(request: Request):
+        return {"received": len(await request.body())}
+
+    app.add_middleware(UploadLimitMiddleware, limits={"/upload": LIMIT})
+    return TestClient(app)
+
+
+def chunks(total, size=10):
+    for _ in range(total // size):
+        yield b"x" * size
+
+
+def test_upload_within_limit_passes(client):
+    response = client.post("/upload", content=b"x" * LIMIT)
+    assert response.status_code == 200
+    assert response.json() == {"received": LIMIT}
+
+
+def test_declared_length_over_limit_is_rejected(client):
+    response = client.post("/upload", content=b"x" * (LIMIT + 1))
+    assert response.status_code == 413
+    assert str(LIMIT) in response.json()["error"]
+
+
+def test_streamed_body_over_limit_is_rejected(client):
+    # A chunked upload has no Content-Length, so it is cut off while it streams in
+    response = client.post("/upload", content=chunks(LIMIT * 3))
+    assert response.status_code == 413
+
+
+def test_other_paths_are_not_limited(client):
+    response = client.post("/unlimited", content=b"x" * (LIMIT * 3))
+    assert response.status_code == 200
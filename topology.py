@@ -0,0 +1,129 @@
+import glob
+import multiprocessing
+import os
+import re
+import config
+from utils import logger
+
+# Native libraries size their thread pools from these when they are loaded
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS")
+
+# Threads per model call in this process, once configured for a worker
+_intra_op_threads = None
+
+
+def available_cpus():
+    """The CPUs this process may run on, in order."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(text):
+    """Parse a Linux CPU list such as "0-15,32-47"."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_nodes():
+    """Group the available CPUs by NUMA node. Without NUMA information they form a single node."""
+    allowed = available_cpus()
+    nodes = []
+    paths = glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")
+    for path in sorted(paths, key=lambda path: int(re.search(r"node(\d+)", path).group(1))):
+        try:
+            with open(path) as f:
+                node = set(parse_cpu_list(f.read()))
+        except (OSError, ValueError):
+            continue
+        cpus = [cpu for cpu in allowed if cpu in node]
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [allowed]
+
+
+def resolve_topology(workers=None, threads=None):
+    """
+    Resolve the number of workers and the threads each may use so that together they fill the
+    available CPUs. An unset value (None or 0) is derived from the other; with neither set, every
+    CPU gets a single-threaded worker.
+    Args:
+        workers: worker processes or threads running cards at once
+        threads: threads per worker (default: OCR_INTRA_OP_THREADS)
+    Returns:
+        (workers, threads)
+    """
+    cpus = len(available_cpus())
+    threads = config.OCR_INTRA_OP_THREADS if threads is None else threads
+    if not workers:
+        workers = max(1, cpus // (threads or 1))
+    if not threads:
+        threads = max(1, cpus // workers)
+    return workers, threads
+
+
+def worker_cpus(index, threads):
+    """
+    The CPUs worker number index is pinned to: a block of threads CPUs within one NUMA node.
+    Workers are spread round-robin over the nodes, so memory stays local to each worker.
+    """
+    nodes = numa_nodes()
+    node = nodes[index % len(nodes)]
+    start = (index // len(nodes)) * threads
+    return sorted({node[(start + i) % len(node)] for i in range(min(threads, len(node)))})
+
+
+def limit_threads(threads):
+    """Cap the thread pools of the model calls, OpenCV, OpenMP and BLAS in this process at threads."""
+    global _intra_op_threads
+    import cv2
+    _intra_op_threads = threads
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    cv2.setNumThreads(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    # Libraries already loaded (numpy's BLAS) no longer read the variables
+    threadpool_limits(threads)
+
+
+def intra_op_threads():
+    """Threads a model call may use in this process (0 = backend default)."""
+    return _intra_op_threads if _intra_op_threads is not None else config.OCR_INTRA_OP_THREADS
+
+
+def configure_worker(index, threads, pin=None):
+    """
+    Apply the thread limits to a worker process and, with OCR_CPU_AFFINITY, pin it to its CPUs.
+    Call it before the first engine is created: paddle reads the thread variables when it is imported.
+    """
+    limit_threads(threads)
+    pin = config.OCR_CPU_AFFINITY if pin is None else pin
+    if not pin:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU affinity is not supported on this platform, workers are not pinned")
+        return
+    cpus = worker_cpus(index, threads)
+    os.sched_setaffinity(0, cpus)
+    logger.info(f"Worker {index} ({os.getpid()}) pinned to CPUs {cpus}")
+
+
+def worker_counter():
+    """A counter shared with worker processes, from which each takes its index."""
+    return multiprocessing.Value("i", 0)
+
+
+def next_worker_index(counter):
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    return index
@@ -1,9 +1,8 @@
-import cv2
 import numpy as np
 import base64
 import logging
-from PIL import Image, ImageDraw, ImageFont
 import os
+from functools import lru_cache
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -62,79 +61,341 @@ EXCLUDED_WORDS = {
 
 COUNTRY_CODES = ['CH']
 
+# ID-1 card format (85.60 x 53.98 mm)
+CARD_ASPECT_RATIO = 85.60 / 53.98
+
+# Positions of the numbered EHIC fields on a normalized card, as (x_min, y_min, x_max, y_max)
+# fractions of the card width and height, measured on detected_images/original_image.jpg.
+# Each region covers the field label and the white box its value is printed in, below the label.
+# Fields 5, 7 and 9 are printed right-aligned, on the same rows as fields 4, 6 and 8.
+FIELD_REGIONS = {
+    'surname': (0.03, 0.515, 0.97, 0.627),
+    'first_name': (0.03, 0.632, 0.72, 0.745),
+    'birth_date': (0.76, 0.632, 0.97, 0.745),
+    'personal_number': (0.03, 0.746, 0.45, 0.859),
+    'insurance_code': (0.45, 0.746, 0.97, 0.859),
+    'card_number': (0.03, 0.862, 0.72, 0.975),
+    'expiry_date': (0.76, 0.862, 0.97, 0.975),
+}
+
 SUPPORTED_LANGUAGES = ['de', 'fr', 'it']
 
+# Scale factors the JPEG decoder can scale down by while decoding (DCT scaling), with their decode flag names
+REDUCED_DECODE_FLAGS = ((8, 'IMREAD_REDUCED_COLOR_8'), (4, 'IMREAD_REDUCED_COLOR_4'), (2, 'IMREAD_REDUCED_COLOR_2'))
+
+def image_dimensions(contents):
+    """Read (width, height) from the image header without decoding the pixels. Returns None if unknown."""
+    import io
+    from PIL import Image  # Only the header parser is used
+
+    try:
+        with Image.open(io.BytesIO(contents)) as image:
+            return image.size
+    except Exception:
+        return None
+
+def decode_image(contents, max_side=0):
+    """
+    Decode image bytes to a BGR image whose longer side is at most max_side (0 = full resolution).
+    Large JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale, so the full-size image is never
+    allocated; whatever excess is left is removed with a resize. Returns None if the bytes cannot be decoded.
+    """
+    import cv2
+    buffer = np.frombuffer(contents, np.uint8)
+    flag = cv2.IMREAD_COLOR
+    dimensions = image_dimensions(contents) if max_side else None
+    if dimensions is not None:
+        long_side = max(dimensions)
+        for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+            if long_side / factor >= max_side:
+                flag = getattr(cv2, reduced_flag)
+                break
+
+    image = cv2.imdecode(buffer, flag)
+    if image is not None and max_side and max(image.shape[:2]) > max_side:
+        scale = max_side / max(image.shape[:2])
+        # After DCT scaling less than 2x is left, where linear is nearly as good as area and much faster
+        interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+    return image
+
+def image_media_type(contents):
+    """Guess the media type of encoded image bytes from their signature."""
+    if contents.startswith(b'\x89PNG'):
+        return 'image/png'
+    if contents[:4] == b'RIFF' and contents[8:12] == b'WEBP':
+        return 'image/webp'
+    if contents[:2] in (b'II', b'MM'):
+        return 'image/tiff'
+    if contents.startswith(b'BM'):
+        return 'image/bmp'
+    return 'image/jpeg'
+
+def encode_image_to_jpeg(image):
+    """Encode an OpenCV image as JPEG bytes."""
+    import cv2
+    _, buffer = cv2.imencode('.jpg', image)
+    return buffer.tobytes()
+
 def encode_image_to_base64(image):
     """Convert an OpenCV image to base64 string."""
-    _, buffer = cv2.imencode('.jpg', image)
-    return base64.b64encode(buffer).decode('utf-8')
+    return base64.b64encode(encode_image_to_jpeg(image)).decode('utf-8')
     
+def order_quad_points(points):
+    """Order four corner points as top-left, top-right, bottom-right, bottom-left."""
+    points = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.float32([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)],
+    ])
+
+def find_card_quad(image, min_area_ratio=0.2):
+    """
+    Find the outline of the card in a photo.
+    Returns the four corners in image coordinates, or None if no card-sized quadrilateral is found.
+    """
+    import cv2
+    # Edge detection on a small copy is enough to find the card outline
+    scale = 500 / max(image.shape[:2])
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+    scale = min(scale, 1.0)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(gray, 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_ratio * gray.shape[0] * gray.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return order_quad_points(approx / scale)
+    return None
+
+def warp_card(image, quad, width=1000):
+    """
+    Perspective-warp the card to a canonical landscape image of the given width.
+    The card may come out upside down; which way up it is can only be told from its text.
+    Returns the warped card and the transform from image to card coordinates.
+    """
+    import cv2
+    quad = order_quad_points(quad)
+    top = np.linalg.norm(quad[1] - quad[0])
+    side = np.linalg.norm(quad[3] - quad[0])
+    if side > top:
+        # Card photographed in portrait orientation, rotate it to landscape (either way up)
+        quad = np.roll(quad, -1, axis=0)
+    height = int(round(width / CARD_ASPECT_RATIO))
+    target = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    matrix = cv2.getPerspectiveTransform(quad, target)
+    card = cv2.warpPerspective(image, matrix, (width, height), flags=cv2.INTER_AREA)
+    return card, matrix
+
+def deskew_image(image, max_angle=15):
+    """
+    Straighten a slightly rotated image using the orientation of its dark (text) pixels.
+    Returns the rotated image and the affine transform that was applied.
+    """
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(mask)
+    identity = np.float32([[1, 0, 0], [0, 1, 0]])
+    if coords is None:
+        return image, identity
+    angle = cv2.minAreaRect(coords)[-1]
+    # minAreaRect angle conventions differ between OpenCV versions, fold into [-45, 45)
+    angle = (angle + 45) % 90 - 45
+    if abs(angle) < 0.5 or abs(angle) > max_angle:
+        return image, identity
+    h, w = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    rotated = cv2.warpAffine(image, matrix, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return rotated, matrix.astype(np.float32)
+
+def normalize_card(image, width=1000):
+    """
+    Localize, deskew and resize the card to a canonical resolution before OCR.
+    Returns (card, matrix, found): the normalized image, the 3x3 transform from image
+    to card coordinates and whether the card outline was found. Without an outline the
+    whole photo is deskewed and scaled to the target width instead.
+    """
+    import cv2
+    quad = find_card_quad(image)
+    if quad is not None:
+        card, matrix = warp_card(image, quad, width)
+        return card, matrix, True
+
+    scale = width / image.shape[1]
+    resized = cv2.resize(image, None, fx=scale, fy=scale,
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    deskewed, rotation = deskew_image(resized)
+    matrix = np.vstack([rotation, [0, 0, 1]]) @ np.diag([scale, scale, 1.0])
+    return deskewed, matrix.astype(np.float32), False
+
+def field_band(card, regions=FIELD_REGIONS, margin=0.01):
+    """
+    Crop the card to the area covered by the field regions, plus a margin for a slightly misplaced warp.
+    Returns the crop and its (x, y) offset within the card.
+    """
+    h, w = card.shape[:2]
+    x_min = int(max(0.0, min(r[0] for r in regions.values()) - margin) * w)
+    y_min = int(max(0.0, min(r[1] for r in regions.values()) - margin) * h)
+    x_max = int(min(1.0, max(r[2] for r in regions.values()) + margin) * w)
+    y_max = int(min(1.0, max(r[3] for r in regions.values()) + margin) * h)
+    return card[y_min:y_max, x_min:x_max], (x_min, y_min)
+
+def field_value_boxes(card, regions=FIELD_REGIONS, value_fraction=0.6):
+    """
+    Return the box of each field's value line on a normalized card.
+    The printed value sits in the lower part of each region, below the field label.
+    """
+    h, w = card.shape[:2]
+    boxes = {}
+    for field, (x0, y0, x1, y1) in regions.items():
+        top = y1 - (y1 - y0) * value_fraction
+        boxes[field] = [[x0 * w, top * h], [x1 * w, top * h], [x1 * w, y1 * h], [x0 * w, y1 * h]]
+    return boxes
+
+def field_label_box(card, field, regions=FIELD_REGIONS, value_fraction=0.6):
+    """Return the box of a field's label line on a normalized card."""
+    h, w = card.shape[:2]
+    x0, y0, x1, y1 = regions[field]
+    bottom = y1 - (y1 - y0) * value_fraction
+    return [[x0 * w, y0 * h], [x1 * w, y0 * h], [x1 * w, bottom * h], [x0 * w, bottom * h]]
+
+def restore_box_coordinates(lines, matrix, offset=(0, 0)):
+    """Map the boxes of OcrLines found on a normalized card back to coordinates in the original image."""
+    import cv2
+    if not lines:
+        return lines
+    inverse = np.linalg.inv(matrix)
+    boxes = lines.boxes + np.float32(offset)
+    restored = cv2.perspectiveTransform(boxes.reshape(-1, 1, 2), inverse)
+    return lines.with_boxes(restored)
+
 def enhance_image(image):
     """Enhance image for better OCR processing."""
+    import cv2
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     denoised = cv2.bilateralFilter(gray, 9, 75, 75)
     enhanced = cv2.convertScaleAbs(denoised, alpha=1.5, beta=10)
     return enhanced
 
-def create_annotated_image(image, results):
-    """Create annotated image with detected text regions."""
-    # Make a copy of the original image
-    annotated = image.copy()
-    
-    # Convert OpenCV image (BGR) to PIL Image (RGB)
-    image_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(image_rgb)
-    draw = ImageDraw.Draw(pil_image)
-    
+def enhance_region(image, scale=2.0):
+    """
+    Stronger enhancement for a second read of a field region: upscale, equalize the contrast
+    locally (CLAHE) and sharpen. Returns a grayscale image.
+    """
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if scale != 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    gray = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(gray)
+    blurred = cv2.GaussianBlur(gray, (0, 0), 2.0)
+    return cv2.addWeighted(gray, 1.6, blurred, -0.6, 0)
+
+def image_quality(image, width=500):
+    """
+    Cheap quality measures of a photo, computed on a small grayscale copy so they take about a millisecond.
+    Returns (sharpness, brightness): the variance of the Laplacian and the mean gray level (0-255).
+    """
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    scale = width / gray.shape[1]
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var()), float(gray.mean())
+
+def crop_text_region(image, box):
+    """Cut out a text box and warp it to an upright, axis-aligned crop."""
+    import cv2
+    points = np.asarray(box, dtype=np.float32)
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    width, height = max(width, 1), max(height, 1)
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    # Vertical crops are most likely rotated text lines
+    if height / width >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+@lru_cache(maxsize=4)
+def load_font(font_size=28):
+    """Load a bold font that supports umlauts. Cached, so the font file is only read once."""
+    from PIL import ImageFont  # Only needed when annotating, so kept out of the import path
+
     try:
-        # Try to find a system font that supports umlauts
-        font_size = 28 
         if os.path.exists('/System/Library/Fonts/Helvetica.ttc'):  # macOS
-            font = ImageFont.truetype('/System/Library/Fonts/Helvetica.ttc', font_size, index=1)  # index=1 for bold variant
-        elif os.path.exists('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'):  # Linux
-            font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', font_size)
-        else:  # Fallback to default
-            font = ImageFont.load_default()
+            return ImageFont.truetype('/System/Library/Fonts/Helvetica.ttc', font_size, index=1)  # index=1 for bold variant
+        if os.path.exists('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'):  # Linux
+            return ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', font_size)
     except Exception as e:
         logger.warning(f"Could not load font: {e}. Using default font.")
-        font = ImageFont.load_default()
-
-    for result in results:
-        points = np.array(result[0]).astype(np.int32)
-        text = result[1][0]
-        prob = result[1][1]
-        
-        if prob > 0.5:
-            # Draw bounding box on the OpenCV image with thicker line
-            cv2.polylines(annotated, [points], True, (0, 255, 0), 3)
-            
-            # Get coordinates for text
-            x, y = points[0]
-            
-            # Calculate text size for the frame
-            text_width, text_height = draw.textsize(text, font=font)
-            padding = 10  # Increased padding around text
-            
-            # Draw frame around text with thicker width
-            draw.rectangle([
-                (x, y-30 - padding),  # Adjusted y offset for better positioning
-                (x + text_width + padding * 2, y-30 + text_height + padding)
-            ], outline=(0, 255, 0), width=3)  # Increased outline width
-            
-            # Create stronger stroke effect for better readability
-            stroke_color = (0, 100, 0)  # Darker green for stroke
-            offsets = [
-                (-1, -1), (1, -1), (-1, 1), (1, 1),  # Diagonal offsets
-                (0, -1), (-1, 0), (1, 0), (0, 1),    # Cardinal offsets
-            ]
-            
-            # Draw stroke effect
-            for dx, dy in offsets:
-                draw.text((x + dx, y-30 + dy), text, fill=stroke_color, font=font)
-            
-            # Draw the main text
-            draw.text((x, y-30), text, fill=(0, 255, 0), font=font)
-    
-    # Convert back to OpenCV format (RGB to BGR)
-    final_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-    return final_image 
+    return ImageFont.load_default()
+
+def draw_label(image, text, x, y, font, fill=(0, 255, 0), stroke=(0, 100, 0), stroke_width=1):
+    """
+    Draw outlined text onto a BGR image in place.
+    Only a patch the size of the text is rendered with PIL and blended in,
+    so the full image is never converted or copied.
+    """
+    from PIL import Image, ImageDraw
+
+    left, top, right, bottom = font.getbbox(text, stroke_width=stroke_width)
+    width, height = right - left, bottom - top
+    patch = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    ImageDraw.Draw(patch).text(
+        (-left, -top), text, font=font,
+        fill=fill + (255,), stroke_width=stroke_width, stroke_fill=stroke + (255,)
+    )
+
+    # Clip the patch to the image bounds
+    x0, y0 = x + left, y + top
+    img_h, img_w = image.shape[:2]
+    px0, py0 = max(0, -x0), max(0, -y0)
+    px1, py1 = min(width, img_w - x0), min(height, img_h - y0)
+    if px0 >= px1 or py0 >= py1:
+        return
+    rgba = np.asarray(patch)[py0:py1, px0:px1]
+    alpha = rgba[:, :, 3:].astype(np.float32) / 255
+    roi = image[y0 + py0:y0 + py1, x0 + px0:x0 + px1]
+    bgr = rgba[:, :, 2::-1].astype(np.float32)
+    roi[:] = (bgr * alpha + roi * (1 - alpha)).astype(np.uint8)
+
+def create_annotated_image(image, lines, in_place=False):
+    """
+    Create annotated image with detected text regions.
+    Args:
+        image: BGR image
+        lines: OcrLines
+        in_place: draw directly on image instead of a copy
+    """
+    import cv2
+    annotated = image if in_place else image.copy()
+    font = load_font()
+    padding = 10
+
+    shown = lines[lines.scores > 0.5]
+    if not shown:
+        return annotated
+    points = shown.boxes.astype(np.int32)
+    # Draw all bounding boxes at once, with thicker lines
+    cv2.polylines(annotated, list(points), True, (0, 255, 0), 3)
+
+    for text, (x, y) in zip(shown.texts, points[:, 0].tolist()):
+        # Label sits above the box, inside a frame with some padding
+        y -= 30
+        _, _, text_width, text_height = font.getbbox(text)
+        cv2.rectangle(annotated, (x, y - padding), (x + text_width + padding * 2, y + text_height + padding), (0, 255, 0), 3)
+        draw_label(annotated, text, x, y, font)
+
+    return annotated
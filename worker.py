@@ -0,0 +1,77 @@
+"""
+Stateless OCR workers for the job queue. Each process loads one OCR engine, pulls jobs posted
+to POST /jobs from JOB_QUEUE_URL and stores the results for GET /jobs/{id}.
+
+    python worker.py [--processes 2]
+
+Run as many workers as needed on any host that reaches the queue; the API scales separately.
+SIGTERM and SIGINT let every process finish its current card before it exits.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+import config
+from engine_pool import init_engine_pool
+from jobs import create_job_queue, run_job
+from topology import configure_worker, resolve_topology
+from utils import logger
+
+
+def work(stop, index=0, threads=1):
+    """Pull and run jobs until stop is set."""
+    configure_worker(index, threads)
+    init_engine_pool(size=1)
+    queue = create_job_queue()
+    logger.info(f"Worker {os.getpid()} ready")
+    while not stop.is_set():
+        try:
+            job = queue.reserve()
+        except Exception as e:
+            logger.error(f"Cannot reach the job queue: {str(e)}")
+            stop.wait(config.JOB_POLL_INTERVAL * 10)
+            continue
+        if job is None:
+            stop.wait(config.JOB_POLL_INTERVAL)
+            continue
+        run_job(queue, job)
+    logger.info(f"Worker {os.getpid()} stopped")
+
+
+def worker_main(index=0, threads=1):
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    work(stop, index, threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes, one OCR engine each (0 = CPUs / OCR_INTRA_OP_THREADS)")
+    args = parser.parse_args()
+
+    if config.JOB_QUEUE_URL in ("", "sqlite://", "sqlite:///:memory:"):
+        parser.error("JOB_QUEUE_URL must point to a shared queue (sqlite:///path/jobs.db or redis://host:6379/0)")
+    # Create the schema once before the processes race for it
+    create_job_queue()
+
+    count, threads = resolve_topology(args.processes)
+    logger.info(f"Starting {count} worker(s) x {threads} thread(s)")
+    if count == 1:
+        worker_main(0, threads)
+        return
+    processes = [multiprocessing.Process(target=worker_main, args=(i, threads), name=f"ocr-worker-{i}")
+                 for i in range(count)]
+    for process in processes:
+        process.start()
+    # The children handle the signals themselves; the parent only waits for them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes if process.is_alive()])
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()